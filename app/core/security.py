@@ -1,2 +1,8 @@
+import hmac
+
+
 def verify_webhook_secret(secret: str, token: str) -> bool:
-    return secret == token
+    """Сравнение секрета вебхука за постоянное время"""
+    if not secret or not token:
+        return False
+    return hmac.compare_digest(secret.encode("utf-8"), token.encode("utf-8"))
@@ -1,16 +1,72 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 import os
 from dotenv import load_dotenv
 load_dotenv("/root/bizdnai/config/.env")
 
 DATABASE_URL = os.getenv("DATABASE_URL")   # используем полную строку
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+
+# Размеры пулов (на процесс): медленный запрос занимает одно соединение, а не весь воркер
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_ASYNC_POOL_SIZE = int(os.getenv("DB_ASYNC_POOL_SIZE", "10"))
+DB_ASYNC_MAX_OVERFLOW = int(os.getenv("DB_ASYNC_MAX_OVERFLOW", "20"))
+
+engine = create_engine(
+    DATABASE_URL,
+    pool_pre_ping=True,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def _async_database_url(url: str):
+    """Перевести синхронную строку подключения на async-драйвер (asyncpg / aiosqlite)"""
+    url = make_url(url)
+    connect_args = {}
+    if url.get_backend_name() == "postgresql":
+        # asyncpg не понимает sslmode из libpq-строки
+        sslmode = url.query.get("sslmode")
+        if sslmode:
+            url = url.difference_update_query(["sslmode"])
+            if sslmode != "disable":
+                connect_args["ssl"] = sslmode
+        url = url.set(drivername="postgresql+asyncpg")
+    elif url.get_backend_name() == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+    return url, connect_args
+
+
+_async_url, _async_connect_args = _async_database_url(DATABASE_URL)
+# aiosqlite (локальная разработка) работает без пула, размеры пула только для PostgreSQL
+_async_pool_args = {} if _async_url.get_backend_name() == "sqlite" else {
+    "pool_size": DB_ASYNC_POOL_SIZE,
+    "max_overflow": DB_ASYNC_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+}
+async_engine = create_async_engine(
+    _async_url,
+    connect_args=_async_connect_args,
+    pool_pre_ping=True,
+    pool_recycle=DB_POOL_RECYCLE,
+    **_async_pool_args,
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
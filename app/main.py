@@ -1,12 +1,34 @@
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Header, Query, BackgroundTasks, Request
 from fastapi.responses import JSONResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
+from typing import Optional, List
 from app.models.all_models import *
-from app.db.session import get_db
+from app.models import all_models as models
+from app.db.session import get_db, get_async_db, AsyncSessionLocal, async_engine
 from app.core.security import verify_webhook_secret
-import httpx, secrets, json, logging, os, tempfile, shutil
-from fastapi.encoders import jsonable_encoder
+from app.services.bot_registry import load_bot_routes, refresh_bot_route, get_bot_route, get_routes_stats
+from app.services.http_clients import open_http_clients, close_http_clients, get_http_client, get_pool_stats
+from app.services.update_queue import UpdateQueue, QueueFullError, get_chat_key
+from common.dedup import create_deduplicator, get_bot_id
+from app.schemas import CompanyOut, CompanyBotOut, CompanyPromptOut, UserPreferenceOut, to_schema, serializer, FastJSONResponse
+from app.services.stt import (
+    create_transcription_pool, TranscriptionBusyError, TranscriptionTimeoutError, STT_MAX_UPLOAD_BYTES
+)
+from starlette.datastructures import UploadFile as FormFile
+from starlette.formparsers import MultiPartParser, MultiPartException
+from app.services.bulk_import import IMPORT_TARGETS, detect_format, run_import
+from app.services.pagination import keyset_page, wants_ndjson, ndjson_response, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.services.retrieval import create_embedder, rebuild_company_index
+from app.services.invalidation_bus import (
+    get_invalidation_bus, COMPANY, COMPANY_BOT, PROMPTS, PRODUCTS, RETRIEVAL, USER_PREFERENCE
+)
+from app.services.webhook_setup import (
+    BotWebhookTarget, build_webhook_url, load_webhook_targets, set_webhook, register_webhooks
+)
+import httpx, secrets, json, logging, os
 from datetime import datetime
 
 # Настройка логирования
@@ -17,7 +39,45 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
+
+@app.on_event("startup")
+async def load_routing_table():
+    """Предзагрузка таблицы маршрутов ботов: вебхуки не ходят в БД"""
+    async with AsyncSessionLocal() as db:
+        await load_bot_routes(db)
+
+# Кэши конфигурации компаний в API и ботах сбрасываются по событиям из этого процесса
+invalidation_bus = get_invalidation_bus()
+
+@app.on_event("startup")
+async def start_invalidation_bus():
+    await invalidation_bus.start()
+
+@app.on_event("startup")
+async def start_http_clients():
+    await open_http_clients()
+
+@app.on_event("startup")
+async def start_update_queue():
+    await update_queue.start()
+
+# Порядок важен: сначала дообрабатываем очередь, потом закрываем HTTP пулы
+@app.on_event("shutdown")
+async def stop_update_queue():
+    await update_queue.stop(timeout=UPDATE_QUEUE_DRAIN_TIMEOUT)
+
+@app.on_event("shutdown")
+async def stop_http_clients():
+    await close_http_clients()
+
+@app.on_event("shutdown")
+async def stop_invalidation_bus():
+    await invalidation_bus.stop()
+
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    await async_engine.dispose()
 
 # Pydantic модели для API
 class CompanyBotCreate(BaseModel):
@@ -37,57 +97,85 @@ class CompanyCreate(BaseModel):
     name: str
     subdomain: str = None
 
+class WebhookBulkSetup(BaseModel):
+    company_ids: Optional[List[int]] = None
+    concurrency: int = 20
+    drop_pending_updates: bool = False
+
 # =============================================================================
 # TELEGRAM WEBHOOK ENDPOINT
 # =============================================================================
 
-async def process_telegram_update(update_data: dict, company_id: int, bot_token: str, db: Session):
+async def process_telegram_update(update_data: dict, company_id: int, bot_token: str):
     """Обрабатываем апдейт от Telegram в фоне"""
     try:
-        bot_url = f"http://localhost:8000/process-update"
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                bot_url,
-                json={
-                    "update": update_data,
-                    "company_id": company_id,
-                    "bot_token": bot_token
-                },
-                timeout=30.0
-            )
+        client = get_http_client("internal")
+        response = await client.post(
+            "/process-update",
+            json={
+                "update": update_data,
+                "company_id": company_id,
+                "bot_token": bot_token
+            }
+        )
         logger.info(f"Background processing result: {response.status_code}")
     except Exception as e:
         logger.error(f"Background processing failed: {e}")
 
+# Очередь апдейтов: апдейты одного чата по порядку, разные чаты параллельно
+UPDATE_QUEUE_WORKERS = int(os.getenv("UPDATE_QUEUE_WORKERS", "16"))
+UPDATE_QUEUE_MAX_SIZE = int(os.getenv("UPDATE_QUEUE_MAX_SIZE", "2000"))
+UPDATE_QUEUE_SHED_POLICY = os.getenv("UPDATE_QUEUE_SHED_POLICY", "reject")
+UPDATE_QUEUE_DRAIN_TIMEOUT = float(os.getenv("UPDATE_QUEUE_DRAIN_TIMEOUT", "30"))
+
+update_queue = UpdateQueue(
+    process_telegram_update,
+    workers=UPDATE_QUEUE_WORKERS,
+    max_size=UPDATE_QUEUE_MAX_SIZE,
+    shed_policy=UPDATE_QUEUE_SHED_POLICY
+)
+
+# Telegram повторяет доставку при медленном ответе — дубликаты отбрасываем до очереди
+update_dedup = create_deduplicator()
+
 @app.post("/webhook/telegram/{bot_token}")
 async def telegram_webhook(
     bot_token: str,
     update_data: dict,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    x_telegram_bot_api_secret_token: Optional[str] = Header(None)
 ):
     """Ендпоинт для вебхуков Telegram"""
     try:
-        # Ищем бота по токену
-        company_bot = db.query(models.CompanyBot).filter(
-            models.CompanyBot.telegram_bot_token == bot_token,
-            models.CompanyBot.is_active == True
-        ).first()
+        # Ищем бота в таблице маршрутов (без запроса в БД)
+        route = get_bot_route(bot_token)
         
-        if not company_bot:
+        if not route:
             raise HTTPException(status_code=404, detail="Bot not found")
         
-        # Обрабатываем в фоне
-        background_tasks.add_task(
-            process_telegram_update, 
-            update_data, 
-            company_bot.company_id,
-            company_bot.telegram_bot_token,
-            db
-        )
+        # Проверяем секрет до любой работы с апдейтом
+        if route.webhook_secret and not verify_webhook_secret(x_telegram_bot_api_secret_token, route.webhook_secret):
+            raise HTTPException(status_code=403, detail="Invalid secret token")
+        
+        # Повторная доставка: подтверждаем (200), но не обрабатываем второй раз
+        if await update_dedup.is_duplicate(get_bot_id(bot_token), update_data.get("update_id")):
+            return {"status": "ok", "duplicate": True}
+        
+        # Ставим в очередь; при переполнении просим Telegram повторить позже
+        try:
+            update_queue.submit(get_chat_key(update_data), update_data, route.company_id, bot_token)
+        except QueueFullError:
+            await update_dedup.forget(get_bot_id(bot_token), update_data.get("update_id"))
+            logger.warning("⛔ Очередь апдейтов переполнена, отвечаем 429")
+            return JSONResponse(
+                status_code=429,
+                content={"status": "error", "message": "Too many pending updates"},
+                headers={"Retry-After": "1"}
+            )
         
-        return {"status": "ok", "company_id": company_bot.company_id}
+        return {"status": "ok", "company_id": route.company_id}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Webhook error: {str(e)}")
         return {"status": "error", "message": str(e)}
@@ -116,78 +204,106 @@ def create_company_bot(bot: CompanyBotCreate, db: Session = Depends(get_db)):
         db.add(db_bot)
         db.commit()
         db.refresh(db_bot)
+        refresh_bot_route(db_bot)
+        invalidation_bus.publish_sync(COMPANY_BOT, company_id=db_bot.company_id)
         
-        return {
+        return FastJSONResponse({
             "status": "success", 
-            "bot": jsonable_encoder(db_bot),
-            "webhook_url": "http://joel-incretionary-aileen.ngrok-free.dev/webhook/telegram",
+            "bot": to_schema(db_bot, CompanyBotOut),
+            "webhook_url": build_webhook_url(db_bot.telegram_bot_token),
             "secret_token": secret_token
-        }
+        })
     except Exception as e:
         db.rollback()
         return {"status": "error", "message": str(e)}
 
 @app.post("/api/company-bots/{company_id}/setup-webhook")
-async def setup_company_webhook(company_id: int, db: Session = Depends(get_db)):
+async def setup_company_webhook(company_id: int, db: AsyncSession = Depends(get_async_db)):
     """Установка вебхука для бота компании"""
     try:
-        company_bot = db.query(models.CompanyBot).filter(
+        result = await db.execute(select(models.CompanyBot).filter(
             models.CompanyBot.company_id == company_id,
             models.CompanyBot.is_active == True
-        ).first()
+        ).limit(1))
+        company_bot = result.scalars().first()
         
         if not company_bot:
             raise HTTPException(404, "Company bot not found")
         
-        webhook_url = "http://joel-incretionary-aileen.ngrok-free.dev/webhook/telegram"
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"https://api.telegram.org/bot{company_bot.telegram_bot_token}/setWebhook",
-                json={
-                    "url": webhook_url,
-                    "secret_token": company_bot.webhook_secret,
-                    "drop_pending_updates": True
-                }
-            )
-        
-        result = response.json()
-        return {"status": "success", "telegram_response": result}
+        target = BotWebhookTarget(
+            bot_id=company_bot.id,
+            company_id=company_bot.company_id,
+            token=company_bot.telegram_bot_token,
+            secret=company_bot.webhook_secret
+        )
+        webhook = await set_webhook(get_http_client("telegram"), target, drop_pending_updates=True)
+        return {"status": "success", "telegram_response": {"ok": webhook.ok, "description": webhook.description}}
         
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@app.post("/api/company-bots/setup-webhooks")
+async def setup_all_webhooks(params: WebhookBulkSetup, db: AsyncSession = Depends(get_async_db)):
+    """Массовая перерегистрация вебхуков активных ботов (все или выбранные компании)"""
+    try:
+        targets = await load_webhook_targets(db, params.company_ids)
+        report = await register_webhooks(
+            get_http_client("telegram"),
+            targets,
+            concurrency=params.concurrency,
+            drop_pending_updates=params.drop_pending_updates
+        )
+        return {"status": "success", "report": report}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
 # =============================================================================
 # УПРАВЛЕНИЕ ПРОМПТАМИ КОМПАНИЙ
 # =============================================================================
 
 @app.post("/api/company-prompts/", response_model=dict)
-def create_company_prompt(prompt: CompanyPromptCreate, db: Session = Depends(get_db)):
+def create_company_prompt(prompt: CompanyPromptCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     """Создание промпта для компании"""
     try:
         db_prompt = models.CompanyPrompt(**prompt.dict())
         db.add(db_prompt)
         db.commit()
         db.refresh(db_prompt)
-        return {"status": "success", "prompt": jsonable_encoder(db_prompt)}
+        invalidation_bus.publish_sync(PROMPTS, company_id=db_prompt.company_id)
+        if db_prompt.documents:
+            background_tasks.add_task(rebuild_and_publish, db_prompt.company_id)
+        return FastJSONResponse({"status": "success", "prompt": to_schema(db_prompt, CompanyPromptOut)})
     except Exception as e:
         db.rollback()
         return {"status": "error", "message": str(e)}
 
 @app.get("/api/company-prompts/company/{company_id}", response_model=dict)
-def get_company_prompts(company_id: int, db: Session = Depends(get_db)):
-    """Получение промптов компании"""
-    try:
-        prompts = db.query(models.CompanyPrompt).filter(
+def get_company_prompts(
+    company_id: int,
+    cursor: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    format: Optional[str] = None,
+    accept: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Получение промптов компании (постранично по курсору или потоком NDJSON)"""
+    def build_query(session: Session):
+        return session.query(models.CompanyPrompt).filter(
             models.CompanyPrompt.company_id == company_id,
             models.CompanyPrompt.is_active == True
-        ).all()
+        )
+
+    if wants_ndjson(format, accept):
+        return ndjson_response(build_query, models.CompanyPrompt.id, after=cursor, serialize=serializer(CompanyPromptOut))
+    try:
+        prompts, next_cursor = keyset_page(build_query(db), models.CompanyPrompt.id, cursor, limit)
         
-        return {
+        return FastJSONResponse({
             "status": "success",
             "count": len(prompts),
-            "prompts": jsonable_encoder(prompts)
-        }
+            "prompts": to_schema(prompts, List[CompanyPromptOut]),
+            "next_cursor": next_cursor
+        })
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
@@ -202,20 +318,33 @@ def create_company(company: CompanyCreate, db: Session = Depends(get_db)):
         db.add(db_company)
         db.commit()
         db.refresh(db_company)
-        return {"status": "success", "company": jsonable_encoder(db_company)}
+        invalidation_bus.publish_sync(COMPANY, company_id=db_company.id)
+        return FastJSONResponse({"status": "success", "company": to_schema(db_company, CompanyOut)})
     except Exception as e:
         db.rollback()
         return {"status": "error", "message": str(e)}
 
 @app.get("/companies/", response_model=dict)
-def get_companies(db: Session = Depends(get_db)):
+def get_companies(
+    cursor: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    format: Optional[str] = None,
+    accept: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    def build_query(session: Session):
+        return session.query(models.Company)
+
+    if wants_ndjson(format, accept):
+        return ndjson_response(build_query, models.Company.id, after=cursor, serialize=serializer(CompanyOut))
     try:
-        companies = db.query(models.Company).all()
-        return {
+        companies, next_cursor = keyset_page(build_query(db), models.Company.id, cursor, limit)
+        return FastJSONResponse({
             "status": "success",
             "count": len(companies),
-            "companies": jsonable_encoder(companies)
-        }
+            "companies": to_schema(companies, List[CompanyOut]),
+            "next_cursor": next_cursor
+        })
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
@@ -225,7 +354,7 @@ def get_company(company_id: int, db: Session = Depends(get_db)):
         company = db.query(models.Company).filter(models.Company.id == company_id).first()
         if not company:
             raise HTTPException(status_code=404, detail="Company not found")
-        return {"status": "success", "company": jsonable_encoder(company)}
+        return FastJSONResponse({"status": "success", "company": to_schema(company, CompanyOut)})
     except HTTPException:
         raise
     except Exception as e:
@@ -242,13 +371,15 @@ def create_user_preference(preference: UserPreferenceCreate, db: Session = Depen
             existing.language_code = preference.language_code
             existing.updated_at = datetime.utcnow()
             db.commit()
-            return {"status": "success", "message": "User preference updated", "user_preference": jsonable_encoder(existing)}
+            invalidation_bus.publish_sync(USER_PREFERENCE, user_id=existing.telegram_user_id)
+            return FastJSONResponse({"status": "success", "message": "User preference updated", "user_preference": to_schema(existing, UserPreferenceOut)})
         else:
             db_preference = models.UserPreference(**preference.dict())
             db.add(db_preference)
             db.commit()
             db.refresh(db_preference)
-            return {"status": "success", "message": "User preference created", "user_preference": jsonable_encoder(db_preference)}
+            invalidation_bus.publish_sync(USER_PREFERENCE, user_id=db_preference.telegram_user_id)
+            return FastJSONResponse({"status": "success", "message": "User preference created", "user_preference": to_schema(db_preference, UserPreferenceOut)})
     except Exception as e:
         db.rollback()
         return {"status": "error", "message": str(e)}
@@ -263,45 +394,146 @@ def get_user_preference(telegram_user_id: int, db: Session = Depends(get_db)):
         if not preference:
             return {"status": "error", "message": "User preference not found"}
         
-        return {"status": "success", "user_preference": jsonable_encoder(preference)}
+        return FastJSONResponse({"status": "success", "user_preference": to_schema(preference, UserPreferenceOut)})
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 # =============================================================================
-# STT ENDPOINT (ВРЕМЕННО ЗАГЛУШЕН)
+# МАССОВЫЙ ИМПОРТ (products / leads / employees)
 # =============================================================================
 
-@app.post("/api/stt/transcribe")
-async def stt_post(
-    audio_file: UploadFile = File(...),
-    language: str = Form("auto"),
+@app.post("/api/import/{company_id}/{kind}")
+def bulk_import(
+    company_id: int,
+    kind: str,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    format: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
 ):
-    """Преобразование речи в текст через OpenAI Whisper"""
-    print(f"🎤 STT received: language={language}")
-    
-    tmp_path = None
+    """Импорт CSV/NDJSON: построчная валидация и запись пачками (лиды — upsert)"""
+    if kind not in IMPORT_TARGETS:
+        raise HTTPException(status_code=404, detail=f"Unknown import type: {kind}")
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".ogg") as tmp:
-            shutil.copyfileobj(audio_file.file, tmp)
-            tmp_path = tmp.name
-        
-        # ВРЕМЕННАЯ ЗАГЛУШКА - whisper_processor не готов
-        # if audio_file.content_type != "audio/wav":
-        #     tmp_path = whisper_processor.convert_audio_format(tmp_path, "wav")
+        company = db.query(models.Company.id).filter(models.Company.id == company_id).first()
+        if not company:
+            raise HTTPException(status_code=404, detail="Company not found")
         
-        # result = whisper_processor.transcribe_audio(tmp_path, language if language != "auto" else None)
-        # os.unlink(tmp_path)
+        fmt = detect_format(file.filename, file.content_type, format)
+        report = run_import(db, kind, company_id, file.file, fmt)
+        if kind == "products" and (report.get("inserted") or report.get("updated")):
+            # Импорт товаров только добавляет строки — боты дочитывают их в индекс, не перестраивая его
+            invalidation_bus.publish_sync(PRODUCTS, company_id=company_id, appended=True)
+            background_tasks.add_task(rebuild_and_publish, company_id)
+        return {"status": "success", "report": report}
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        return {"status": "error", "message": str(e)}
+
+# =============================================================================
+# ИНДЕКС ЗНАНИЙ КОМПАНИИ (RAG)
+# =============================================================================
+
+retrieval_embedder = create_embedder()
+
+def rebuild_and_publish(company_id: int) -> None:
+    """Пересборка индекса в фоне; боты перечитывают его с диска сразу после сообщения шины"""
+    rebuild_company_index(company_id, retrieval_embedder)
+    invalidation_bus.publish_sync(RETRIEVAL, company_id=company_id)
+
+@app.post("/api/retrieval/{company_id}/rebuild")
+def rebuild_retrieval_index(company_id: int, background_tasks: BackgroundTasks):
+    """Инкрементальная пересборка индекса: пересчитываются только изменившиеся документы"""
+    background_tasks.add_task(rebuild_and_publish, company_id)
+    return {"status": "scheduled", "company_id": company_id}
+
+# =============================================================================
+# STT ENDPOINT
+# =============================================================================
+
+class STTMultiPartParser(MultiPartParser):
+    """Только для STT: загрузки до лимита Whisper держим в памяти (по умолчанию Starlette сбрасывает на диск после 1 МБ)"""
+    max_file_size = STT_MAX_UPLOAD_BYTES
+
+transcription_pool = create_transcription_pool()
+
+@app.post("/api/stt/transcribe")
+async def stt_post(request: Request):
+    """Преобразование речи в текст через OpenAI Whisper (multipart: audio_file, language)"""
+    # Парсер multipart сам заголовок не проверяет (без него — KeyError и 500)
+    content_type = request.headers.get("content-type")
+    if not content_type:
+        raise HTTPException(status_code=400, detail="Content-Type header is required")
+    if content_type.split(";", 1)[0].strip().lower() != "multipart/form-data":
+        raise HTTPException(status_code=415, detail="Expected multipart/form-data")
+    try:
+        form = await STTMultiPartParser(request.headers, request.stream(), max_files=1, max_fields=10).parse()
+    except MultiPartException as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    audio_file = form.get("audio_file")
+    language = form.get("language") or "auto"
+    if not isinstance(audio_file, FormFile):
+        await form.close()
+        raise HTTPException(status_code=422, detail="audio_file is required")
+    logger.info(f"🎤 STT received: language={language}")
+    
+    try:
+        audio = await audio_file.read(STT_MAX_UPLOAD_BYTES + 1)
+        if len(audio) > STT_MAX_UPLOAD_BYTES:
+            return JSONResponse(
+                status_code=413,
+                content={"success": False, "error": "Audio file is too large", "text": "", "language": "unknown"}
+            )
         
-        # ВРЕМЕННЫЙ РЕЗУЛЬТАТ
-        result = {"text": "", "language": "unknown"}
+        result = await transcription_pool.transcribe(
+            audio,
+            filename=audio_file.filename or "audio.ogg",
+            language=language if language != "auto" else None
+        )
         
-        return {"success": True, "text": result["text"], "language": result.get("language", "unknown")}
+        return {"success": True, "text": result.text, "language": result.language}
     
+    except TranscriptionBusyError as e:
+        logger.warning(f"⛔ STT busy: {e}")
+        return JSONResponse(
+            status_code=503,
+            content={"success": False, "error": str(e), "text": "", "language": "unknown"},
+            headers={"Retry-After": "5"}
+        )
+    except TranscriptionTimeoutError as e:
+        logger.error(f"⏱️ STT timeout: {e}")
+        return JSONResponse(status_code=504, content={"success": False, "error": str(e), "text": "", "language": "unknown"})
     except Exception as e:
-        print(f"❌ STT Error: {e}")
-        if tmp_path:
-            os.unlink(tmp_path)
+        logger.error(f"❌ STT Error: {e}")
         return {"success": False, "error": str(e), "text": "", "language": "unknown"}
+    finally:
+        await form.close()
+
+# =============================================================================
+# МОНИТОРИНГ
+# =============================================================================
+
+@app.get("/api/stats/http-pools")
+def http_pool_stats():
+    """Пулы HTTP соединений: открытые / простаивающие / занятые соединения и запросы в полёте"""
+    return {"status": "success", "pools": get_pool_stats()}
+
+@app.get("/api/stats/update-queue")
+def update_queue_stats():
+    """Глубина очереди апдейтов и время ожидания (для автоскейлинга реплик API)"""
+    return {"status": "success", "queue": update_queue.get_stats(), "dedup": update_dedup.get_stats()}
+
+@app.get("/api/stats/stt")
+def stt_stats():
+    """Загрузка пула распознавания речи"""
+    return {"status": "success", "stt": transcription_pool.get_stats()}
+
+@app.get("/api/stats/bot-routes")
+def bot_routes_stats():
+    """Таблица маршрутов вебхуков этого процесса: всего ботов и активных"""
+    return {"status": "success", "routes": get_routes_stats()}
 
 # =============================================================================
 # ЗАПУСК СЕРВЕРА (ТОЛЬКО ОДИН РАЗ)
@@ -0,0 +1,7 @@
+from .company import CompanyOut, CompanyBotOut
+from .company_prompt import CompanyPromptOut
+from .user_preference import UserPreferenceOut
+from .imports import ProductImport, LeadImport, EmployeeImport
+from .serialization import get_adapter, to_schema, serializer, FastJSONResponse
+
+__all__ = ['CompanyOut', 'CompanyBotOut', 'CompanyPromptOut', 'UserPreferenceOut', 'ProductImport', 'LeadImport', 'EmployeeImport', 'get_adapter', 'to_schema', 'serializer', 'FastJSONResponse']
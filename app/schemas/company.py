@@ -0,0 +1,26 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
+from pydantic import BaseModel, ConfigDict
+
+
+class CompanyOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str
+    subdomain: Optional[str] = None
+    settings: Optional[Dict[str, Any]] = None
+    tg_token: Optional[str] = None
+    default_language: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+
+class CompanyBotOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    company_id: int
+    telegram_bot_token: str
+    webhook_secret: Optional[str] = None
+    is_active: Optional[bool] = None
+    created_at: Optional[datetime] = None
@@ -0,0 +1,15 @@
+from datetime import datetime
+from typing import Any, Optional
+from pydantic import BaseModel, ConfigDict
+
+
+class CompanyPromptOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    company_id: int
+    prompt_type: Optional[str] = None
+    content: Optional[str] = None
+    documents: Optional[Any] = None
+    is_active: Optional[bool] = None
+    created_at: Optional[datetime] = None
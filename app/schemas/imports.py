@@ -0,0 +1,65 @@
+import json
+from typing import Any, Dict, Optional
+from pydantic import BaseModel, ConfigDict, field_validator
+
+
+def _parse_json(value: Any) -> Any:
+    # JSON-колонки в CSV приходят строкой, пустая ячейка — отсутствие значения
+    if value == "":
+        return None
+    return json.loads(value) if isinstance(value, str) else value
+
+
+class _ImportRow(BaseModel):
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=True)
+
+    @field_validator("*", mode="before")
+    @classmethod
+    def empty_to_none(cls, value: Any) -> Any:
+        return None if value == "" else value
+
+
+class ProductImport(_ImportRow):
+    name: str
+    category: Optional[str] = None
+    description: Optional[str] = None
+    attributes: Optional[Dict[str, Any]] = None
+    pricing: Optional[Dict[str, Any]] = None
+    inventory: Optional[int] = None
+
+    @field_validator("attributes", "pricing", mode="before")
+    @classmethod
+    def parse_json(cls, value: Any) -> Any:
+        return _parse_json(value)
+
+
+class LeadImport(_ImportRow):
+    telegram_user_id: int
+    contact_info: Dict[str, Any] = {}
+    status: str = "new"
+    source: Optional[str] = None
+
+    @field_validator("contact_info", mode="before")
+    @classmethod
+    def parse_json(cls, value: Any) -> Any:
+        return _parse_json(value) or {}
+
+    @field_validator("status", mode="before")
+    @classmethod
+    def default_status(cls, value: Any) -> Any:
+        return value or "new"
+
+
+class EmployeeImport(_ImportRow):
+    position: Optional[str] = None
+    department_id: Optional[int] = None
+    division_id: Optional[int] = None
+    access_level: Optional[int] = None
+    permissions: Optional[Dict[str, Any]] = None
+    personal_info: Optional[Dict[str, Any]] = None
+    employment_info: Optional[Dict[str, Any]] = None
+
+    @field_validator("permissions", "personal_info", "employment_info", mode="before")
+    @classmethod
+    def parse_json(cls, value: Any) -> Any:
+        return _parse_json(value)
@@ -0,0 +1,29 @@
+from functools import lru_cache
+from typing import Any, Callable, Type
+import pydantic_core
+from pydantic import TypeAdapter
+from fastapi.responses import JSONResponse
+
+
+@lru_cache(maxsize=None)
+def get_adapter(schema: Any) -> TypeAdapter:
+    """TypeAdapter строится (компилируется) один раз на тип"""
+    return TypeAdapter(schema)
+
+
+def to_schema(obj: Any, schema: Type) -> Any:
+    """ORM объект (или список объектов) -> модель ответа"""
+    return get_adapter(schema).validate_python(obj, from_attributes=True)
+
+
+def serializer(schema: Type) -> Callable[[Any], Any]:
+    """Функция-сериализатор для потоковой выгрузки: строка ORM -> модель ответа"""
+    adapter = get_adapter(schema)
+    return lambda obj: adapter.validate_python(obj, from_attributes=True)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON ответ через pydantic-core: модели и dict сериализуются без jsonable_encoder"""
+
+    def render(self, content: Any) -> bytes:
+        return pydantic_core.to_json(content)
@@ -0,0 +1,116 @@
+import os
+import re
+import asyncio
+import hashlib
+import logging
+import unicodedata
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from common.ttl_cache import TTLCache
+
+logger = logging.getLogger("answer_cache")
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "20000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Сколько просроченный ответ ещё годится на случай недоступности провайдера
+ANSWER_CACHE_STALE_TTL = float(os.getenv("ANSWER_CACHE_STALE_TTL", "86400"))
+
+_PUNCTUATION = re.compile(r"[^\w\s]+", re.UNICODE)
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """"Цена?", "цена" и "  ЦЕНА!!" — один и тот же вопрос"""
+    text = unicodedata.normalize("NFKC", text).lower().replace("ё", "е")
+    text = _PUNCTUATION.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+def prompt_version(system_prompt: str) -> str:
+    """Версия промпта: при его изменении старые ответы перестают совпадать по ключу"""
+    return hashlib.sha1(system_prompt.encode("utf-8")).hexdigest()[:12]
+
+
+class AnswerCache:
+    """
+    Кэш ответов LLM по ключу (компания, язык, версия промпта, нормализованный вопрос).
+
+    - TTL + LRU вытеснение
+    - одинаковые вопросы, заданные одновременно, ждут один запрос к LLM (single-flight)
+    - если провайдер не ответил, отдаётся просроченный ответ (не старше stale_ttl)
+    """
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        ttl: float = ANSWER_CACHE_TTL,
+        stale_ttl: float = ANSWER_CACHE_STALE_TTL,
+    ):
+        self._cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self.stale_ttl = stale_ttl
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+        self.stale_served = 0
+
+    @staticmethod
+    def make_key(company_id: int, lang: str, version: str, question: str) -> Tuple:
+        return company_id, lang, version, normalize_question(question)
+
+    async def get_or_compute(
+        self,
+        key: Tuple,
+        compute: Callable[[], Awaitable[Optional[str]]],
+    ) -> Tuple[Optional[str], str]:
+        """
+        Возвращает (ответ, источник), источник: hit | miss | coalesced | stale.
+        compute() вызывается только у первого из одновременных запросов.
+        """
+        answer = self._cache.get(key)
+        if answer is not None:
+            return answer, "hit"
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            answer, source = await asyncio.shield(inflight)
+            return answer, "coalesced" if source == "miss" else source
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        result: Tuple[Optional[str], str] = (None, "miss")
+        try:
+            try:
+                answer = await compute()
+            except Exception as e:
+                logger.error(f"❌ Ошибка получения ответа для кэша: {e}")
+                answer = None
+
+            if answer:
+                self._cache.set(key, answer)
+                result = (answer, "miss")
+            else:
+                stale = self._cache.get_entry(key)
+                if stale is not None and stale[1] <= self.stale_ttl:
+                    self.stale_served += 1
+                    logger.warning(f"♻️ Провайдер недоступен, отдаём устаревший ответ (возраст {stale[1]:.0f}s)")
+                    result = (stale[0], "stale")
+        finally:
+            self._inflight.pop(key, None)
+            future.set_result(result)
+        return result
+
+    def invalidate_company(self, company_id: Optional[int]) -> None:
+        """Сбросить ответы компании (например, после правки её промптов); None — всех компаний"""
+        if company_id is None:
+            self._cache.clear()
+            return
+        for key in [k for k in self._cache.keys() if k[0] == company_id]:
+            self._cache.pop(key)
+
+    def get_stats(self) -> dict:
+        stats = self._cache.get_stats()
+        stats.update({
+            "coalesced": self.coalesced,
+            "stale_served": self.stale_served,
+            "in_flight": len(self._inflight),
+        })
+        return stats
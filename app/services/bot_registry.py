@@ -0,0 +1,79 @@
+from dataclasses import dataclass
+from typing import Dict, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import AsyncSessionLocal
+from app.models.all_models import CompanyBot
+from app.services.invalidation_bus import get_invalidation_bus, COMPANY_BOT
+import logging
+
+logger = logging.getLogger("bot_registry")
+
+
+@dataclass(frozen=True)
+class BotRoute:
+    """Маршрут вебхука: токен бота -> компания"""
+    company_id: int
+    webhook_secret: Optional[str]
+    is_active: bool
+
+
+# Таблица маршрутизации: telegram_bot_token -> BotRoute
+_bot_routes: Dict[str, BotRoute] = {}
+_routes_loaded = False
+
+
+async def load_bot_routes(db: AsyncSession) -> int:
+    """Полная загрузка таблицы маршрутов из БД (при старте приложения)"""
+    global _bot_routes, _routes_loaded
+    result = await db.execute(select(
+        CompanyBot.telegram_bot_token,
+        CompanyBot.company_id,
+        CompanyBot.webhook_secret,
+        CompanyBot.is_active,
+    ))
+    rows = result.all()
+    # Собираем новую таблицу и подменяем ссылку целиком — читатели не видят полузагруженного состояния
+    _bot_routes = {
+        token: BotRoute(company_id=company_id, webhook_secret=secret, is_active=bool(is_active))
+        for token, company_id, secret, is_active in rows
+    }
+    _routes_loaded = True
+    logger.info(f"🤖 Таблица маршрутов ботов загружена: {len(_bot_routes)} записей")
+    return len(_bot_routes)
+
+
+async def _on_company_bot_changed(payload) -> None:
+    """Бот изменён в другом процессе: таблица небольшая, перечитываем целиком"""
+    if not _routes_loaded:
+        return
+    async with AsyncSessionLocal() as db:
+        await load_bot_routes(db)
+
+
+get_invalidation_bus().subscribe(COMPANY_BOT, _on_company_bot_changed)
+
+
+def refresh_bot_route(company_bot: CompanyBot) -> None:
+    """Обновить маршрут одного бота после изменения в БД"""
+    _bot_routes[company_bot.telegram_bot_token] = BotRoute(
+        company_id=company_bot.company_id,
+        webhook_secret=company_bot.webhook_secret,
+        is_active=bool(company_bot.is_active),
+    )
+    logger.info(f"🔄 Маршрут бота обновлён: company_id={company_bot.company_id}")
+
+
+def get_bot_route(token: str) -> Optional[BotRoute]:
+    """Найти активный маршрут по токену без обращения к БД"""
+    route = _bot_routes.get(token)
+    if route is None or not route.is_active:
+        return None
+    return route
+
+
+def get_routes_stats() -> dict:
+    return {
+        "total": len(_bot_routes),
+        "active": sum(1 for r in _bot_routes.values() if r.is_active),
+    }
@@ -0,0 +1,145 @@
+import io
+import os
+import csv
+import json
+import time
+import logging
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+from pydantic import ValidationError
+from sqlalchemy import insert, func, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app.models.all_models import Product, Lead, Employee
+from app.schemas.imports import ProductImport, LeadImport, EmployeeImport
+
+logger = logging.getLogger("bulk_import")
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "50"))
+
+# Что можно импортировать: тип -> (модель, схема строки)
+IMPORT_TARGETS = {
+    "products": (Product, ProductImport),
+    "leads": (Lead, LeadImport),
+    "employees": (Employee, EmployeeImport),
+}
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str], requested: Optional[str] = None) -> str:
+    """csv или ndjson: явный параметр, затем расширение файла, затем content-type"""
+    if requested:
+        return "ndjson" if requested in ("ndjson", "jsonl") else requested
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl")) or "ndjson" in (content_type or ""):
+        return "ndjson"
+    return "csv"
+
+
+def iter_records(fileobj: BinaryIO, fmt: str) -> Iterator[Tuple[int, Any]]:
+    """Построчное чтение загрузки: (номер строки, dict или текст ошибки разбора)"""
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        if fmt == "csv":
+            reader = csv.DictReader(text)
+            for row in reader:
+                yield reader.line_num, row
+        elif fmt == "ndjson":
+            for line_no, line in enumerate(text, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield line_no, f"Invalid JSON: {e}"
+                    continue
+                yield line_no, record if isinstance(record, dict) else "Expected a JSON object"
+        else:
+            raise ValueError(f"Unsupported format: {fmt}")
+    finally:
+        # Файл загрузки закрывает FastAPI, обёртку только отцепляем
+        text.detach()
+
+
+def _write_batch(db: Session, kind: str, rows: List[Dict[str, Any]]) -> Tuple[int, int]:
+    """Записать пачку одним многострочным INSERT. Возвращает (вставлено, обновлено)."""
+    model, _ = IMPORT_TARGETS[kind]
+    if kind == "leads":
+        # Один пользователь дважды в пачке ломает ON CONFLICT — оставляем последнюю запись
+        rows = list({row["telegram_user_id"]: row for row in rows}.values())
+        stmt = pg_insert(Lead).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            constraint="_company_user_uc",
+            set_={
+                "contact_info": stmt.excluded.contact_info,
+                "source": func.coalesce(stmt.excluded.source, Lead.source),
+            },
+        ).returning(literal_column("(xmax = 0)"))  # true — вставка, false — обновление
+        flags = db.execute(stmt).scalars().all()
+        inserted = sum(1 for flag in flags if flag)
+        return inserted, len(flags) - inserted
+
+    db.execute(insert(model), rows)
+    return len(rows), 0
+
+
+def run_import(
+    db: Session,
+    kind: str,
+    company_id: int,
+    fileobj: BinaryIO,
+    fmt: str,
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> dict:
+    """Потоковый импорт: разбор и валидация построчно, запись пачками по batch_size строк"""
+    _, schema = IMPORT_TARGETS[kind]
+    started = time.perf_counter()
+    report = {"kind": kind, "format": fmt, "received": 0, "inserted": 0, "updated": 0, "invalid": 0, "failed": 0, "errors": []}
+    batch: List[Dict[str, Any]] = []
+
+    def add_error(line: Optional[int], message: str) -> None:
+        if len(report["errors"]) < IMPORT_MAX_ERRORS:
+            report["errors"].append({"line": line, "error": message})
+
+    def flush() -> None:
+        if not batch:
+            return
+        try:
+            inserted, updated = _write_batch(db, kind, batch)
+            db.commit()
+            report["inserted"] += inserted
+            report["updated"] += updated
+        except Exception as e:
+            db.rollback()
+            report["failed"] += len(batch)
+            add_error(None, f"Batch of {len(batch)} rows failed: {e}")
+            logger.error(f"❌ Импорт {kind}: ошибка записи пачки ({len(batch)} строк): {e}")
+        batch.clear()
+
+    for line_no, record in iter_records(fileobj, fmt):
+        report["received"] += 1
+        if isinstance(record, str):
+            report["invalid"] += 1
+            add_error(line_no, record)
+            continue
+        try:
+            row = schema.model_validate(record).model_dump()
+        except ValidationError as e:
+            report["invalid"] += 1
+            add_error(line_no, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+            continue
+        row["company_id"] = company_id
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    elapsed = time.perf_counter() - started
+    report["elapsed_s"] = round(elapsed, 3)
+    report["rows_per_s"] = round(report["received"] / elapsed, 1) if elapsed > 0 else 0.0
+    logger.info(
+        f"📦 Импорт {kind} для компании {company_id}: получено={report['received']}, "
+        f"вставлено={report['inserted']}, обновлено={report['updated']}, "
+        f"ошибок={report['invalid'] + report['failed']}, {report['rows_per_s']} строк/с"
+    )
+    return report
@@ -0,0 +1,343 @@
+import os
+import re
+import time
+import asyncio
+import bisect
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from app.models.all_models import Product
+from app.services.invalidation_bus import get_invalidation_bus, PRODUCTS
+from common.ttl_cache import TTLCache
+
+logger = logging.getLogger("catalog_index")
+
+# Как часто индекс дочитывает новые товары компании из БД
+CATALOG_SYNC_INTERVAL = float(os.getenv("CATALOG_SYNC_INTERVAL", "60"))
+# Доля общих триграмм, при которой слово запроса считается опечаткой/префиксом слова каталога
+CATALOG_FUZZY_THRESHOLD = float(os.getenv("CATALOG_FUZZY_THRESHOLD", "0.5"))
+CATALOG_FUZZY_MAX_TERMS = 20
+
+_WORDS = re.compile(r"\w+", re.UNICODE)
+_PRICE_KEYS = ("price", "base_price", "base", "retail", "amount", "cost")
+_MAX_PRICE = re.compile(r"(?:до|дешевле|не дороже|under|below|up to)\s*(\d[\d\s]*)", re.IGNORECASE)
+_MIN_PRICE = re.compile(r"(?:от|дороже|from|over|above)\s*(\d[\d\s]*)", re.IGNORECASE)
+_STOP_WORDS = {
+    "и", "в", "на", "с", "по", "для", "до", "от", "а", "или", "у", "вас", "есть", "какой", "какие", "сколько",
+    "стоит", "цена", "нужен", "нужна", "нужно", "хочу", "мне", "the", "a", "an", "for", "is", "do", "you", "have",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [w for w in _WORDS.findall(text.lower().replace("ё", "е")) if w not in _STOP_WORDS]
+
+
+def trigrams(word: str) -> Set[str]:
+    padded = f"#{word}#"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def extract_price(pricing: Any) -> Optional[float]:
+    """Цена из Product.pricing: известные ключи ("price", "base_price", ...) или первое число"""
+    if isinstance(pricing, (int, float)):
+        return float(pricing)
+    if not isinstance(pricing, dict):
+        return None
+    for key in _PRICE_KEYS:
+        value = pricing.get(key)
+        if isinstance(value, (int, float)):
+            return float(value)
+    for value in pricing.values():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+    return None
+
+
+def parse_price_filter(text: str) -> Tuple[Optional[float], Optional[float]]:
+    """"ноутбук до 300 000" -> (None, 300000.0)"""
+    def number(match):
+        return float(match.group(1).replace(" ", "")) if match else None
+    return number(_MIN_PRICE.search(text)), number(_MAX_PRICE.search(text))
+
+
+@dataclass
+class CatalogItem:
+    id: int
+    name: str
+    category: Optional[str]
+    price: Optional[float]
+    currency: Optional[str]
+    inventory: Optional[int]
+    tokens: Set[str]
+    name_tokens: Set[str]
+
+    def short_line(self) -> str:
+        parts = [self.name]
+        if self.category:
+            parts.append(self.category)
+        if self.price is not None:
+            parts.append(f"{self.price:g} {self.currency or ''}".strip())
+        if self.inventory is not None:
+            parts.append(f"в наличии: {self.inventory}")
+        return " — ".join(parts)
+
+
+class CatalogIndex:
+    """
+    Инвертированный индекс каталога одной компании.
+
+    - слово -> товары (название, категория, описание, значения attributes)
+    - триграмма -> слова каталога: опечатки и префиксы запроса ("ноут", "ноутбок") находят слово
+    - категория -> товары, отсортированный список цен для фильтра по диапазону
+    Обновляется по одному товару (upsert/remove) без перестройки.
+    """
+
+    def __init__(self, company_id: int):
+        self.company_id = company_id
+        self.items: Dict[int, CatalogItem] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self._name_postings: Dict[str, Set[int]] = {}
+        self._vocabulary: Dict[str, Set[str]] = {}   # триграмма -> слова
+        self._categories: Dict[str, Set[int]] = {}
+        self._prices: List[Tuple[float, int]] = []
+        self.max_id = 0
+        self.synced_at = 0.0
+        # Повторяющиеся запросы ("наушники", "доставка айфон") — из кэша до первого изменения каталога
+        self._results = TTLCache(max_entries=2048, ttl=CATALOG_SYNC_INTERVAL)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def upsert(self, product: Any) -> None:
+        """Добавить или обновить товар (ORM-объект или строка с теми же полями)"""
+        if product.id in self.items:
+            self.remove(product.id)
+        self._results.clear()
+
+        attributes = product.attributes if isinstance(product.attributes, dict) else {}
+        name_tokens = set(tokenize(product.name or ""))
+        text = " ".join(filter(None, [product.category, product.description, *map(str, attributes.values())]))
+        tokens = name_tokens | set(tokenize(text))
+        pricing = product.pricing if isinstance(product.pricing, dict) else {}
+        item = CatalogItem(
+            id=product.id,
+            name=product.name or "",
+            category=product.category,
+            price=extract_price(product.pricing),
+            currency=pricing.get("currency"),
+            inventory=product.inventory,
+            tokens=tokens,
+            name_tokens=name_tokens,
+        )
+        self.items[item.id] = item
+        self.max_id = max(self.max_id, item.id)
+
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = set()
+                for gram in trigrams(token):
+                    self._vocabulary.setdefault(gram, set()).add(token)
+            postings.add(item.id)
+        for token in name_tokens:
+            self._name_postings.setdefault(token, set()).add(item.id)
+        if item.category:
+            self._categories.setdefault(item.category.lower(), set()).add(item.id)
+        if item.price is not None:
+            bisect.insort(self._prices, (item.price, item.id))
+
+    def remove(self, product_id: int) -> None:
+        item = self.items.pop(product_id, None)
+        if item is None:
+            return
+        self._results.clear()
+        for token in item.tokens:
+            self._postings.get(token, set()).discard(product_id)
+        for token in item.name_tokens:
+            self._name_postings.get(token, set()).discard(product_id)
+        if item.category:
+            self._categories.get(item.category.lower(), set()).discard(product_id)
+        if item.price is not None:
+            position = bisect.bisect_left(self._prices, (item.price, product_id))
+            if position < len(self._prices) and self._prices[position] == (item.price, product_id):
+                del self._prices[position]
+
+    def _expand(self, token: str) -> Set[int]:
+        """Товары по слову запроса: точное совпадение, иначе близкие по триграммам слова каталога"""
+        postings = self._postings.get(token)
+        if postings or token.isdigit():
+            # Числа ("до 200000", артикулы) ищутся только точно: по триграммам они совпадают с чем угодно
+            return postings or set()
+        grams = trigrams(token)
+        counts: Dict[str, int] = {}
+        for gram in grams:
+            for word in self._vocabulary.get(gram, ()):
+                counts[word] = counts.get(word, 0) + 1
+        needed = CATALOG_FUZZY_THRESHOLD * len(grams)
+        similar = sorted((w for w, c in counts.items() if c >= needed), key=lambda w: -counts[w])[:CATALOG_FUZZY_MAX_TERMS]
+        result: Set[int] = set()
+        for word in similar:
+            result |= self._postings[word]
+        return result
+
+    def _price_range(self, min_price: Optional[float], max_price: Optional[float]) -> Iterable[int]:
+        lo = bisect.bisect_left(self._prices, (min_price, -1)) if min_price is not None else 0
+        hi = bisect.bisect_right(self._prices, (max_price, float("inf"))) if max_price is not None else len(self._prices)
+        return (product_id for _, product_id in self._prices[lo:hi])
+
+    def search(
+        self,
+        query: str = "",
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        in_stock: bool = False,
+        limit: int = 10,
+    ) -> List[CatalogItem]:
+        """
+        Товары, подходящие под все слова запроса; совпадения в названии — первыми.
+        Если все слова вместе ничего не дали — товары, где нашлось больше всего слов.
+        """
+        tokens = tokenize(query)
+        key = (tuple(tokens), category, min_price, max_price, in_stock, limit)
+        cached = self._results.get(key)
+        if cached is not None:
+            return cached
+        results = self._search(tokens, category, min_price, max_price, in_stock, limit)
+        self._results.set(key, results)
+        return results
+
+    def _search(self, tokens, category, min_price, max_price, in_stock, limit) -> List[CatalogItem]:
+        has_price_filter = min_price is not None or max_price is not None
+        # Слова, которых нет в каталоге (числа, "привет"), не обнуляют пересечение
+        postings = sorted(filter(None, (self._expand(token) for token in tokens)), key=len)
+        if tokens and not postings and not (category or has_price_filter):
+            return []
+
+        if postings:
+            candidates = postings[0].intersection(*postings[1:]) if len(postings) > 1 else postings[0]
+            if not candidates and len(postings) > 2:
+                counts: Dict[int, int] = {}
+                for matched in postings:
+                    for product_id in matched:
+                        counts[product_id] = counts.get(product_id, 0) + 1
+                candidates = {p for p, c in counts.items() if c > 1}
+            # Сначала товары, где все слова запроса есть в названии; обход останавливается на limit
+            name_sets = sorted((self._name_postings.get(token, set()) for token in tokens), key=len)
+            in_name = name_sets[0].intersection(candidates, *name_sets[1:]) if name_sets[0] else set()
+            tiers: List[Iterable[int]] = [in_name, (p for p in candidates if p not in in_name)]
+        elif category:
+            tiers = [self._categories.get(category.lower(), set())]
+        elif has_price_filter:
+            tiers = [self._price_range(min_price, max_price)]
+        else:
+            return []
+
+        category_ids = self._categories.get(category.lower(), set()) if category else None
+        results: List[CatalogItem] = []
+        for tier in tiers:
+            for product_id in tier:
+                item = self.items[product_id]
+                if category_ids is not None and product_id not in category_ids:
+                    continue
+                if has_price_filter and (
+                    item.price is None
+                    or (min_price is not None and item.price < min_price)
+                    or (max_price is not None and item.price > max_price)
+                ):
+                    continue
+                if in_stock and not item.inventory:
+                    continue
+                results.append(item)
+                if len(results) >= limit:
+                    return results
+        return results
+
+
+_catalogs: Dict[int, CatalogIndex] = {}
+
+
+def _load_products(db: Session, company_id: int, after_id: int = 0) -> Iterable[Any]:
+    return (
+        db.query(Product.id, Product.name, Product.category, Product.description,
+                 Product.attributes, Product.pricing, Product.inventory)
+        .filter(Product.company_id == company_id, Product.id > after_id)
+        .order_by(Product.id)
+        .yield_per(2000)
+    )
+
+
+def load_catalog(db: Session, company_id: int) -> CatalogIndex:
+    """
+    Полная загрузка каталога в новый индекс. Индекс публикуется только после загрузки,
+    поэтому её можно выполнять в отдельном потоке (asyncio.to_thread).
+    """
+    started = time.perf_counter()
+    catalog = CatalogIndex(company_id)
+    for row in _load_products(db, company_id):
+        catalog.upsert(row)
+    catalog.synced_at = time.monotonic()
+    _catalogs[company_id] = catalog
+    logger.info(f"🛒 Каталог company_id={company_id} загружен: {len(catalog)} товаров за {(time.perf_counter() - started) * 1000:.0f}ms")
+    return catalog
+
+
+def _load_catalog_in_session(company_id: int) -> CatalogIndex:
+    from app.db.session import SessionLocal
+    with SessionLocal() as db:
+        return load_catalog(db, company_id)
+
+
+def _fetch_new_products(company_id: int, after_id: int) -> List[Any]:
+    """Товары с id > after_id (выполняется в потоке, своя сессия)"""
+    from app.db.session import SessionLocal
+    with SessionLocal() as db:
+        return list(_load_products(db, company_id, after_id))
+
+
+async def _append_new_products(catalog: CatalogIndex) -> None:
+    # Из БД читаем в потоке, а индекс меняем в event loop: поиск идёт там же и не видит его наполовину
+    catalog.synced_at = time.monotonic()
+    rows = await asyncio.to_thread(_fetch_new_products, catalog.company_id, catalog.max_id)
+    for row in rows:
+        catalog.upsert(row)
+
+
+async def get_catalog(company_id: int) -> CatalogIndex:
+    """
+    Индекс каталога компании: при первом обращении загружается целиком (в потоке), затем раз
+    в CATALOG_SYNC_INTERVAL дочитываются только новые товары (id > последнего известного).
+    """
+    catalog = _catalogs.get(company_id)
+    if catalog is None:
+        return await asyncio.to_thread(_load_catalog_in_session, company_id)
+    if time.monotonic() - catalog.synced_at >= CATALOG_SYNC_INTERVAL:
+        await _append_new_products(catalog)
+    return catalog
+
+
+def invalidate_catalog(company_id: int) -> None:
+    """Полная перезагрузка при следующем обращении"""
+    _catalogs.pop(company_id, None)
+
+
+async def _on_products_changed(payload) -> None:
+    """
+    appended=True (импорт только добавляет товары) — дочитываем новые товары в загруженный индекс;
+    любое другое изменение каталога — полная перезагрузка при следующем обращении.
+    """
+    company_id = payload.get("company_id") if payload else None
+    if company_id is None:
+        _catalogs.clear()
+        return
+    catalog = _catalogs.get(company_id)
+    if catalog is None:
+        return
+    if payload.get("appended"):
+        await _append_new_products(catalog)
+    else:
+        invalidate_catalog(company_id)
+
+
+get_invalidation_bus().subscribe(PRODUCTS, _on_products_changed)
@@ -1,9 +1,14 @@
 from sqlalchemy.orm import Session
 from app.models.all_models import Company
+from common.ttl_cache import TTLCache
+from app.services.invalidation_bus import get_invalidation_bus, COMPANY, COMPANY_BOT
 import logging
 
 _company_cache = {}
 
+# Настройки компании (Company.settings) меняются редко — держим их недолго в памяти
+_company_settings_cache = TTLCache(max_entries=10_000, ttl=300)
+
 def get_company_id_cached(db: Session, token: str) -> int:
     if token in _company_cache:
         return _company_cache[token]
@@ -14,3 +19,26 @@ def get_company_id_cached(db: Session, token: str) -> int:
     _company_cache[token] = company_id
     logging.info(f"🏢 Company ID загружен в кэш: {company_id}")
     return company_id
+
+def get_company_settings_cached(db: Session, company_id: int) -> dict:
+    settings = _company_settings_cache.get(company_id)
+    if settings is not None:
+        return settings
+    row = db.query(Company.settings).filter(Company.id == company_id).first()
+    settings = (row.settings if row else None) or {}
+    _company_settings_cache.set(company_id, settings)
+    return settings
+
+def invalidate_company(payload) -> None:
+    """Сбросить кэши компании по сообщению шины (payload=None — все компании)"""
+    company_id = payload.get("company_id") if payload else None
+    if company_id is None:
+        _company_cache.clear()
+        _company_settings_cache.clear()
+        return
+    for token in [token for token, cached_id in _company_cache.items() if cached_id == company_id]:
+        del _company_cache[token]
+    _company_settings_cache.pop(company_id)
+
+get_invalidation_bus().subscribe(COMPANY, invalidate_company)
+get_invalidation_bus().subscribe(COMPANY_BOT, invalidate_company)
@@ -0,0 +1,187 @@
+import os
+import re
+import logging
+from functools import lru_cache
+from typing import List, Sequence, Tuple
+from sqlalchemy import insert, select, update
+from app.db.session import AsyncSessionLocal
+from app.models.all_models import DialogState
+from common.ttl_cache import TTLCache
+
+logger = logging.getLogger("conversation_memory")
+
+# Потолок всего промпта (system + сводка + история + вопрос) и отдельно хранимой истории
+MEMORY_PROMPT_MAX_TOKENS = int(os.getenv("MEMORY_PROMPT_MAX_TOKENS", "2000"))
+MEMORY_HISTORY_MAX_TOKENS = int(os.getenv("MEMORY_HISTORY_MAX_TOKENS", "1200"))
+MEMORY_SUMMARY_MAX_TOKENS = int(os.getenv("MEMORY_SUMMARY_MAX_TOKENS", "300"))
+# Сколько из потолка промпта могут занять знания компании и товары каталога
+MEMORY_CONTEXT_MAX_TOKENS = int(os.getenv("MEMORY_CONTEXT_MAX_TOKENS", "800"))
+MEMORY_ENCODING = os.getenv("MEMORY_ENCODING", "cl100k_base")
+MEMORY_CACHE_TTL = float(os.getenv("MEMORY_CACHE_TTL", "1800"))
+
+SUMMARY_HEADER = "Ранее в разговоре клиент спрашивал:"
+SUMMARY_LINE_CHARS = 200
+
+_memory_cache = TTLCache(max_entries=50_000, ttl=MEMORY_CACHE_TTL)   # (company_id, user_id) -> context
+
+# Вопрос опирается на предыдущие реплики: местоимения/отсылки ("а он?", "сколько это стоит?")
+# или слишком короткий, чтобы иметь смысл сам по себе
+CONTEXT_QUESTION_MIN_WORDS = 3
+_FOLLOW_UP_START = re.compile(r"^\W*(а|и|ну|and|but|so)\b", re.IGNORECASE | re.UNICODE)
+_CONTEXT_MARKERS = re.compile(
+    r"\b(он|она|оно|они|его|её|ее|их|ему|ей|им|это|этот|эта|эти|этого|того|тот|такой|такая|такие|"
+    r"там|туда|ещё|еще|тоже|также|предыдущ\w*|"
+    r"it|its|that|this|these|those|they|them|also|same|previous)\b",
+    re.IGNORECASE | re.UNICODE,
+)
+
+
+@lru_cache(maxsize=1)
+def get_encoder():
+    """Энкодер tiktoken загружается один раз на процесс; без него — грубая оценка по длине"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(MEMORY_ENCODING)
+    except Exception as e:
+        logger.warning(f"⚠️ tiktoken недоступен ({e}), токены оцениваются по длине текста")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoder = get_encoder()
+    if encoder is None:
+        return len(text) // 4 + 1
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def _empty_context() -> dict:
+    return {"summary": [], "summary_tokens": 0, "turns": []}
+
+
+def is_context_dependent(question: str) -> bool:
+    """Ответ на такой вопрос зависит от истории диалога и не годится для общего кэша ответов"""
+    words = question.split()
+    return (
+        len(words) < CONTEXT_QUESTION_MIN_WORDS
+        or bool(_FOLLOW_UP_START.search(question))
+        or bool(_CONTEXT_MARKERS.search(question))
+    )
+
+
+async def load_memory(company_id: int, user_id: int) -> dict:
+    """
+    Контекст диалога из DialogState.context:
+    {"summary": [строки], "summary_tokens": int, "turns": [{"role", "content", "tokens"}]}
+    """
+    key = (company_id, user_id)
+    context = _memory_cache.get(key)
+    if context is not None:
+        return context
+    async with AsyncSessionLocal() as db:
+        stored = (await db.execute(
+            select(DialogState.context).where(DialogState.company_id == company_id, DialogState.user_id == user_id)
+        )).scalar()
+    context = stored if isinstance(stored, dict) and "turns" in stored else _empty_context()
+    _memory_cache.set(key, context)
+    return context
+
+
+def _fit_context(sections: Sequence[Tuple[str, List[str]]], budget: int) -> Tuple[str, int]:
+    """
+    Блоки контекста ("заголовок", [строки по убыванию релевантности]) в пределах budget токенов.
+    Строка, которая не помещается, пропускается; блок без строк не выводится.
+    """
+    blocks, used = [], 0
+    for header, lines in sections:
+        header_tokens = count_tokens(header) + 2
+        kept = []
+        for line in lines:
+            line = f"- {line}"
+            tokens = count_tokens(line) + 1
+            if used + tokens + (0 if kept else header_tokens) > budget:
+                continue
+            used += tokens + (0 if kept else header_tokens)
+            kept.append(line)
+        if kept:
+            blocks.append("\n".join([header] + kept))
+    return "".join(f"\n\n{block}" for block in blocks), used
+
+
+def build_messages(system: str, memory: dict, question: str, context: Sequence[Tuple[str, List[str]]] = ()) -> Tuple[List[dict], bool]:
+    """
+    Сообщения для LLM в пределах MEMORY_PROMPT_MAX_TOKENS. Контекст (знания компании, товары)
+    дописывается в system и урезается до MEMORY_CONTEXT_MAX_TOKENS и остатка потолка; в то, что
+    останется, берутся самые свежие реплики. Возвращает (messages, есть ли история в промпте).
+    """
+    budget = max(0, MEMORY_PROMPT_MAX_TOKENS - count_tokens(system) - count_tokens(question))
+    extra, used = _fit_context(context, min(budget, MEMORY_CONTEXT_MAX_TOKENS))
+    budget -= used
+    messages = [{"role": "system", "content": system + extra}]
+
+    summary_tokens = memory["summary_tokens"] + count_tokens(SUMMARY_HEADER)
+    if memory["summary"] and summary_tokens <= budget:
+        messages.append({"role": "system", "content": "\n".join([SUMMARY_HEADER] + memory["summary"])})
+        budget -= summary_tokens
+
+    history = []
+    for turn in reversed(memory["turns"]):
+        if turn["tokens"] > budget:
+            break
+        history.append({"role": turn["role"], "content": turn["content"]})
+        budget -= turn["tokens"]
+    history.reverse()
+    # История не должна начинаться с ответа ассистента без вопроса
+    if history and history[0]["role"] == "assistant":
+        history.pop(0)
+
+    messages.extend(history)
+    messages.append({"role": "user", "content": question})
+    return messages, len(messages) > 2
+
+
+def _fold_into_summary(context: dict, turn: dict) -> None:
+    """Вытесненная реплика клиента сворачивается в строку сводки, ответы бота отбрасываются"""
+    if turn["role"] != "user":
+        return
+    line = "- " + " ".join(turn["content"].split())[:SUMMARY_LINE_CHARS]
+    context["summary"].append(line)
+    context["summary_tokens"] += count_tokens(line) + 1
+    while context["summary"] and context["summary_tokens"] > MEMORY_SUMMARY_MAX_TOKENS:
+        dropped = context["summary"].pop(0)
+        context["summary_tokens"] -= count_tokens(dropped) + 1
+
+
+async def remember_turn(company_id: int, user_id: int, question: str, answer: str) -> None:
+    """
+    Добавить вопрос и ответ в память. Токены считаются один раз для новой реплики;
+    при превышении MEMORY_HISTORY_MAX_TOKENS старые реплики уходят в сводку.
+    Запись в БД — через async-сессию, event loop не блокируется.
+    """
+    key = (company_id, user_id)
+    old = await load_memory(company_id, user_id)
+    context = {"summary": list(old["summary"]), "summary_tokens": old["summary_tokens"], "turns": list(old["turns"])}
+    context["turns"].append({"role": "user", "content": question, "tokens": count_tokens(question)})
+    context["turns"].append({"role": "assistant", "content": answer, "tokens": count_tokens(answer)})
+
+    history_tokens = sum(turn["tokens"] for turn in context["turns"])
+    while context["turns"] and history_tokens > MEMORY_HISTORY_MAX_TOKENS:
+        turn = context["turns"].pop(0)
+        history_tokens -= turn["tokens"]
+        _fold_into_summary(context, turn)
+
+    # Кэш обновляется сразу: следующий вопрос увидит эту реплику, даже пока идёт запись
+    _memory_cache.set(key, context)
+    try:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(DialogState)
+                .where(DialogState.company_id == company_id, DialogState.user_id == user_id)
+                .values(context=context)
+            )
+            if result.rowcount == 0:
+                await db.execute(insert(DialogState).values(company_id=company_id, user_id=user_id, context=context))
+            await db.commit()
+    except Exception as e:
+        logger.error(f"❌ Не удалось сохранить контекст диалога company_id={company_id}: {e}")
+        _memory_cache.pop(key)
+
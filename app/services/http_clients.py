@@ -0,0 +1,188 @@
+import os
+import logging
+import httpx
+from typing import Dict, Optional
+
+logger = logging.getLogger("http_clients")
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+# Общие таймауты (секунды), переопределяются через окружение
+HTTP_CONNECT_TIMEOUT = _env_float("HTTP_CONNECT_TIMEOUT", 5.0)
+HTTP_READ_TIMEOUT = _env_float("HTTP_READ_TIMEOUT", 30.0)
+HTTP_WRITE_TIMEOUT = _env_float("HTTP_WRITE_TIMEOUT", 30.0)
+HTTP_POOL_TIMEOUT = _env_float("HTTP_POOL_TIMEOUT", 5.0)
+HTTP_KEEPALIVE_EXPIRY = _env_float("HTTP_KEEPALIVE_EXPIRY", 30.0)
+
+# Один клиент = один хост, поэтому лимиты пула действуют на хост.
+# Лимиты клиента задаются через HTTP_<NAME>_MAX_CONNECTIONS / HTTP_<NAME>_MAX_KEEPALIVE
+CLIENT_CONFIG = {
+    "telegram": {
+        "base_url": "https://api.telegram.org",
+        "http2": True,
+        "max_connections": 100,
+        "max_keepalive": 20,
+    },
+    "openai": {
+        "base_url": "https://api.openai.com/v1",
+        "http2": True,
+        "max_connections": 50,
+        "max_keepalive": 20,
+    },
+    "internal": {
+        # HTTP/2 без TLS (h2c) httpx не согласует, поэтому здесь HTTP/1.1 keep-alive
+        "base_url": os.getenv("BOT_PROCESS_URL", "http://localhost:8000"),
+        "http2": False,
+        "max_connections": 50,
+        "max_keepalive": 20,
+    },
+}
+
+# Реестр клиентов на всё время жизни приложения: имя -> AsyncClient
+_clients: Dict[str, httpx.AsyncClient] = {}
+# Транспорты клиентов со счётчиками для get_pool_stats: имя -> InstrumentedTransport
+_transports: Dict[str, "InstrumentedTransport"] = {}
+
+
+class _CountingStream(httpx.AsyncByteStream):
+    """Тело ответа: запрос считается завершённым, когда тело закрыто (соединение вернулось в пул)"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+        self._closed = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._on_close()
+        await self._stream.aclose()
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """
+    Обёртка транспорта: свои счётчики запросов (в полёте, пик, таймауты ожидания пула)
+    и состояние соединений пула httpcore (открытые, простаивающие, занятые).
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, max_connections: int):
+        self._transport = transport
+        self.max_connections = max_connections
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.pool_timeouts = 0
+
+    def _done(self) -> None:
+        self.in_flight -= 1
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException as e:
+            self._done()
+            if isinstance(e, httpx.PoolTimeout):
+                self.pool_timeouts += 1
+            raise
+        response.stream = _CountingStream(response.stream, self._done)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+    def connection_stats(self) -> Optional[dict]:
+        """
+        Соединения пула: httpx держит его в приватном _pool, а AsyncConnectionPool.connections,
+        is_idle() и is_available() — публичный API httpcore (версия закреплена в requirements).
+        Если устройство пула другое — None, а не ошибка в эндпоинте статистики.
+        """
+        connections = getattr(getattr(self._transport, "_pool", None), "connections", None)
+        if connections is None:
+            return None
+        try:
+            connections = list(connections)
+            idle = sum(1 for conn in connections if conn.is_idle())
+            # HTTP/2 соединение занято, но может принять ещё потоки
+            available = sum(1 for conn in connections if conn.is_available())
+        except Exception:
+            return None
+        return {"open": len(connections), "idle": idle, "in_use": len(connections) - idle, "available": available}
+
+    def get_stats(self) -> dict:
+        return {
+            "connections": self.connection_stats(),
+            "max_connections": self.max_connections,
+            "requests_in_flight": self.in_flight,
+            "peak_requests_in_flight": self.peak_in_flight,
+            "requests_total": self.requests,
+            "pool_timeouts": self.pool_timeouts,
+        }
+
+
+def _build_client(name: str) -> httpx.AsyncClient:
+    config = CLIENT_CONFIG[name]
+    prefix = f"HTTP_{name.upper()}"
+    limits = httpx.Limits(
+        max_connections=_env_int(f"{prefix}_MAX_CONNECTIONS", config["max_connections"]),
+        max_keepalive_connections=_env_int(f"{prefix}_MAX_KEEPALIVE", config["max_keepalive"]),
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        connect=HTTP_CONNECT_TIMEOUT,
+        read=HTTP_READ_TIMEOUT,
+        write=HTTP_WRITE_TIMEOUT,
+        pool=HTTP_POOL_TIMEOUT,
+    )
+    transport = InstrumentedTransport(
+        httpx.AsyncHTTPTransport(http2=config["http2"], limits=limits),
+        max_connections=limits.max_connections,
+    )
+    _transports[name] = transport
+    return httpx.AsyncClient(base_url=config["base_url"], transport=transport, timeout=timeout)
+
+
+async def open_http_clients() -> None:
+    """Открыть пулы соединений (при старте приложения)"""
+    for name in CLIENT_CONFIG:
+        if name not in _clients:
+            _clients[name] = _build_client(name)
+    logger.info(f"🌐 HTTP клиенты открыты: {', '.join(_clients)}")
+
+
+async def close_http_clients() -> None:
+    """Закрыть пулы соединений (при остановке приложения)"""
+    while _clients:
+        name, client = _clients.popitem()
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.error(f"❌ Ошибка закрытия HTTP клиента {name}: {e}")
+    logger.info("🌐 HTTP клиенты закрыты")
+
+
+def get_http_client(name: str) -> httpx.AsyncClient:
+    """Получить общий клиент по имени (создаётся лениво, если пулы ещё не открыты)"""
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _build_client(name)
+        _clients[name] = client
+    return client
+
+
+def get_pool_stats() -> dict:
+    """Статистика пулов по счётчикам InstrumentedTransport: в работе, ожидающие, таймауты пула"""
+    return {name: _transports[name].get_stats() for name in _clients if name in _transports}
@@ -0,0 +1,262 @@
+"""
+Шина инвалидации кэшей между процессами (API и боты).
+
+Кэш-модули подписываются на именованные темы (company, company_bot, prompts, ...),
+а код, меняющий данные, публикует тему с полезной нагрузкой, например
+{"company_id": 5}. Сообщение доставляется всем остальным процессам; отправитель свои кэши
+обновляет сам (refresh_bot_route, set_cached_lang), и его подписчики на своё сообщение не вызываются.
+
+    INVALIDATION_BACKEND  postgres (LISTEN/NOTIFY, по умолчанию при PostgreSQL) или memory
+    INVALIDATION_CHANNEL  канал NOTIFY
+
+Если соединение слушателя обрывалось, уведомления за это время потеряны — после
+переподключения каждая тема доставляется с payload=None, и подписчики сбрасывают кэш целиком.
+"""
+import os
+import json
+import uuid
+import asyncio
+import inspect
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Union
+from sqlalchemy.engine import make_url
+from app.db.session import DATABASE_URL
+
+logger = logging.getLogger("invalidation_bus")
+
+INVALIDATION_CHANNEL = os.getenv("INVALIDATION_CHANNEL", "cache_invalidation")
+INVALIDATION_RECONNECT_INTERVAL = float(os.getenv("INVALIDATION_RECONNECT_INTERVAL", "5"))
+INVALIDATION_PUBLISH_TIMEOUT = float(os.getenv("INVALIDATION_PUBLISH_TIMEOUT", "5"))
+
+# Темы, которые публикуют app/main.py и фоновые задачи
+COMPANY = "company"              # {"company_id"} — Company и её settings
+COMPANY_BOT = "company_bot"      # {"company_id"} — CompanyBot (маршруты вебхуков, токены)
+PROMPTS = "prompts"              # {"company_id"} — CompanyPrompt
+PRODUCTS = "products"            # {"company_id", "appended"?} — каталог товаров (appended — только новые)
+RETRIEVAL = "retrieval"          # {"company_id"} — индекс знаний пересобран на диске
+USER_PREFERENCE = "user_preference"  # {"user_id"} — язык пользователя
+
+Handler = Callable[[Optional[dict]], Union[None, Awaitable[None]]]
+
+
+class InMemoryInvalidationBackend:
+    """Доставка внутри процесса; общий экземпляр на несколько шин имитирует несколько реплик"""
+
+    def __init__(self):
+        self._listeners: List[Callable[[str], None]] = []
+
+    async def start(self, on_message: Callable[[str], None], on_reconnect: Callable[[], None]) -> None:
+        self._listeners.append(on_message)
+
+    async def publish(self, message: str) -> None:
+        for listener in list(self._listeners):
+            listener(message)
+
+    async def stop(self) -> None:
+        self._listeners.clear()
+
+
+class PostgresInvalidationBackend:
+    """LISTEN/NOTIFY через отдельное соединение asyncpg; при обрыве переподключается"""
+
+    def __init__(self, dsn: str, channel: str = INVALIDATION_CHANNEL,
+                 reconnect_interval: float = INVALIDATION_RECONNECT_INTERVAL):
+        self.dsn = dsn
+        self.channel = channel
+        self.reconnect_interval = reconnect_interval
+        self._conn = None
+        self._on_message: Optional[Callable[[str], None]] = None
+        self._watchdog: Optional[asyncio.Task] = None
+
+    async def start(self, on_message: Callable[[str], None], on_reconnect: Callable[[], None]) -> None:
+        self._on_message = on_message
+        await self._connect()
+        self._watchdog = asyncio.create_task(self._watch(on_reconnect))
+
+    async def _connect(self) -> None:
+        import asyncpg
+        self._conn = await asyncpg.connect(self.dsn)
+        await self._conn.add_listener(self.channel, self._listener)
+        logger.info(f"📡 Шина инвалидации: LISTEN {self.channel}")
+
+    def _listener(self, connection, pid, channel, payload) -> None:
+        self._on_message(payload)
+
+    async def _watch(self, on_reconnect: Callable[[], None]) -> None:
+        while True:
+            await asyncio.sleep(self.reconnect_interval)
+            if self._conn is not None and not self._conn.is_closed():
+                continue
+            try:
+                await self._connect()
+            except Exception as e:
+                logger.error(f"❌ Шина инвалидации: нет соединения с PostgreSQL: {e}")
+                continue
+            on_reconnect()
+
+    async def publish(self, message: str) -> None:
+        if self._conn is None or self._conn.is_closed():
+            raise ConnectionError("нет соединения LISTEN/NOTIFY")
+        await self._conn.execute("SELECT pg_notify($1, $2)", self.channel, message)
+
+    async def stop(self) -> None:
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+            self._watchdog = None
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.close()
+        self._conn = None
+
+
+class InvalidationBus:
+    """Подписки тема -> обработчики и публикация через backend"""
+
+    def __init__(self, backend: Any):
+        self.backend = backend
+        self.origin = uuid.uuid4().hex
+        self._handlers: Dict[str, List[Handler]] = {}
+        # Event loop процесса: обработчики (и их async-сессии БД) работают только в нём
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._backend_started = False
+        # Ссылки на фоновые рассылки, чтобы задачи не собрал GC до завершения
+        self._tasks: Set[asyncio.Task] = set()
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+
+    def subscribe(self, topic: str, handler: Handler) -> None:
+        self._handlers.setdefault(topic, []).append(handler)
+
+    @property
+    def started(self) -> bool:
+        return self._backend_started
+
+    async def start(self) -> None:
+        if self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        try:
+            await self.backend.start(self._on_message, self._on_reconnect)
+        except Exception as e:
+            # Без шины кэши работают по своим TTL — процесс всё равно должен подняться
+            self.errors += 1
+            logger.error(f"❌ Шина инвалидации не запущена ({type(self.backend).__name__}): {e}")
+            return
+        self._backend_started = True
+
+    async def stop(self) -> None:
+        if self._loop is None:
+            return
+        self._loop = None
+        if self._backend_started:
+            self._backend_started = False
+            await self.backend.stop()
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def _spawn(self, coro, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        task = (loop or asyncio.get_running_loop()).create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def publish(self, topic: str, **payload) -> None:
+        """Разослать инвалидацию остальным процессам (свои кэши вызывающий уже обновил)"""
+        self.published += 1
+        if not self._backend_started:
+            return
+        message = json.dumps({"topic": topic, "payload": payload, "origin": self.origin})
+        try:
+            await self.backend.publish(message)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"❌ Не удалось разослать инвалидацию {topic}: {e}")
+
+    def publish_sync(self, topic: str, **payload) -> None:
+        """Публикация из синхронного кода (эндпоинты FastAPI в пуле потоков, фоновые задачи)"""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not None:
+            # Вызов из самого event loop: ждать результата здесь нельзя
+            self._spawn(self.publish(topic, **payload), running)
+            return
+        if self._loop is None:
+            # Шина не запускалась (скрипты): рассылать некому; временный event loop не создаём
+            return
+        # Из пула потоков — только через event loop процесса: на временном loop
+        # async-сессии БД (пул asyncpg) работать не могут
+        future = asyncio.run_coroutine_threadsafe(self.publish(topic, **payload), self._loop)
+        try:
+            future.result(timeout=INVALIDATION_PUBLISH_TIMEOUT)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"❌ Инвалидация {topic} не опубликована: {e}")
+
+    def _on_message(self, message: str) -> None:
+        try:
+            data = json.loads(message)
+        except ValueError:
+            logger.warning(f"⚠️ Некорректное сообщение шины инвалидации: {message[:200]}")
+            return
+        if data.get("origin") == self.origin:
+            return  # свои изменения уже применены в publish
+        self.received += 1
+        self._spawn(self._dispatch(data.get("topic"), data.get("payload") or {}))
+
+    def _on_reconnect(self) -> None:
+        logger.warning("♻️ Шина инвалидации переподключилась: сбрасываем все подписанные кэши")
+        for topic in list(self._handlers):
+            self._spawn(self._dispatch(topic, None))
+
+    async def _dispatch(self, topic: str, payload: Optional[dict]) -> None:
+        for handler in self._handlers.get(topic, ()):
+            try:
+                result = handler(payload)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"❌ Ошибка обработчика инвалидации {topic}: {e}")
+
+    def get_stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "started": self.started,
+            "topics": sorted(self._handlers),
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors,
+            "pending": len(self._tasks),
+        }
+
+
+def _postgres_dsn(database_url: str) -> str:
+    """Строка подключения SQLAlchemy -> DSN asyncpg (без +psycopg2/+asyncpg)"""
+    return make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def create_invalidation_bus() -> InvalidationBus:
+    database_url = DATABASE_URL or ""
+    default_backend = "postgres" if database_url.startswith("postgresql") else "memory"
+    backend_name = os.getenv("INVALIDATION_BACKEND", default_backend)
+    if backend_name == "postgres":
+        backend = PostgresInvalidationBackend(_postgres_dsn(database_url))
+    else:
+        backend = InMemoryInvalidationBackend()
+    logger.info(f"📡 Шина инвалидации: backend={backend_name}")
+    return InvalidationBus(backend)
+
+
+_bus: Optional[InvalidationBus] = None
+
+
+def get_invalidation_bus() -> InvalidationBus:
+    """Шина процесса (создаётся при первом обращении, подключается в start())"""
+    global _bus
+    if _bus is None:
+        _bus = create_invalidation_bus()
+    return _bus
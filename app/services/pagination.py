@@ -0,0 +1,69 @@
+import logging
+import pydantic_core
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Query, Session
+from app.db.session import SessionLocal
+
+logger = logging.getLogger("pagination")
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def keyset_page(query: Query, key_column: Any, cursor: Optional[int], limit: int) -> Tuple[List[Any], Optional[int]]:
+    """
+    Страница по курсору (keyset): WHERE key > cursor ORDER BY key LIMIT n.
+    В отличие от OFFSET стоимость не растёт с номером страницы.
+    Возвращает (строки, next_cursor); next_cursor = None на последней странице.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if cursor is not None:
+        query = query.filter(key_column > cursor)
+    rows = query.order_by(key_column).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, getattr(rows[-1], key_column.key)
+    return rows, None
+
+
+def wants_ndjson(fmt: Optional[str], accept: Optional[str]) -> bool:
+    return fmt == "ndjson" or (accept is not None and NDJSON_MEDIA_TYPE in accept)
+
+
+def iter_ndjson(
+    build_query: Callable[[Session], Query],
+    key_column: Any,
+    after: Optional[int] = None,
+    serialize: Callable[[Any], Any] = jsonable_encoder,
+    batch_size: int = STREAM_BATCH_SIZE,
+) -> Iterator[bytes]:
+    """
+    Построчная выгрузка (NDJSON) через серверный курсор (yield_per).
+    Сессия своя: сессия запроса закрывается раньше, чем ответ дочитан клиентом.
+    """
+    db = SessionLocal()
+    try:
+        query = build_query(db)
+        if after is not None:
+            query = query.filter(key_column > after)
+        query = query.order_by(key_column).yield_per(batch_size)
+        for row in query:
+            yield pydantic_core.to_json(serialize(row)) + b"\n"
+    except Exception as e:
+        logger.error(f"❌ Ошибка потоковой выгрузки: {e}")
+        raise
+    finally:
+        db.close()
+
+
+def ndjson_response(
+    build_query: Callable[[Session], Query],
+    key_column: Any,
+    after: Optional[int] = None,
+    serialize: Callable[[Any], Any] = jsonable_encoder,
+) -> StreamingResponse:
+    return StreamingResponse(iter_ndjson(build_query, key_column, after, serialize), media_type=NDJSON_MEDIA_TYPE)
@@ -0,0 +1,18 @@
+from app.services.retrieval.chunking import chunk_text, extract_text
+from app.services.retrieval.embedders import HashingEmbedder, OpenAIEmbedder, create_embedder
+from app.services.retrieval.store import CompanyRetriever, CompanyVectorStore, RetrievedChunk
+from app.services.retrieval.ingest import build_company_index, collect_sources, rebuild_company_index
+
+__all__ = [
+    "chunk_text",
+    "extract_text",
+    "HashingEmbedder",
+    "OpenAIEmbedder",
+    "create_embedder",
+    "CompanyRetriever",
+    "CompanyVectorStore",
+    "RetrievedChunk",
+    "build_company_index",
+    "collect_sources",
+    "rebuild_company_index",
+]
@@ -0,0 +1,53 @@
+import re
+from typing import Any, List
+
+_PARAGRAPHS = re.compile(r"\n\s*\n")
+_SENTENCES = re.compile(r"(?<=[.!?…])\s+")
+
+
+def extract_text(value: Any) -> str:
+    """Текст из JSON-полей (Document.content, CompanyPrompt.documents): все строки по порядку"""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return "\n\n".join(filter(None, (extract_text(v) for v in value.values())))
+    if isinstance(value, (list, tuple)):
+        return "\n\n".join(filter(None, (extract_text(v) for v in value)))
+    return str(value)
+
+
+def chunk_text(text: str, max_chars: int = 800, overlap: int = 120) -> List[str]:
+    """
+    Куски до max_chars символов по границам абзацев и предложений.
+    Хвост предыдущего куска (overlap) повторяется в начале следующего, чтобы факт на стыке не терялся.
+    """
+    pieces: List[str] = []
+    for paragraph in _PARAGRAPHS.split(text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCES.split(paragraph):
+            # Предложение длиннее куска режется как есть
+            while len(sentence) > max_chars:
+                pieces.append(sentence[:max_chars])
+                sentence = sentence[max_chars:]
+            if sentence:
+                pieces.append(sentence)
+
+    chunks: List[str] = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            chunks.append(current)
+            tail = current[-overlap:] if overlap else ""
+            current = f"{tail} {piece}".strip() if len(tail) + 1 + len(piece) <= max_chars else piece
+        else:
+            current = f"{current} {piece}".strip()
+    if current:
+        chunks.append(current)
+    return chunks
@@ -0,0 +1,81 @@
+import os
+import re
+import zlib
+from typing import List
+import numpy as np
+
+RETRIEVAL_EMBEDDER = os.getenv("RETRIEVAL_EMBEDDER", "hashing")
+RETRIEVAL_HASHING_DIM = int(os.getenv("RETRIEVAL_HASHING_DIM", "512"))
+RETRIEVAL_OPENAI_MODEL = os.getenv("RETRIEVAL_OPENAI_MODEL", "text-embedding-3-small")
+RETRIEVAL_OPENAI_BATCH = int(os.getenv("RETRIEVAL_OPENAI_BATCH", "100"))
+
+_WORDS = re.compile(r"\w+", re.UNICODE)
+
+
+class HashingEmbedder:
+    """
+    Локальный детерминированный эмбеддер: хэширование слов и символьных триграмм в вектор
+    фиксированной длины. Без сети и моделей — для тестов, разработки и как запасной вариант.
+    """
+
+    def __init__(self, dim: int = RETRIEVAL_HASHING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> List[str]:
+        words = _WORDS.findall(text.lower().replace("ё", "е"))
+        features = list(words)
+        for word in words:
+            padded = f"#{word}#"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            if not features:
+                continue
+            # crc32 стабилен между процессами, в отличие от hash()
+            hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint32, count=len(features))
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+            np.add.at(vectors[row], hashes % self.dim, signs)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+class OpenAIEmbedder:
+    """Эмбеддинги OpenAI; клиент создаётся лениво, чтобы объект можно было передать в процесс пула"""
+
+    def __init__(self, model: str = RETRIEVAL_OPENAI_MODEL, batch_size: int = RETRIEVAL_OPENAI_BATCH):
+        self.model = model
+        self.batch_size = batch_size
+        self.name = f"openai:{model}"
+        self._client = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_client"] = None
+        return state
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        rows = []
+        for start in range(0, len(texts), self.batch_size):
+            response = self._client.embeddings.create(model=self.model, input=texts[start:start + self.batch_size])
+            rows.extend(item.embedding for item in response.data)
+        vectors = np.asarray(rows, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+def create_embedder(kind: str = RETRIEVAL_EMBEDDER):
+    if kind == "openai":
+        return OpenAIEmbedder()
+    if kind == "hashing":
+        return HashingEmbedder()
+    raise ValueError(f"Неизвестный эмбеддер: {kind}")
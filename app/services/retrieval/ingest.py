@@ -0,0 +1,162 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Set, Tuple
+import numpy as np
+from sqlalchemy.orm import Session
+from app.db.session import SessionLocal
+from app.models.all_models import CompanyPrompt, Document, Product
+from app.services.retrieval.chunking import chunk_text, extract_text
+from app.services.retrieval.store import CompanyVectorStore, RETRIEVAL_DIR, company_dir
+
+logger = logging.getLogger("retrieval")
+
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", str(min(4, os.cpu_count() or 1))))
+RETRIEVAL_CHUNK_CHARS = int(os.getenv("RETRIEVAL_CHUNK_CHARS", "800"))
+RETRIEVAL_CHUNK_OVERLAP = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", "120"))
+# Сколько источников отдаётся одному процессу пула за раз
+RETRIEVAL_TASK_SOURCES = 64
+
+
+def collect_sources(db: Session, company_id: int) -> Dict[str, str]:
+    """Все знания компании: ключ источника ("document:12", "prompt:3", "product:7") -> текст"""
+    sources: Dict[str, str] = {}
+    for doc_id, content in db.query(Document.id, Document.content).filter(Document.company_id == company_id).yield_per(500):
+        sources[f"document:{doc_id}"] = extract_text(content)
+    for prompt_id, documents in db.query(CompanyPrompt.id, CompanyPrompt.documents).filter(
+        CompanyPrompt.company_id == company_id, CompanyPrompt.is_active == True
+    ):
+        sources[f"prompt:{prompt_id}"] = extract_text(documents)
+    for product_id, name, category, description in db.query(
+        Product.id, Product.name, Product.category, Product.description
+    ).filter(Product.company_id == company_id).yield_per(1000):
+        sources[f"product:{product_id}"] = "\n\n".join(filter(None, [name, category, description]))
+    return {key: text for key, text in sources.items() if text.strip()}
+
+
+def fingerprint(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def chunk_and_embed(embedder, items: List[Tuple[str, str]], max_chars: int, overlap: int) -> List[Tuple[str, List[str], np.ndarray]]:
+    """Задача процесса пула: нарезать и посчитать векторы для пачки источников"""
+    keys, texts = [], []
+    for key, text in items:
+        for chunk in chunk_text(text, max_chars, overlap):
+            keys.append(key)
+            texts.append(chunk)
+    vectors = embedder.embed(texts) if texts else None
+
+    results, row = [], 0
+    for key, _ in items:
+        start = row
+        while row < len(keys) and keys[row] == key:
+            row += 1
+        results.append((key, texts[start:row], vectors[start:row] if vectors is not None else None))
+    return results
+
+
+def build_company_index(db: Session, company_id: int, embedder, workers: int = RETRIEVAL_WORKERS, base_dir: str = RETRIEVAL_DIR) -> dict:
+    """
+    Пересобрать индекс компании. Источники с тем же отпечатком текста берутся из текущего
+    индекса без пересчёта; нарезка и эмбеддинги новых/изменённых — в пуле процессов.
+    """
+    started = time.perf_counter()
+    path = company_dir(company_id, base_dir)
+    sources = collect_sources(db, company_id)
+    fingerprints = {key: fingerprint(text) for key, text in sources.items()}
+
+    previous = None
+    try:
+        previous = CompanyVectorStore.load(path)
+    except Exception as e:
+        logger.warning(f"⚠️ Текущий индекс company_id={company_id} не читается, полная пересборка: {e}")
+    if previous is not None and previous.embedder != embedder.name:
+        previous = None
+
+    reused, changed = {}, []
+    for key, text in sources.items():
+        old = previous.meta["sources"].get(key) if previous else None
+        if old and old["fingerprint"] == fingerprints[key]:
+            reused[key] = previous.source_vectors(key)
+        else:
+            changed.append((key, text))
+
+    embedded = {}
+    batches = [changed[i:i + RETRIEVAL_TASK_SOURCES] for i in range(0, len(changed), RETRIEVAL_TASK_SOURCES)]
+    if workers > 1 and len(batches) > 1:
+        # spawn, а не fork: сборка идёт из потока uvicorn, а fork многопоточного процесса может зависнуть
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(chunk_and_embed, embedder, batch, RETRIEVAL_CHUNK_CHARS, RETRIEVAL_CHUNK_OVERLAP) for batch in batches]
+            for future in futures:
+                for key, texts, vectors in future.result():
+                    embedded[key] = ([{"source": key, "text": text} for text in texts], vectors)
+    else:
+        for batch in batches:
+            for key, texts, vectors in chunk_and_embed(embedder, batch, RETRIEVAL_CHUNK_CHARS, RETRIEVAL_CHUNK_OVERLAP):
+                embedded[key] = ([{"source": key, "text": text} for text in texts], vectors)
+
+    # Сборка новой версии в порядке ключей: строки источника идут подряд
+    chunks: List[dict] = []
+    parts: List[np.ndarray] = []
+    meta_sources: Dict[str, dict] = {}
+    for key in sorted(sources):
+        source_chunks, vectors = reused.get(key) or embedded[key]
+        if not source_chunks:
+            continue
+        meta_sources[key] = {"fingerprint": fingerprints[key], "rows": [len(chunks), len(chunks) + len(source_chunks)]}
+        chunks.extend(source_chunks)
+        parts.append(vectors)
+
+    all_vectors = np.vstack(parts) if parts else np.zeros((0, getattr(embedder, "dim", 0)), dtype=np.float32)
+    CompanyVectorStore.save(path, embedder.name, meta_sources, chunks, all_vectors)
+
+    report = {
+        "company_id": company_id,
+        "sources": len(sources),
+        "reused": len(reused),
+        "embedded": len(changed),
+        "removed": len(set(previous.meta["sources"]) - set(sources)) if previous else 0,
+        "chunks": len(chunks),
+        "elapsed_s": round(time.perf_counter() - started, 2),
+    }
+    logger.info(f"📚 Индекс знаний пересобран: {report}")
+    return report
+
+
+_rebuild_lock = threading.Lock()
+_rebuilding: Set[int] = set()
+_rebuild_pending: Set[int] = set()
+
+
+def rebuild_company_index(company_id: int, embedder) -> None:
+    """
+    Пересборка в фоне (BackgroundTasks / поток). Запросы, пришедшие во время сборки,
+    схлопываются в одну повторную сборку после текущей.
+    """
+    with _rebuild_lock:
+        if company_id in _rebuilding:
+            _rebuild_pending.add(company_id)
+            return
+        _rebuilding.add(company_id)
+    try:
+        while True:
+            db = SessionLocal()
+            try:
+                build_company_index(db, company_id, embedder)
+            finally:
+                db.close()
+            with _rebuild_lock:
+                if company_id not in _rebuild_pending:
+                    break
+                _rebuild_pending.discard(company_id)
+    except Exception as e:
+        logger.error(f"❌ Ошибка пересборки индекса знаний company_id={company_id}: {e}")
+    finally:
+        with _rebuild_lock:
+            _rebuilding.discard(company_id)
+            _rebuild_pending.discard(company_id)
@@ -0,0 +1,162 @@
+import os
+import json
+import fcntl
+import time
+import uuid
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger("retrieval")
+
+RETRIEVAL_DIR = os.getenv("RETRIEVAL_DIR", "data/retrieval")
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "0.15"))
+# Как часто процесс проверяет, не пересобран ли индекс компании на диске
+RETRIEVAL_RELOAD_INTERVAL = float(os.getenv("RETRIEVAL_RELOAD_INTERVAL", "30"))
+
+META_FILE = "meta.json"
+LOCK_FILE = ".lock"
+
+
+@dataclass
+class RetrievedChunk:
+    text: str
+    source: str
+    score: float
+
+
+def company_dir(company_id: int, base_dir: str = RETRIEVAL_DIR) -> str:
+    return os.path.join(base_dir, f"company_{company_id}")
+
+
+class CompanyVectorStore:
+    """
+    Векторы одной компании: vectors-<версия>.npy (открывается через mmap, в память попадают только
+    читаемые страницы) + meta.json с текстами кусков и отпечатками источников.
+    Новая версия пишется рядом, meta.json подменяется атомарно (os.replace). Запись в каталог
+    компании идёт под файловой блокировкой: сборки из разных процессов не пишут одновременно
+    и не удаляют чужие векторы.
+    """
+
+    def __init__(self, path: str, meta: dict, vectors: np.ndarray):
+        self.path = path
+        self.meta = meta
+        self.vectors = vectors
+        self.chunks: List[dict] = meta["chunks"]
+
+    @property
+    def embedder(self) -> str:
+        return self.meta["embedder"]
+
+    @classmethod
+    def load(cls, path: str) -> Optional["CompanyVectorStore"]:
+        meta_path = os.path.join(path, META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        vectors = np.load(os.path.join(path, meta["vectors_file"]), mmap_mode="r")
+        return cls(path, meta, vectors)
+
+    @classmethod
+    def save(cls, path: str, embedder: str, sources: Dict[str, dict], chunks: List[dict], vectors: np.ndarray) -> "CompanyVectorStore":
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, LOCK_FILE), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Имена уникальны и между процессами: время в мс может совпасть
+            version = f"{int(time.time() * 1000)}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            vectors_file = f"vectors-{version}.npy"
+            np.save(os.path.join(path, vectors_file), np.ascontiguousarray(vectors, dtype=np.float32))
+            meta = {
+                "version": version,
+                "embedder": embedder,
+                "vectors_file": vectors_file,
+                "sources": sources,
+                "chunks": chunks,
+            }
+            tmp_path = os.path.join(path, f"{META_FILE}.{version}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(tmp_path, os.path.join(path, META_FILE))
+
+            # Старые версии векторов больше не нужны (уже открытые mmap продолжают работать)
+            for name in os.listdir(path):
+                if name.startswith("vectors-") and name != vectors_file:
+                    try:
+                        os.remove(os.path.join(path, name))
+                    except OSError:
+                        pass
+            return cls(path, meta, np.load(os.path.join(path, vectors_file), mmap_mode="r"))
+
+    def source_vectors(self, key: str) -> Tuple[List[dict], np.ndarray]:
+        """Куски и векторы одного источника — для переиспользования при инкрементальной пересборке"""
+        start, end = self.meta["sources"][key]["rows"]
+        return self.chunks[start:end], np.asarray(self.vectors[start:end])
+
+    def search(self, query_vector: np.ndarray, k: int = RETRIEVAL_TOP_K, min_score: float = RETRIEVAL_MIN_SCORE) -> List[RetrievedChunk]:
+        n = len(self.chunks)
+        if n == 0 or k <= 0:
+            return []
+        scores = self.vectors @ query_vector
+        k = min(k, n)
+        # argpartition: O(n) отбор top-k без полной сортировки, сортируем только k штук
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            RetrievedChunk(text=self.chunks[i]["text"], source=self.chunks[i]["source"], score=float(scores[i]))
+            for i in top if scores[i] >= min_score
+        ]
+
+
+class CompanyRetriever:
+    """Поиск по индексам компаний; индекс подхватывается заново, когда его пересобрали на диске"""
+
+    def __init__(self, embedder, base_dir: str = RETRIEVAL_DIR, reload_interval: float = RETRIEVAL_RELOAD_INTERVAL):
+        self.embedder = embedder
+        self.base_dir = base_dir
+        self.reload_interval = reload_interval
+        self._stores: Dict[int, Tuple[Optional[CompanyVectorStore], float, float]] = {}  # company_id -> (store, mtime, проверено)
+
+    def get_store(self, company_id: int) -> Optional[CompanyVectorStore]:
+        now = time.monotonic()
+        cached = self._stores.get(company_id)
+        if cached and now - cached[2] < self.reload_interval:
+            return cached[0]
+
+        path = company_dir(company_id, self.base_dir)
+        try:
+            mtime = os.path.getmtime(os.path.join(path, META_FILE))
+        except OSError:
+            mtime = 0.0
+        if cached and cached[1] == mtime:
+            self._stores[company_id] = (cached[0], mtime, now)
+            return cached[0]
+
+        store = None
+        if mtime:
+            try:
+                store = CompanyVectorStore.load(path)
+            except Exception as e:
+                logger.error(f"❌ Не удалось загрузить индекс company_id={company_id}: {e}")
+                store = cached[0] if cached else None
+        if store is not None and store.embedder != self.embedder.name:
+            logger.warning(f"⚠️ Индекс company_id={company_id} построен {store.embedder}, а поиск идёт {self.embedder.name}")
+            store = None
+        self._stores[company_id] = (store, mtime, now)
+        return store
+
+    def invalidate(self, company_id: Optional[int] = None) -> None:
+        """Индекс пересобран в другом процессе: перечитать с диска при следующем поиске"""
+        if company_id is None:
+            self._stores.clear()
+        else:
+            self._stores.pop(company_id, None)
+
+    def search(self, company_id: int, query: str, k: int = RETRIEVAL_TOP_K) -> List[RetrievedChunk]:
+        store = self.get_store(company_id)
+        if store is None:
+            return []
+        query_vector = self.embedder.embed([query])[0]
+        return store.search(query_vector, k)
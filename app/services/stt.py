@@ -0,0 +1,157 @@
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Optional
+from app.services.http_clients import get_http_client
+
+logger = logging.getLogger("stt")
+
+STT_BACKEND = os.getenv("STT_BACKEND", "openai")            # openai | fake
+STT_MODEL = os.getenv("STT_MODEL", "whisper-1")
+STT_MAX_CONCURRENCY = int(os.getenv("STT_MAX_CONCURRENCY", "4"))
+STT_MAX_QUEUE = int(os.getenv("STT_MAX_QUEUE", "50"))
+STT_QUEUE_TIMEOUT = float(os.getenv("STT_QUEUE_TIMEOUT", "15"))
+STT_TIMEOUT = float(os.getenv("STT_TIMEOUT", "60"))
+# Лимит Whisper API — 25 МБ; до этого размера загрузка держится в памяти
+STT_MAX_UPLOAD_BYTES = int(os.getenv("STT_MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+
+
+class TranscriptionError(Exception):
+    """Ошибка распознавания речи"""
+
+
+class TranscriptionBusyError(TranscriptionError):
+    """Все воркеры заняты и очередь ожидания заполнена"""
+
+
+class TranscriptionTimeoutError(TranscriptionError):
+    """Распознавание не уложилось в таймаут"""
+
+
+@dataclass
+class TranscriptionResult:
+    text: str
+    language: str = "unknown"
+
+
+class OpenAIWhisperBackend:
+    """Whisper через OpenAI API (общий HTTP пул, без временных файлов)"""
+
+    def __init__(self, api_key: Optional[str] = None, model: str = STT_MODEL):
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.model = model
+
+    async def transcribe(self, audio: bytes, filename: str, language: Optional[str] = None) -> TranscriptionResult:
+        data = {"model": self.model, "response_format": "verbose_json"}
+        if language:
+            data["language"] = language
+        response = await get_http_client("openai").post(
+            "/audio/transcriptions",
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            data=data,
+            files={"file": (filename, audio)},
+        )
+        if response.status_code != 200:
+            raise TranscriptionError(f"Whisper API {response.status_code}: {response.text[:200]}")
+        result = response.json()
+        return TranscriptionResult(text=result.get("text", ""), language=result.get("language") or language or "unknown")
+
+
+class FakeTranscriptionBackend:
+    """Локальный backend для тестов и разработки: детерминированный ответ с задержкой"""
+
+    def __init__(self, text: str = "", delay: float = 0.0):
+        self.text = text
+        self.delay = delay
+        self.calls = 0
+
+    async def transcribe(self, audio: bytes, filename: str, language: Optional[str] = None) -> TranscriptionResult:
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        text = self.text or f"transcribed {len(audio)} bytes"
+        return TranscriptionResult(text=text, language=language or "unknown")
+
+
+class TranscriptionPool:
+    """
+    Ограничивает число одновременных распознаваний.
+    Лишние запросы ждут свободный слот (не дольше queue_timeout),
+    при переполнении очереди сразу получают TranscriptionBusyError.
+    """
+
+    def __init__(
+        self,
+        backend,
+        max_concurrency: int = STT_MAX_CONCURRENCY,
+        max_queue: int = STT_MAX_QUEUE,
+        queue_timeout: float = STT_QUEUE_TIMEOUT,
+        timeout: float = STT_TIMEOUT,
+    ):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._active = 0
+        # Метрики
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._busy_seconds = 0.0
+
+    async def transcribe(self, audio: bytes, filename: str = "audio.ogg", language: Optional[str] = None) -> TranscriptionResult:
+        if self._waiting >= self.max_queue:
+            self.rejected += 1
+            raise TranscriptionBusyError("Transcription queue is full")
+
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise TranscriptionBusyError("Timed out waiting for a transcription slot")
+        finally:
+            self._waiting -= 1
+
+        self._active += 1
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(self.backend.transcribe(audio, filename, language), timeout=self.timeout)
+            self.completed += 1
+            return result
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise TranscriptionTimeoutError(f"Transcription exceeded {self.timeout}s")
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._busy_seconds += time.monotonic() - started
+            self._active -= 1
+            self._semaphore.release()
+
+    def get_stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "active": self._active,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "busy_seconds": round(self._busy_seconds, 2),
+        }
+
+
+def create_transcription_pool() -> TranscriptionPool:
+    backend = FakeTranscriptionBackend() if STT_BACKEND == "fake" else OpenAIWhisperBackend()
+    logger.info(f"🎤 STT: backend={STT_BACKEND}, concurrency={STT_MAX_CONCURRENCY}, queue={STT_MAX_QUEUE}")
+    return TranscriptionPool(backend)
@@ -1,67 +1,145 @@
+import os
+import hashlib
+import threading
+import time
+import logging
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
 from sqlalchemy.orm import Session
 from app.models import UIText
-import logging
 
 # Настройка логирования для кэша
 cache_logger = logging.getLogger("translation_cache")
 
-# Кэш для переводов: ключ (key, lang) -> текст
-_translation_cache = {}
+# Как часто сверять снимок с таблицей ui_texts и как часто писать статистику (секунды)
+TRANSLATIONS_RELOAD_INTERVAL = float(os.getenv("TRANSLATIONS_RELOAD_INTERVAL", "300"))
+TRANSLATIONS_STATS_INTERVAL = float(os.getenv("TRANSLATIONS_STATS_INTERVAL", "3600"))
+
+# Ключи кнопок главного меню: только их тексты распознаются как нажатия
+BUTTON_KEYS = ("contact", "ask", "change")
+
+
+class TranslationSnapshot:
+    """
+    Неизменяемый снимок всей таблицы ui_texts: (key, lang) -> текст и обратный индекс
+    текст кнопки -> (key, lang) только по BUTTON_KEYS, чтобы обычное сообщение, совпавшее
+    с каким-нибудь другим переводом, не считалось нажатием. Версия — хеш содержимого.
+    """
+
+    __slots__ = ("version", "texts", "reverse", "collisions")
+
+    def __init__(self, rows):
+        rows = sorted(rows)
+        digest = hashlib.sha1()
+        texts = {}
+        reverse = {}
+        collisions = []
+        for key, lang, text in rows:
+            digest.update(f"{key}\0{lang}\0{text}\n".encode("utf-8"))
+            texts[(key, lang)] = text
+            if key not in BUTTON_KEYS:
+                continue
+            found = reverse.setdefault(text, (key, lang))
+            if found[0] != key:
+                # Две кнопки с одним текстом — ошибка в ui_texts; побеждает первая по (key, lang)
+                collisions.append((text, found[0], key))
+        self.version = digest.hexdigest()
+        self.texts: Mapping[Tuple[str, str], str] = MappingProxyType(texts)
+        self.reverse: Mapping[str, Tuple[str, str]] = MappingProxyType(reverse)
+        self.collisions = tuple(collisions)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+
+# Текущий снимок; заменяется целиком одним присваиванием, читатели никогда не видят половину
+_snapshot: Optional[TranslationSnapshot] = None
+_load_lock = threading.Lock()
 _cache_hits = 0
 _cache_misses = 0
+_missing_logged = set()
+
+
+def load_translations(db: Session) -> TranslationSnapshot:
+    """Перечитать ui_texts и подменить снимок, если содержимое изменилось"""
+    global _snapshot
+    rows = db.query(UIText.key, UIText.language, UIText.text).all()
+    snapshot = TranslationSnapshot((row.key, row.language, row.text) for row in rows)
+    with _load_lock:
+        if _snapshot is not None and _snapshot.version == snapshot.version:
+            return _snapshot
+        _snapshot = snapshot
+        _missing_logged.clear()
+    cache_logger.info(f"💾 Переводы загружены: {len(snapshot)} строк, версия {snapshot.version[:8]}")
+    for text, kept, dropped in snapshot.collisions:
+        cache_logger.warning(f"⚠️ Кнопки '{kept}' и '{dropped}' с одинаковым текстом '{text}': распознаётся '{kept}'")
+    return snapshot
 
-def t(key: str, lang: str, db: Session) -> str:
-    """Получение перевода с кэшированием"""
-    global _translation_cache, _cache_hits, _cache_misses
-    
-    cache_key = (key, lang)
-    
-    # Проверяем кэш
-    if cache_key in _translation_cache:
+
+def get_snapshot(db: Optional[Session] = None) -> TranslationSnapshot:
+    """Текущий снимок; до первой загрузки читается из БД один раз"""
+    snapshot = _snapshot
+    if snapshot is None:
+        if db is not None:
+            return load_translations(db)
+        from app.db.session import SessionLocal
+        with SessionLocal() as session:
+            return load_translations(session)
+    return snapshot
+
+
+def t(key: str, lang: str, db: Optional[Session] = None) -> str:
+    """Перевод из снимка в памяти; БД не используется (кроме самой первой загрузки)"""
+    global _cache_hits, _cache_misses
+    text = get_snapshot(db).texts.get((key, lang))
+    if text is not None:
         _cache_hits += 1
-        if _cache_hits % 50 == 0:  # Логируем каждые 50 попаданий
-            cache_logger.info(f"📊 Кэш переводов: hits={_cache_hits}, misses={_cache_misses}, эффективность={(_cache_hits/(_cache_hits+_cache_misses)*100):.1f}%")
-        return _translation_cache[cache_key]
-    
+        return text
     _cache_misses += 1
-    
-    # Запрос в БД
-    row = db.query(UIText).filter(UIText.key == key, UIText.language == lang).first()
-    
-    if not row:
+    if (key, lang) not in _missing_logged:
+        _missing_logged.add((key, lang))
         cache_logger.warning(f"❌ Ключ '{key}' не найден для языка '{lang}'")
-        result = f"[{key}] (not found)"
-    else:
-        result = row.text
-    
-    # Сохраняем в кэш, ограничиваем размер до 256 записей (FIFO)
-    if len(_translation_cache) >= 256:
-        # Удаляем самый старый элемент
-        _translation_cache.pop(next(iter(_translation_cache)))
-        cache_logger.debug("🗑️ Кэш переводов: достигнут лимит, удалена старая запись")
-    
-    _translation_cache[cache_key] = result
-    cache_logger.info(f"💾 Кэш переводов: добавлено '{key}' ({lang}), размер кэша: {len(_translation_cache)}")
-    
-    return result
+    return f"[{key}] (not found)"
+
+
+def find_text_key(text: str, db: Optional[Session] = None) -> Optional[Tuple[str, str]]:
+    """По тексту кнопки меню (BUTTON_KEYS) — (key, lang) или None одним обращением к словарю"""
+    if not text:
+        return None
+    return get_snapshot(db).reverse.get(text)
+
 
 def get_cache_stats() -> str:
     """Получить статистику кэша для логирования"""
-    global _cache_hits, _cache_misses
     total = _cache_hits + _cache_misses
     if total == 0:
         return "Кэш переводов: еще не использовался"
     hit_rate = (_cache_hits / total) * 100
-    return f"Кэш переводов: hits={_cache_hits}, misses={_cache_misses}, эффективность={hit_rate:.1f}%"
+    version = _snapshot.version[:8] if _snapshot is not None else "-"
+    return f"Кэш переводов: hits={_cache_hits}, misses={_cache_misses}, эффективность={hit_rate:.1f}%, версия={version}"
+
 
-# Автоматическое логирование статистики каждый час
-import threading, time
+def _reload_from_db() -> None:
+    from app.db.session import SessionLocal
+    with SessionLocal() as db:
+        load_translations(db)
 
-def _log_cache_stats_periodically():
+
+def _refresh_periodically():
+    """Фоновый поток: сверяет снимок с БД и раз в TRANSLATIONS_STATS_INTERVAL пишет статистику"""
+    last_stats = time.monotonic()
     while True:
-        time.sleep(3600)  # Каждый час
-        cache_logger.info(get_cache_stats())
+        time.sleep(TRANSLATIONS_RELOAD_INTERVAL)
+        if _snapshot is not None:
+            try:
+                _reload_from_db()
+            except Exception as e:
+                cache_logger.error(f"❌ Не удалось обновить переводы: {e}")
+        if time.monotonic() - last_stats >= TRANSLATIONS_STATS_INTERVAL:
+            last_stats = time.monotonic()
+            cache_logger.info(get_cache_stats())
+
 
 # Запускаем фоновый поток (не влияет на asyncio)
-stats_thread = threading.Thread(target=_log_cache_stats_periodically, daemon=True)
+stats_thread = threading.Thread(target=_refresh_periodically, daemon=True)
 stats_thread.start()
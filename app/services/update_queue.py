@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger("update_queue")
+
+
+class QueueFullError(Exception):
+    """Очередь переполнена, апдейт не принят"""
+
+
+@dataclass
+class _Job:
+    args: tuple
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class UpdateQueue:
+    """
+    Ограниченная очередь апдейтов с фиксированным пулом воркеров.
+
+    Каждый воркер читает свою шарду; чат всегда попадает в одну шарду,
+    поэтому апдейты одного чата обрабатываются строго по порядку,
+    а разные чаты — параллельно.
+
+    Политики при переполнении:
+        reject      — не принимать апдейт (вебхук отвечает 429, Telegram повторит позже)
+        drop_oldest — выбросить самый старый апдейт из шарды и принять новый
+    """
+
+    def __init__(
+        self,
+        handler: Callable[..., Awaitable[Any]],
+        workers: int = 8,
+        max_size: int = 1000,
+        shed_policy: str = "reject",
+    ):
+        if shed_policy not in ("reject", "drop_oldest"):
+            raise ValueError(f"Unknown shed policy: {shed_policy}")
+        self.handler = handler
+        self.workers = workers
+        self.max_size = max_size
+        self.shed_policy = shed_policy
+        self._shards: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self._accepting = False
+        self._pending = 0
+        self._in_flight = 0
+        # Метрики
+        self.accepted = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.shed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    async def start(self) -> None:
+        self._shards = [asyncio.Queue() for _ in range(self.workers)]
+        self._tasks = [
+            asyncio.create_task(self._worker(shard), name=f"update-worker-{i}")
+            for i, shard in enumerate(self._shards)
+        ]
+        self._accepting = True
+        logger.info(f"📥 Очередь апдейтов запущена: workers={self.workers}, max_size={self.max_size}, policy={self.shed_policy}")
+
+    def submit(self, chat_key: Any, *args) -> None:
+        """Поставить апдейт в очередь без ожидания. Бросает QueueFullError при переполнении."""
+        if not self._accepting:
+            raise QueueFullError("Queue is not accepting updates")
+
+        shard = self._shards[hash(chat_key) % self.workers]
+
+        if self._pending >= self.max_size:
+            if self.shed_policy == "drop_oldest" and not shard.empty():
+                shard.get_nowait()
+                shard.task_done()
+                self._pending -= 1
+                self.shed += 1
+                logger.warning("🗑️ Очередь апдейтов переполнена: отброшен самый старый апдейт")
+            else:
+                self.rejected += 1
+                raise QueueFullError(f"Update queue is full ({self.max_size})")
+
+        shard.put_nowait(_Job(args))
+        self._pending += 1
+        self.accepted += 1
+
+    async def _worker(self, shard: asyncio.Queue) -> None:
+        while True:
+            job = await shard.get()
+            self._pending -= 1
+            self._in_flight += 1
+            wait = time.monotonic() - job.enqueued_at
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            try:
+                await self.handler(*job.args)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"❌ Ошибка обработки апдейта: {e}")
+            finally:
+                self._in_flight -= 1
+                shard.task_done()
+
+    async def stop(self, timeout: float = 30.0) -> None:
+        """Перестать принимать апдейты, дообработать очередь и остановить воркеров"""
+        self._accepting = False
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(shard.join() for shard in self._shards)),
+                timeout=timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"⏱️ Очередь апдейтов не успела дообработаться за {timeout}s, осталось: {self._pending}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("📥 Очередь апдейтов остановлена")
+
+    def oldest_wait(self) -> float:
+        """Возраст самого старого ожидающего апдейта (секунды)"""
+        now = time.monotonic()
+        heads = [shard._queue[0].enqueued_at for shard in self._shards if not shard.empty()]
+        return now - min(heads) if heads else 0.0
+
+    def get_stats(self) -> dict:
+        started = self.processed + self.failed + self._in_flight
+        return {
+            "depth": self._pending,
+            "in_flight": self._in_flight,
+            "max_size": self.max_size,
+            "workers": self.workers,
+            "accepted": self.accepted,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "shed": self.shed,
+            "avg_wait_ms": round(self._wait_total / started * 1000, 2) if started else 0.0,
+            "max_wait_ms": round(self._wait_max * 1000, 2),
+            "oldest_wait_ms": round(self.oldest_wait() * 1000, 2),
+        }
+
+
+def get_chat_key(update: dict) -> Optional[int]:
+    """Ключ упорядочивания: id чата апдейта (или пользователя, если чата нет)"""
+    for field_name in ("message", "edited_message", "channel_post", "edited_channel_post",
+                       "my_chat_member", "chat_member", "chat_join_request"):
+        obj = update.get(field_name)
+        if obj and "chat" in obj:
+            return obj["chat"]["id"]
+    callback = update.get("callback_query")
+    if callback:
+        message = callback.get("message")
+        if message and "chat" in message:
+            return message["chat"]["id"]
+        return callback["from"]["id"]
+    for field_name in ("inline_query", "chosen_inline_result", "shipping_query", "pre_checkout_query"):
+        obj = update.get(field_name)
+        if obj and "from" in obj:
+            return obj["from"]["id"]
+    return update.get("update_id")
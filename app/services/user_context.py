@@ -0,0 +1,97 @@
+import os
+import logging
+from dataclasses import dataclass
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models.all_models import Lead, UserPreference
+from app.services.invalidation_bus import get_invalidation_bus, USER_PREFERENCE
+from common.ttl_cache import TTLCache
+
+logger = logging.getLogger("user_context")
+
+USER_CONTEXT_TTL = float(os.getenv("USER_CONTEXT_TTL", "600"))
+USER_CONTEXT_MAX_ENTRIES = int(os.getenv("USER_CONTEXT_MAX_ENTRIES", "100000"))
+
+# Язык — настройка пользователя (общая для всех компаний), лид — на пару (компания, пользователь)
+_NO_PREFERENCE = ""
+_lang_cache = TTLCache(max_entries=USER_CONTEXT_MAX_ENTRIES, ttl=USER_CONTEXT_TTL)   # user_id -> язык
+_lead_cache = TTLCache(max_entries=USER_CONTEXT_MAX_ENTRIES, ttl=USER_CONTEXT_TTL)   # (company_id, user_id) -> lead_id
+
+
+@dataclass(frozen=True)
+class UserContext:
+    company_id: int
+    user_id: int
+    lead_id: int
+    lang: Optional[str]   # None — пользователь ещё не выбрал язык
+
+    @property
+    def lang_or_default(self) -> str:
+        return self.lang or "ru"
+
+
+def _create_lead(db: Session, company_id: int, user_id: int, username: str) -> int:
+    lead = Lead(company_id=company_id, telegram_user_id=user_id, contact_info={"username": username}, status="new")
+    db.add(lead)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Параллельный апдейт того же пользователя успел создать лида
+        db.rollback()
+        return db.execute(
+            select(Lead.id).where(Lead.company_id == company_id, Lead.telegram_user_id == user_id)
+        ).scalar_one()
+    return lead.id
+
+
+def resolve_user_context(db: Session, company_id: int, user_id: int, username: str = "") -> UserContext:
+    """
+    Компания + язык + лид за одно обращение к БД (или ни одного при попадании в кэш).
+    Лид создаётся, если его ещё нет.
+    """
+    lang = _lang_cache.get(user_id)
+    lead_id = _lead_cache.get((company_id, user_id))
+
+    if lang is None or lead_id is None:
+        # Оба значения одним запросом через скалярные подзапросы
+        lang_query = select(UserPreference.language_code).where(UserPreference.telegram_user_id == user_id).scalar_subquery()
+        lead_query = select(Lead.id).where(Lead.company_id == company_id, Lead.telegram_user_id == user_id).scalar_subquery()
+        db_lang, db_lead_id = db.execute(select(lang_query, lead_query)).one()
+
+        lang = db_lang or _NO_PREFERENCE
+        _lang_cache.set(user_id, lang)
+        lead_id = db_lead_id or _create_lead(db, company_id, user_id, username)
+        _lead_cache.set((company_id, user_id), lead_id)
+
+    return UserContext(company_id=company_id, user_id=user_id, lead_id=lead_id, lang=lang or None)
+
+
+def set_cached_lang(user_id: int, lang: str) -> None:
+    """Обновить язык в кэше после изменения UserPreference"""
+    _lang_cache.set(user_id, lang)
+
+
+def get_cached_lang(user_id: int) -> Optional[str]:
+    """Язык из кэша без обращения к БД; None — не выбран или не в кэше"""
+    return _lang_cache.get(user_id) or None
+
+
+def invalidate_user_context(user_id: int) -> None:
+    _lang_cache.pop(user_id)
+
+
+def _on_preference_changed(payload) -> None:
+    user_id = payload.get("user_id") if payload else None
+    if user_id is None:
+        _lang_cache.clear()
+    else:
+        invalidate_user_context(user_id)
+
+
+get_invalidation_bus().subscribe(USER_PREFERENCE, _on_preference_changed)
+
+
+def get_user_context_stats() -> dict:
+    return {"lang": _lang_cache.get_stats(), "lead": _lead_cache.get_stats()}
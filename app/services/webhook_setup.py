@@ -0,0 +1,139 @@
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, asdict
+from typing import Callable, List, Optional
+import httpx
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.all_models import CompanyBot
+
+logger = logging.getLogger("webhook_setup")
+
+# Базовый адрес вебхуков; к нему добавляется токен бота (см. /webhook/telegram/{bot_token})
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_URL", "http://joel-incretionary-aileen.ngrok-free.dev/webhook/telegram")
+WEBHOOK_SETUP_CONCURRENCY = int(os.getenv("WEBHOOK_SETUP_CONCURRENCY", "20"))
+WEBHOOK_SETUP_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_SETUP_MAX_ATTEMPTS", "3"))
+
+
+@dataclass(frozen=True)
+class BotWebhookTarget:
+    """Данные бота, нужные для setWebhook (без привязки к сессии БД)"""
+    bot_id: int
+    company_id: int
+    token: str
+    secret: Optional[str]
+
+
+@dataclass
+class WebhookResult:
+    bot_id: int
+    company_id: int
+    ok: bool
+    description: str
+    attempts: int
+    elapsed_ms: float
+
+
+def build_webhook_url(bot_token: str) -> str:
+    return f"{WEBHOOK_BASE_URL.rstrip('/')}/{bot_token}"
+
+
+async def load_webhook_targets(db: AsyncSession, company_ids: Optional[List[int]] = None) -> List[BotWebhookTarget]:
+    """Активные боты (все или только указанных компаний)"""
+    query = select(
+        CompanyBot.id, CompanyBot.company_id, CompanyBot.telegram_bot_token, CompanyBot.webhook_secret
+    ).filter(CompanyBot.is_active == True)
+    if company_ids:
+        query = query.filter(CompanyBot.company_id.in_(company_ids))
+    result = await db.execute(query.order_by(CompanyBot.id))
+    return [BotWebhookTarget(*row) for row in result.all()]
+
+
+async def set_webhook(
+    client: httpx.AsyncClient,
+    target: BotWebhookTarget,
+    drop_pending_updates: bool = True,
+    max_attempts: int = WEBHOOK_SETUP_MAX_ATTEMPTS,
+) -> WebhookResult:
+    """
+    Вызвать setWebhook для одного бота.
+    На 429 ждём retry_after, который вернул Telegram для этого токена, и повторяем.
+    """
+    payload = {"url": build_webhook_url(target.token), "drop_pending_updates": drop_pending_updates}
+    if target.secret:
+        payload["secret_token"] = target.secret
+
+    started = time.monotonic()
+    description = ""
+    ok = False
+    attempt = 0
+    while attempt < max_attempts:
+        attempt += 1
+        try:
+            response = await client.post(f"/bot{target.token}/setWebhook", json=payload)
+            data = response.json()
+        except Exception as e:
+            description = str(e) or type(e).__name__
+            if attempt < max_attempts:
+                await asyncio.sleep(min(2 ** (attempt - 1), 5))
+            continue
+
+        ok = bool(data.get("ok"))
+        description = data.get("description", "")
+        if response.status_code == 429 and attempt < max_attempts:
+            retry_after = data.get("parameters", {}).get("retry_after", 1)
+            logger.warning(f"⏳ setWebhook 429 для бота {target.bot_id}, ждём {retry_after}s")
+            await asyncio.sleep(retry_after)
+            continue
+        break
+
+    return WebhookResult(
+        bot_id=target.bot_id,
+        company_id=target.company_id,
+        ok=ok,
+        description=description,
+        attempts=attempt,
+        elapsed_ms=round((time.monotonic() - started) * 1000, 1),
+    )
+
+
+async def register_webhooks(
+    client: httpx.AsyncClient,
+    targets: List[BotWebhookTarget],
+    concurrency: int = WEBHOOK_SETUP_CONCURRENCY,
+    drop_pending_updates: bool = False,
+    on_result: Optional[Callable[[WebhookResult, int, int], None]] = None,
+) -> dict:
+    """
+    Перерегистрация вебхуков для набора ботов с ограниченной параллельностью.
+    on_result(result, done, total) вызывается по мере завершения — для прогресса.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    total = len(targets)
+    done = 0
+    results: List[WebhookResult] = []
+    started = time.monotonic()
+
+    async def run(target: BotWebhookTarget) -> None:
+        nonlocal done
+        async with semaphore:
+            result = await set_webhook(client, target, drop_pending_updates=drop_pending_updates)
+        done += 1
+        results.append(result)
+        status = "✅" if result.ok else "❌"
+        logger.info(f"{status} [{done}/{total}] bot={result.bot_id} company={result.company_id} {result.description}")
+        if on_result:
+            on_result(result, done, total)
+
+    await asyncio.gather(*(run(target) for target in targets))
+
+    failed = [asdict(r) for r in results if not r.ok]
+    return {
+        "total": total,
+        "succeeded": total - len(failed),
+        "failed": len(failed),
+        "elapsed_s": round(time.monotonic() - started, 2),
+        "failures": failed,
+    }
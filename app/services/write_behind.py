@@ -0,0 +1,149 @@
+import os
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple, Type
+from sqlalchemy import insert
+from app.db.session import AsyncSessionLocal
+
+logger = logging.getLogger("write_behind")
+
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "1.0"))
+WRITE_BEHIND_MAX_BUFFER = int(os.getenv("WRITE_BEHIND_MAX_BUFFER", "20000"))
+# drop_oldest — при переполнении теряем самые старые строки; block — put() ждёт места в буфере
+WRITE_BEHIND_SPILL_POLICY = os.getenv("WRITE_BEHIND_SPILL_POLICY", "drop_oldest")
+WRITE_BEHIND_DRAIN_TIMEOUT = float(os.getenv("WRITE_BEHIND_DRAIN_TIMEOUT", "10"))
+
+
+class WriteBehindBuffer:
+    """
+    Отложенная запись строк (Interaction, Dialog и т.п.) пачками.
+
+    put() только кладёт строку в буфер; фоновая задача сбрасывает его многострочными INSERT,
+    когда набралось batch_size строк или прошло flush_interval секунд. При остановке буфер
+    дописывается до конца. Если пачка не прошла целиком, строки пишутся по одной, чтобы
+    одна битая строка не тянула за собой остальные.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+        max_buffer: int = WRITE_BEHIND_MAX_BUFFER,
+        spill_policy: str = WRITE_BEHIND_SPILL_POLICY,
+    ):
+        if spill_policy not in ("drop_oldest", "block"):
+            raise ValueError(f"Неизвестная политика переполнения: {spill_policy}")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.spill_policy = spill_policy
+        self._buffer: Deque[Tuple[Type, Dict[str, Any]]] = deque()
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush_ms = 0.0
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._closing = False
+            self._task = asyncio.create_task(self._run(), name="write-behind")
+
+    async def put(self, model: Type, row: Dict[str, Any]) -> None:
+        """Поставить строку в очередь на запись; не ждёт коммита"""
+        self.start()
+        if len(self._buffer) >= self.max_buffer:
+            if self.spill_policy == "block":
+                while len(self._buffer) >= self.max_buffer:
+                    self._space.clear()
+                    self._wakeup.set()
+                    await self._space.wait()
+            else:
+                self._buffer.popleft()
+                self.dropped += 1
+                if self.dropped % 100 == 1:
+                    logger.warning(f"⚠️ Буфер записи переполнен, старые строки отбрасываются (всего {self.dropped})")
+        self._buffer.append((model, row))
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self._drain()
+        # stop() мог выставить _closing ещё до первого запуска задачи — дописываем буфер в любом случае
+        await self._drain()
+
+    async def flush(self) -> None:
+        """Записать одну пачку (до batch_size строк)"""
+        batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+        if not batch:
+            return
+        self._space.set()
+
+        rows_by_model: Dict[Type, List[Dict[str, Any]]] = {}
+        for model, row in batch:
+            rows_by_model.setdefault(model, []).append(row)
+
+        started = time.perf_counter()
+        for model, rows in rows_by_model.items():
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(insert(model), rows)
+                    await db.commit()
+                self.written += len(rows)
+            except Exception as e:
+                logger.error(f"❌ Пачка {model.__tablename__} ({len(rows)} строк) не записана: {e}, пишем по одной")
+                await self._write_one_by_one(model, rows)
+        self.batches += 1
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+    async def _write_one_by_one(self, model: Type, rows: List[Dict[str, Any]]) -> None:
+        async with AsyncSessionLocal() as db:
+            for row in rows:
+                try:
+                    await db.execute(insert(model), [row])
+                    await db.commit()
+                    self.written += 1
+                except Exception as e:
+                    await db.rollback()
+                    self.failed += 1
+                    logger.error(f"❌ Строка {model.__tablename__} отброшена: {e}")
+
+    async def stop(self, timeout: float = WRITE_BEHIND_DRAIN_TIMEOUT) -> None:
+        """Дописать буфер и остановить фоновую задачу"""
+        self._closing = True
+        self._wakeup.set()
+        task, self._task = self._task, None
+        try:
+            # Фоновая задача после цикла всегда дописывает буфер; без неё (не создавалась) — дописываем сами
+            await asyncio.wait_for(task if task else self._drain(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"⏱️ Буфер записи не дописан за {timeout}s, потеряно строк: {len(self._buffer)}")
+        logger.info(f"💾 Буфер записи остановлен: {self.get_stats()}")
+
+    async def _drain(self) -> None:
+        while self._buffer:
+            await self.flush()
+
+    def get_stats(self) -> dict:
+        return {
+            "buffered": len(self._buffer),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_flush_ms": round(self.last_flush_ms, 1),
+            "spill_policy": self.spill_policy,
+        }
@@ -2,17 +2,32 @@
 import sys
 
 import os, logging, asyncio
+from io import BytesIO
+from typing import Awaitable, Union
 from aiogram import Bot, Dispatcher, F
 from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.filters import Command
-from openai import OpenAI
+from openai import AsyncOpenAI
 from app.db.session import get_db
-from app.services.company_cache import get_company_id_cached
-from common.api_retry import call_with_retry
-from common.rate_limiter import RateLimiterMiddleware  # Добавлен импорт
+from app.services.company_cache import get_company_id_cached, get_company_settings_cached
+from app.services.answer_cache import AnswerCache, prompt_version
+from app.services.user_context import UserContext, set_cached_lang, get_user_context_stats
+from app.services.write_behind import WriteBehindBuffer
+from app.services.conversation_memory import load_memory, build_messages, remember_turn, is_context_dependent
+from app.services.retrieval import CompanyRetriever, create_embedder
+from app.services.catalog_index import get_catalog, parse_price_filter
+from app.services.invalidation_bus import get_invalidation_bus, COMPANY, PROMPTS, PRODUCTS, RETRIEVAL, USER_PREFERENCE
+from common.api_retry import call_with_retry, get_retry_stats
+from common.concurrency import get_governor_stats
+from common.ttl_cache import TTLCache
+from common.rate_limiter import create_rate_limiter
+from common.dedup import create_deduplicator
+from bots.sales_bot.middlewares import DedupMiddleware, UserContextMiddleware
+from bots.sales_bot.streaming import StreamingReply
+from common.llm_router import create_router_from_env
 from sqlalchemy.orm import Session
-from app.models.all_models import Company, Lead, UserPreference, Interaction, UIText
-from app.services.translation_service import t
+from app.models.all_models import Company, Lead, UserPreference, Interaction, Dialog, UIText
+from app.services.translation_service import t, find_text_key, load_translations
 from datetime import datetime
 
 BOT_TOKEN  = os.getenv("TELEGRAM_BOT_TOKEN")
@@ -29,19 +44,37 @@ LANGUAGES_CONFIG = [
     {"name": "Українська", "code": "uk"}
 ]
 
+LLM_MODEL = "openai/gpt-oss-120b"
+# Потоковый ответ: заглушка "думаю..." дописывается правками по мере генерации
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "true").lower() in ("1", "true", "yes")
+# Как часто процесс бота пишет свою статистику в лог (секунды)
+BOT_STATS_INTERVAL = float(os.getenv("BOT_STATS_INTERVAL", "300"))
+
 LANG_ORDER = [lang["name"] for lang in LANGUAGES_CONFIG]
 LANG_MAP = {lang["name"]: lang["code"] for lang in LANGUAGES_CONFIG}
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
-bot = Bot(token=BOT_TOKEN)
 dp  = Dispatcher()
-gpt = OpenAI(base_url="https://openrouter.ai/api/v1", api_key=OPENROUTER)
-whisper_client = OpenAI(api_key=OPENAI_API_KEY, base_url="https://api.openai.com/v1")
+# Async клиенты: число запросов в полёте задаёт governor провайдера, а не пул потоков
+# Endpoint LLM (провайдер + модель): по умолчанию один OpenRouter, список — в LLM_ENDPOINTS (JSON).
+# Роутер выбирает самый быстрый здоровый и хеджирует медленные запросы
+llm_router = create_router_from_env([
+    {"name": "openrouter-gpt-oss", "model": LLM_MODEL, "provider": "openrouter",
+     "base_url": "https://openrouter.ai/api/v1", "api_key_env": "OPENROUTER_API_KEY"},
+])
+whisper_client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url="https://api.openai.com/v1")
 
-# === ДОБАВЛЕНО: Подключение Rate Limiter Middleware ===
-rate_limiter = RateLimiterMiddleware(max_requests=15, window_seconds=60)
+# Лимит запросов на пользователя; RATE_LIMIT_BACKEND=redis делает его общим для всех реплик.
+# Стоит первым: отброшенное сообщение не открывает сессию БД и не создаёт лида
+rate_limiter = create_rate_limiter()
 dp.message.middleware(rate_limiter)
-# =======================================================
+
+# Сессия БД и контекст пользователя (язык, лид) — один раз на апдейт, после rate limiter
+dp.message.middleware(UserContextMiddleware())
+
+# Повторные доставки апдейтов отбрасываются до любых хендлеров
+update_dedup = create_deduplicator()
+dp.update.outer_middleware(DedupMiddleware(update_dedup))
 
 def lang_kb(db: Session):
     return ReplyKeyboardMarkup(keyboard=[[KeyboardButton(text=l)] for l in LANG_ORDER], resize_keyboard=True)
@@ -56,191 +89,300 @@ def main_kb(lang: str, db: Session):
 async def show_lang_menu(message: Message, db: Session):
     await message.answer("Выберите язык / Select language:", reply_markup=lang_kb(db))
 
-def get_or_create_lead(db: Session, uid: int, username: str, company_id: int):
-    lead = db.query(Lead).filter(Lead.telegram_user_id == uid, Lead.company_id == company_id).first()
-    if not lead:
-        lead = Lead(company_id=company_id, telegram_user_id=uid, contact_info={"username": username}, status="new")
-        db.add(lead); db.commit(); db.refresh(lead)
-    return lead
+# История пишется пачками в фоне: ответ пользователю не ждёт коммита
+interaction_writer = WriteBehindBuffer()
 
-def save_interaction(db: Session, lead_id: int, content: str, outcome: str, msg_type: str = "text", company_id: int = None):
-    db.add(Interaction(company_id=company_id, lead_id=lead_id, type=msg_type, content=content, outcome=outcome))
-    db.commit()
+async def save_interaction(lead_id: int, content: str, outcome: str, msg_type: str = "text", company_id: int = None, lang: str = None):
+    now = datetime.utcnow()
+    await interaction_writer.put(Interaction, dict(
+        company_id=company_id, lead_id=lead_id, type=msg_type, content=content, outcome=outcome, created_at=now
+    ))
+    await interaction_writer.put(Dialog, dict(
+        company_id=company_id, lead_id=lead_id, message_type=msg_type, user_message=content,
+        ai_response=outcome, language=lang, created_at=now
+    ))
 
-def get_lang(update: Message, db: Session):
-    pref = db.query(UserPreference).filter_by(telegram_user_id=update.from_user.id).first()
-    return pref.language_code if pref else "ru"
+async def generate_answer(placeholder: Union[Message, Awaitable[Message]], messages: list, description: str):
+    """Ответ LLM в сообщение-заглушку: потоково (правками) или целиком одной правкой"""
+    reply = StreamingReply(placeholder)
+    
+    async def call_gpt():
+        if STREAM_REPLIES:
+            # Поток читаем внутри попытки: обрыв посреди генерации повторяется целиком
+            return await llm_router.stream(messages, on_text=reply.update, max_tokens=500, temperature=0.7)
+        return await llm_router.complete(messages, max_tokens=500, temperature=0.7)
+    
+    # Слоты провайдеров (governor) занимает сам роутер — на каждый endpoint отдельно
+    answer = await call_with_retry(
+        call_gpt,
+        max_attempts=3,
+        description=description
+    )
+    
+    if not answer:
+        logging.error("❌ GPT не вернул ответ после всех попыток")
+        return None
+    
+    await reply.finish(answer)
+    return answer
 
-@dp.message(Command("start"))
-async def start_cmd(m: Message):
-    db = next(get_db())
+# Кэш типовых ответов ("цена?", "доставка?") на процесс; компания может отключить его
+# через Company.settings = {"answer_cache": false}
+answer_cache = AnswerCache()
+invalidation_bus = get_invalidation_bus()
+
+
+def _invalidate_answers(payload) -> None:
+    """Компания, её промпты или каталог изменены в API — её готовые ответы больше не годятся"""
+    answer_cache.invalidate_company(payload.get("company_id") if payload else None)
+
+
+for _topic in (COMPANY, PROMPTS, PRODUCTS):
+    invalidation_bus.subscribe(_topic, _invalidate_answers)
+
+async def answer_question(placeholder: Union[Message, Awaitable[Message]], db: Session, company_id: int, lang: str, question: str, messages: list, description: str, cacheable: bool = True):
+    """
+    Ответ на вопрос через кэш ответов компании (с объединением одинаковых запросов).
+    cacheable=False — вопрос опирается на историю диалога ("а доставка сколько?") и в кэш не идёт;
+    самостоятельные вопросы кэшируются по самому вопросу, даже если история есть.
+    """
+    if not cacheable or not get_company_settings_cached(db, company_id).get("answer_cache", True):
+        return await generate_answer(placeholder, messages, description)
+    
+    key = answer_cache.make_key(company_id, lang, prompt_version(messages[0]["content"]), question)
+    answer, source = await answer_cache.get_or_compute(
+        key,
+        lambda: generate_answer(placeholder, messages, description)
+    )
+    # При промахе ответ уже дописан в заглушку потоком, в остальных случаях — одной правкой
+    if answer and source != "miss":
+        logging.info(f"💾 Ответ из кэша ({source}): company_id={company_id}")
+        await StreamingReply(placeholder).finish(answer)
+    return answer
+
+# Знания компании (документы, промпты, товары): в промпт идут только самые близкие к вопросу куски
+retriever = CompanyRetriever(create_embedder())
+invalidation_bus.subscribe(RETRIEVAL, lambda payload: retriever.invalidate(payload.get("company_id") if payload else None))
+
+CATALOG_PROMPT_ITEMS = int(os.getenv("CATALOG_PROMPT_ITEMS", "5"))
+
+async def find_products(company_id: int, question: str) -> list:
+    """Короткий список подходящих товаров каталога для промпта"""
+    # Загрузка и дочитывание каталога из БД идут в потоке, event loop не блокируется
+    catalog = await get_catalog(company_id)
+    min_price, max_price = parse_price_filter(question)
+    items = catalog.search(question, min_price=min_price, max_price=max_price, limit=CATALOG_PROMPT_ITEMS)
+    return [item.short_line() for item in items]
+
+async def dialog_messages(db: Session, user_ctx: UserContext, lang: str, question: str):
+    """Промпт с памятью диалога и знаниями компании в пределах бюджета токенов: (messages, есть ли история)"""
+    system = f"Ты – консультант компании. Отвечай кратко и дружелюбно. Always respond in {lang} language."
     try:
-        company_id = get_company_id_cached(db, BOT_TOKEN)
-        get_or_create_lead(db, m.from_user.id, m.from_user.username or "", company_id)
-        await show_lang_menu(m, db)
-    finally:
-        db.close()
+        chunks = await asyncio.to_thread(retriever.search, user_ctx.company_id, question)
+    except Exception as e:
+        logging.error(f"❌ Поиск по знаниям компании не удался: {e}")
+        chunks = []
+    try:
+        products = await find_products(user_ctx.company_id, question)
+    except Exception as e:
+        logging.error(f"❌ Поиск по каталогу не удался: {e}")
+        products = []
+    # Знания и товары урезаются под бюджет в build_messages, раньше истории диалога
+    context = [
+        ("Информация компании (используй, если относится к вопросу):", [chunk.text for chunk in chunks]),
+        ("Товары из каталога, подходящие под вопрос:", products),
+    ]
+    memory = await load_memory(user_ctx.company_id, user_ctx.user_id)
+    return build_messages(system, memory, question, context)
+
+# Хендлеры получают db и user_ctx от UserContextMiddleware (лид к этому моменту уже создан)
+@dp.message(Command("start"))
+async def start_cmd(m: Message, db: Session):
+    await show_lang_menu(m, db)
 
 @dp.message(F.text.in_(LANG_ORDER))
-async def set_lang(m: Message):
-    db = next(get_db())
-    try:
-        lang_name = m.text
-        lang_code = LANG_MAP.get(lang_name, "ru")
-        logging.info(f"🌐 Язык изменен: {lang_name} -> {lang_code}")
-        pref = db.query(UserPreference).filter_by(telegram_user_id=m.from_user.id).first()
-        if not pref:
-            pref = UserPreference(telegram_user_id=m.from_user.id, language_code=lang_code)
-            db.add(pref)
-        else:
-            pref.language_code = lang_code
-        db.commit()
-        await m.answer(t("welcome", lang_code, db), reply_markup=main_kb(lang_code, db))
-    finally:
-        db.close()
+async def set_lang(m: Message, db: Session):
+    lang_name = m.text
+    lang_code = LANG_MAP.get(lang_name, "ru")
+    logging.info(f"🌐 Язык изменен: {lang_name} -> {lang_code}")
+    pref = db.query(UserPreference).filter_by(telegram_user_id=m.from_user.id).first()
+    if not pref:
+        pref = UserPreference(telegram_user_id=m.from_user.id, language_code=lang_code)
+        db.add(pref)
+    else:
+        pref.language_code = lang_code
+    db.commit()
+    # Остальные реплики сбрасывают язык из кэша; в этом процессе он сразу записывается заново
+    await invalidation_bus.publish(USER_PREFERENCE, user_id=m.from_user.id)
+    set_cached_lang(m.from_user.id, lang_code)
+    await m.answer(t("welcome", lang_code, db), reply_markup=main_kb(lang_code, db))
 
 @dp.message(F.text)
-async def router(m: Message):
-    db = next(get_db())
-    try:
-        company_id = get_company_id_cached(db, BOT_TOKEN)
-        lang = get_lang(m, db)
-        text = m.text
-        if text == t("contact", lang, db): 
-            await m.answer(t("contact_message", lang, db))
-        elif text == t("ask", lang, db): 
-            await m.answer(t("ask_message", lang, db))
-        elif text == t("change", lang, db): 
-            await show_lang_menu(m, db)
-        elif text in LANG_MAP: 
-            await set_lang(m, db)
-        else: 
-            await text_question(m, db, company_id)
-    finally:
-        db.close()
+async def router(m: Message, db: Session, user_ctx: UserContext):
+    lang = user_ctx.lang_or_default
+    text = m.text
+    # Какая кнопка нажата — одним обращением к обратному индексу переводов (на любом языке меню)
+    button = find_text_key(text, db)
+    button_key = button[0] if button else None
+    if button_key == "contact":
+        await m.answer(t("contact_message", lang, db))
+    elif button_key == "ask":
+        await m.answer(t("ask_message", lang, db))
+    elif button_key == "change":
+        await show_lang_menu(m, db)
+    elif text in LANG_MAP: 
+        await set_lang(m, db)
+    else: 
+        await text_question(m, db, user_ctx)
 
-async def text_question(m: Message, db: Session, company_id: int):
-    lead = get_or_create_lead(db, m.from_user.id, m.from_user.username or "", company_id)
-    lang = get_lang(m, db)
+async def text_question(m: Message, db: Session, user_ctx: UserContext):
+    company_id = user_ctx.company_id
+    lang = user_ctx.lang_or_default
     await m.chat.do("typing")
-    await m.answer(t("think", lang, db))
+    placeholder = await m.answer(t("think", lang, db))
     
-    system = f"Ты – консультант компании. Отвечай кратко и дружелюбно. Always respond in {lang} language."
+    messages, has_history = await dialog_messages(db, user_ctx, lang, m.text)
     
-    def call_gpt():
-        return gpt.chat.completions.create(
-            model="openai/gpt-oss-120b", 
-            messages=[
-                {"role": "system", "content": system}, 
-                {"role": "user", "content": m.text}
-            ], 
-            max_tokens=500, 
-            temperature=0.7
-        )
-    
-    resp = await call_with_retry(
-        call_gpt,
-        max_attempts=3,
-        description="GPT текстовый запрос"
+    answer = await answer_question(
+        placeholder,
+        db,
+        company_id,
+        lang,
+        m.text,
+        messages,
+        "GPT текстовый запрос",
+        cacheable=not (has_history and is_context_dependent(m.text))
     )
     
-    if not resp:
-        logging.error("❌ GPT не вернул ответ после всех попыток")
+    if not answer:
         await m.answer(t("error", lang, db))
         return
     
-    answer = resp.choices[0].message.content.strip()
+    await remember_turn(company_id, user_ctx.user_id, m.text, answer)
+    await save_interaction(user_ctx.lead_id, m.text, answer, "text", company_id, lang)
+
+# Распознанный текст голосовых по file_unique_id: пересланные и повторно отправленные
+# голосовые не уходят в Whisper второй раз
+VOICE_CACHE_TTL = float(os.getenv("VOICE_CACHE_TTL", "86400"))
+VOICE_CACHE_MAX_ENTRIES = int(os.getenv("VOICE_CACHE_MAX_ENTRIES", "5000"))
+transcription_cache = TTLCache(max_entries=VOICE_CACHE_MAX_ENTRIES, ttl=VOICE_CACHE_TTL)
+
+async def transcribe_voice(m: Message, lang: str):
+    """Текст голосового: из кэша или загрузка в память + Whisper (без временных файлов)"""
+    key = (m.voice.file_unique_id, lang)
+    text = transcription_cache.get(key)
+    if text is not None:
+        logging.info(f"💾 Голосовое уже распознано: {m.voice.file_unique_id}")
+        return text
+    
+    audio = await m.bot.download(m.voice, destination=BytesIO())
+    audio_bytes = audio.getvalue()
+    logging.info(f"📤 OpenAI Whisper запрос: {len(audio_bytes)} байт, язык={lang}")
     
-    get_or_create_lead(db, m.from_user.id, m.from_user.username or "", company_id)
-    save_interaction(db, lead.id, m.text, answer, "text", company_id)
-    await m.answer(answer)
+    async def call_whisper():
+        return await whisper_client.audio.transcriptions.create(
+            file=("voice.ogg", audio_bytes),
+            model="whisper-1",
+            language=lang
+        )
+    
+    transcription = await call_with_retry(
+        call_whisper,
+        max_attempts=3,
+        description="Whisper STT",
+        provider="openai"
+    )
+    if not transcription:
+        return None
+    transcription_cache.set(key, transcription.text)
+    return transcription.text
 
 @dp.message(F.voice)
-async def voice_question(m: Message):
-    db = next(get_db())
-    voice_path = f"/tmp/voice_{m.from_user.id}.ogg"
+async def voice_question(m: Message, db: Session, user_ctx: UserContext):
+    company_id = user_ctx.company_id
+    lang = user_ctx.lang_or_default
     try:
-        company_id = get_company_id_cached(db, BOT_TOKEN)
-        pref = db.query(UserPreference).filter_by(telegram_user_id=m.from_user.id).first()
-        if not pref:
+        if user_ctx.lang is None:
             await show_lang_menu(m, db)
             return
-        lead = get_or_create_lead(db, m.from_user.id, m.from_user.username or "", company_id)
-        lang = pref.language_code
         await m.chat.do("typing")
-        await m.answer(t("think", lang, db))
-        
-        file = await bot.get_file(m.voice.file_id)
-        await bot.download_file(file.file_path, voice_path)
-        
-        logging.info(f"📤 OpenAI Whisper запрос: файл={voice_path}, язык={lang}")
+        placeholder = await m.answer(t("think", lang, db))
         
-        def call_whisper():
-            with open(voice_path, "rb") as audio_file:
-                return whisper_client.audio.transcriptions.create(
-                    file=audio_file,
-                    model="whisper-1",
-                    language=lang
-                )
-        
-        transcription = await call_with_retry(
-            call_whisper,
-            max_attempts=3,
-            description="Whisper STT"
-        )
+        text = await transcribe_voice(m, lang)
         
-        if not transcription:
+        if not text:
             logging.error("❌ Whisper не вернул результат после всех попыток")
             await m.answer(t("retry", lang, db))
             return
         
-        text = transcription.text
-        
         logging.info(f"📝 Распознанный текст: {text}")
-        await m.answer(f"{t('said', lang, db)} {text}")
-        await m.chat.do("typing")
-        
-        system = f"Ты – консультант компании. Отвечай кратко и дружелюбно. Always respond in {lang} language."
+        # Заглушка превращается в "Вы сказали", ответ пишется в новую заглушку под ней.
+        # Обе отправки идут параллельно с запросом к LLM: новая заглушка нужна только к первому чанку
+        echo = asyncio.create_task(placeholder.edit_text(f"{t('said', lang, db)} {text}"))
+        answer_placeholder = asyncio.create_task(m.answer(t("think", lang, db)))
         
-        def call_gpt():
-            return gpt.chat.completions.create(
-                model="openai/gpt-oss-120b", 
-                messages=[
-                    {"role": "system", "content": system}, 
-                    {"role": "user", "content": text}
-                ], 
-                max_tokens=500, 
-                temperature=0.7
-            )
+        messages, has_history = await dialog_messages(db, user_ctx, lang, text)
         
-        resp = await call_with_retry(
-            call_gpt,
-            max_attempts=3,
-            description="GPT голосовой запрос"
+        answer = await answer_question(
+            answer_placeholder,
+            db,
+            company_id,
+            lang,
+            text,
+            messages,
+            "GPT голосовой запрос",
+            cacheable=not (has_history and is_context_dependent(text))
         )
+        await asyncio.gather(echo, answer_placeholder, return_exceptions=True)
         
-        if not resp:
-            logging.error("❌ GPT не вернул ответ после всех попыток")
+        if not answer:
             await m.answer(t("error", lang, db))
             return
         
-        answer = resp.choices[0].message.content.strip()
-        
-        save_interaction(db, lead.id, text, answer, msg_type="voice", company_id=company_id)
-        await m.answer(answer)
+        await remember_turn(company_id, user_ctx.user_id, text, answer)
+        await save_interaction(user_ctx.lead_id, text, answer, msg_type="voice", company_id=company_id, lang=lang)
         
     except Exception as e:
         logging.error(f"Voice processing failed: {e}")
-        lang = pref.language_code if 'pref' in locals() and pref else 'ru'
         await m.answer(t("retry", lang, db))
-    finally:
-        db.close()
-        if os.path.exists(voice_path):
-            os.remove(voice_path)
+
+def get_bot_stats() -> dict:
+    """Счётчики процесса бота: вызовы LLM и внешних API идут только здесь, а не в процессе API"""
+    return {
+        "governors": get_governor_stats(),
+        # Повторы вызовов OpenAI / Whisper и состояние предохранителей (в т.ч. endpoint LLM)
+        "retries": get_retry_stats(),
+        "rate_limiter": rate_limiter.get_stats(),
+        "answer_cache": answer_cache.get_stats(),
+        # Попадания в кэши языка и лидов: промах — обращение к БД
+        "user_context": get_user_context_stats(),
+    }
+
+async def log_bot_stats_periodically():
+    while True:
+        await asyncio.sleep(BOT_STATS_INTERVAL)
+        logging.info(f"📊 Статистика бота: {get_bot_stats()}")
 
 async def main():
+    # Один бот на процесс (токен из окружения); для многих ботов см. bots/sales_bot/runner.py
+    bot = Bot(token=BOT_TOKEN)
+    db = next(get_db())
+    try:
+        company_id = get_company_id_cached(db, BOT_TOKEN)
+        load_translations(db)
+    finally:
+        db.close()
     await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    await invalidation_bus.start()
+    stats_task = asyncio.create_task(log_bot_stats_periodically())
+    # company_id попадает в данные каждого апдейта и приходит в хендлеры аргументом
+    try:
+        await dp.start_polling(bot, company_id=company_id)
+    finally:
+        stats_task.cancel()
+        await interaction_writer.stop()
+        await rate_limiter.close()
+        await invalidation_bus.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
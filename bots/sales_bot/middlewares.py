@@ -0,0 +1,39 @@
+from aiogram import BaseMiddleware
+from aiogram.types import Message, Update
+from app.db.session import SessionLocal
+from app.services.user_context import resolve_user_context
+from common.dedup import UpdateDeduplicator, get_bot_id
+
+
+class DedupMiddleware(BaseMiddleware):
+    """Отбрасывает повторно доставленные апдейты до хендлеров и LLM"""
+
+    def __init__(self, dedup: UpdateDeduplicator):
+        self.dedup = dedup
+        super().__init__()
+
+    async def __call__(self, handler, event: Update, data: dict):
+        bot = data["bot"]
+        if await self.dedup.is_duplicate(get_bot_id(bot.token), event.update_id):
+            return None
+        return await handler(event, data)
+
+
+class UserContextMiddleware(BaseMiddleware):
+    """
+    Одна сессия БД и один контекст пользователя (язык, лид) на апдейт.
+    Хендлеры получают их аргументами db и user_ctx; при попадании в кэш БД не трогается вовсе.
+    """
+
+    async def __call__(self, handler, event: Message, data: dict):
+        company_id = data.get("company_id")
+        if company_id is None or event.from_user is None:
+            return await handler(event, data)
+
+        db = SessionLocal()
+        try:
+            data["db"] = db
+            data["user_ctx"] = resolve_user_context(db, company_id, event.from_user.id, event.from_user.username or "")
+            return await handler(event, data)
+        finally:
+            db.close()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Мультитенантный запуск: один процесс обслуживает много ботов компаний (CompanyBot).
+
+Все боты работают через общий Dispatcher из bots.sales_bot.bot; company_id каждого апдейта
+передаётся в хендлеры через данные апдейта. Список активных ботов периодически
+перечитывается из БД: новые боты подключаются, деактивированные — отключаются без рестарта.
+
+Шардирование по процессам: RUNNER_SHARD_COUNT процессов, у каждого свой RUNNER_SHARD_INDEX.
+
+    python -m bots.sales_bot.runner
+"""
+import os
+import asyncio
+import logging
+from typing import Dict, Optional
+from aiogram import Bot, Dispatcher
+from aiogram.exceptions import TelegramUnauthorizedError, TelegramConflictError, TelegramRetryAfter
+from sqlalchemy import select
+from app.db.session import AsyncSessionLocal, async_engine
+from app.models.all_models import CompanyBot
+from app.services.update_queue import UpdateQueue, QueueFullError
+from app.services.translation_service import get_snapshot
+from bots.sales_bot.bot import dp, interaction_writer, rate_limiter, invalidation_bus, log_bot_stats_periodically
+
+logger = logging.getLogger("bot_runner")
+
+RUNNER_REFRESH_INTERVAL = float(os.getenv("RUNNER_REFRESH_INTERVAL", "30"))
+RUNNER_POLL_TIMEOUT = int(os.getenv("RUNNER_POLL_TIMEOUT", "30"))
+RUNNER_SHARD_INDEX = int(os.getenv("RUNNER_SHARD_INDEX", "0"))
+RUNNER_SHARD_COUNT = int(os.getenv("RUNNER_SHARD_COUNT", "1"))
+# Обработка апдейтов всех ботов процесса: фиксированный пул воркеров, порядок внутри чата сохраняется
+RUNNER_WORKERS = int(os.getenv("RUNNER_WORKERS", "32"))
+RUNNER_QUEUE_SIZE = int(os.getenv("RUNNER_QUEUE_SIZE", "2000"))
+RUNNER_QUEUE_FULL_PAUSE = float(os.getenv("RUNNER_QUEUE_FULL_PAUSE", "1"))
+
+
+class TenantBot:
+    """Бот одной компании и его цикл long polling"""
+
+    def __init__(self, token: str, company_id: int):
+        self.token = token
+        self.company_id = company_id
+        self.bot = Bot(token=token)
+        self.task: Optional[asyncio.Task] = None
+        # Первый запуск polling в этом процессе (вебхук снимается только тогда)
+        self.first_start = True
+
+
+def _chat_id(update) -> Optional[int]:
+    """Чат апдейта (или пользователь, если чата нет) — ключ упорядочивания в очереди"""
+    try:
+        event = update.event
+    except Exception:
+        return update.update_id
+    chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    return user.id if user is not None else update.update_id
+
+
+class MultiBotRunner:
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        refresh_interval: float = RUNNER_REFRESH_INTERVAL,
+        shard_index: int = RUNNER_SHARD_INDEX,
+        shard_count: int = RUNNER_SHARD_COUNT,
+    ):
+        self.dp = dispatcher
+        self.refresh_interval = refresh_interval
+        self.shard_index = shard_index
+        self.shard_count = max(1, shard_count)
+        self._tenants: Dict[str, TenantBot] = {}
+        self.updates = UpdateQueue(self._handle, workers=RUNNER_WORKERS, max_size=RUNNER_QUEUE_SIZE)
+
+    def _in_shard(self, bot_id: int) -> bool:
+        return bot_id % self.shard_count == self.shard_index
+
+    async def load_active_bots(self) -> Dict[str, int]:
+        """token -> company_id для активных ботов этого шарда"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(CompanyBot.id, CompanyBot.telegram_bot_token, CompanyBot.company_id)
+                .filter(CompanyBot.is_active == True)
+            )
+            return {token: company_id for bot_id, token, company_id in result.all() if self._in_shard(bot_id)}
+
+    async def refresh(self) -> None:
+        """Привести набор запущенных ботов к активным записям в БД"""
+        desired = await self.load_active_bots()
+
+        for token in [token for token in self._tenants if token not in desired]:
+            await self._stop_tenant(token)
+
+        for token, company_id in desired.items():
+            tenant = self._tenants.get(token)
+            if tenant is None:
+                tenant = TenantBot(token, company_id)
+                self._tenants[token] = tenant
+                self._start_polling(tenant)
+                logger.info(f"➕ Бот подключён: company_id={company_id}")
+                continue
+            if tenant.company_id != company_id:
+                tenant.company_id = company_id
+                logger.info(f"🔄 Бот переназначен: company_id={company_id}")
+            if tenant.task is None or tenant.task.done():
+                # Polling завершился (токен отозван, конфликт) — пробуем снова раз в refresh;
+                # если боту тем временем настроили вебхук, _poll сразу выйдет, ничего не трогая
+                self._start_polling(tenant)
+
+    def _start_polling(self, tenant: TenantBot) -> None:
+        tenant.task = asyncio.create_task(self._poll(tenant), name=f"polling-{tenant.company_id}")
+
+    async def _stop_tenant(self, token: str) -> None:
+        tenant = self._tenants.pop(token, None)
+        if tenant is None:
+            return
+        if tenant.task:
+            tenant.task.cancel()
+            await asyncio.gather(tenant.task, return_exceptions=True)
+        await tenant.bot.session.close()
+        logger.info(f"➖ Бот отключён: company_id={tenant.company_id}")
+
+    async def _poll(self, tenant: TenantBot) -> None:
+        bot = tenant.bot
+        allowed_updates = self.dp.resolve_used_update_types()
+        offset = None
+        backoff = 1.0
+        try:
+            if tenant.first_start:
+                # Ожидающие апдейты не сбрасываем: их заберёт первый же getUpdates
+                await bot.delete_webhook(drop_pending_updates=False)
+                tenant.first_start = False
+            else:
+                info = await bot.get_webhook_info()
+                if info.url:
+                    # Бот переведён на вебхуки (см. /api/company-bots/setup-webhooks) — polling ему не нужен
+                    logger.info(f"🔗 company_id={tenant.company_id} работает через вебхук, polling не перезапускаем")
+                    return
+                logger.info(f"🔁 Polling перезапущен: company_id={tenant.company_id}")
+            while True:
+                try:
+                    updates = await bot.get_updates(
+                        offset=offset, timeout=RUNNER_POLL_TIMEOUT, allowed_updates=allowed_updates
+                    )
+                    backoff = 1.0
+                except TelegramRetryAfter as e:
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except (TelegramUnauthorizedError, TelegramConflictError) as e:
+                    # Токен отозван или бот опрашивается кем-то ещё — до следующего refresh не трогаем
+                    logger.error(f"❌ Polling остановлен: company_id={tenant.company_id}: {e}")
+                    return
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"⚠️ Ошибка polling company_id={tenant.company_id}: {e}, повтор через {backoff:.0f}s")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 60.0)
+                    continue
+
+                for update in updates:
+                    try:
+                        self.updates.submit((tenant.token, _chat_id(update)), tenant, update)
+                    except QueueFullError:
+                        # Очередь полна: offset не сдвигаем, Telegram отдаст этот и следующие апдейты снова
+                        logger.warning(f"⛔ Очередь апдейтов полна, пауза polling company_id={tenant.company_id}")
+                        await asyncio.sleep(RUNNER_QUEUE_FULL_PAUSE)
+                        break
+                    offset = update.update_id + 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # Не удалось снять/проверить вебхук — повторим на следующем refresh
+            logger.error(f"❌ Polling не запущен: company_id={tenant.company_id}: {e}")
+
+    async def _handle(self, tenant: TenantBot, update) -> None:
+        try:
+            await self.dp.feed_update(tenant.bot, update, company_id=tenant.company_id)
+        except Exception as e:
+            logger.error(f"❌ Ошибка обработки апдейта company_id={tenant.company_id}: {e}")
+
+    async def run(self) -> None:
+        logger.info(f"🚀 Мультитенантный runner: шард {self.shard_index}/{self.shard_count}")
+        await self.updates.start()
+        try:
+            while True:
+                try:
+                    await self.refresh()
+                    logger.info(f"🤖 Активных ботов в процессе: {len(self._tenants)}")
+                except Exception as e:
+                    logger.error(f"❌ Не удалось обновить список ботов: {e}")
+                await asyncio.sleep(self.refresh_interval)
+        finally:
+            await self.stop()
+
+    async def stop(self) -> None:
+        # Сначала прекращаем приём, затем дообрабатываем очередь, и только потом закрываем сессии ботов
+        polling = [tenant.task for tenant in self._tenants.values() if tenant.task]
+        for task in polling:
+            task.cancel()
+        await asyncio.gather(*polling, return_exceptions=True)
+        await self.updates.stop()
+        for token in list(self._tenants):
+            await self._stop_tenant(token)
+
+
+async def main():
+    # Переводы интерфейса — в память до первого апдейта
+    await asyncio.to_thread(get_snapshot)
+    # Правки через API (компании, промпты, каталог, языки) сбрасывают кэши этого процесса
+    await invalidation_bus.start()
+    stats_task = asyncio.create_task(log_bot_stats_periodically())
+    runner = MultiBotRunner(dp)
+    try:
+        await runner.run()
+    finally:
+        stats_task.cancel()
+        # Сначала дописываем историю диалогов, потом закрываем пул соединений
+        await interaction_writer.stop()
+        await rate_limiter.close()
+        await invalidation_bus.stop()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Awaitable, Union
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+logger = logging.getLogger("streaming")
+
+# Не чаще одной правки в STREAM_EDIT_INTERVAL секунд и только при приросте текста на STREAM_MIN_DELTA символов
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+STREAM_MIN_DELTA = int(os.getenv("STREAM_MIN_DELTA", "40"))
+TELEGRAM_MESSAGE_LIMIT = 4096
+CURSOR = " ▌"
+
+
+class StreamingReply:
+    """
+    Ответ, который дописывается правками одного сообщения (заглушки "думаю...").
+    Промежуточные правки прореживаются и пропускаются, пока Telegram просит подождать (RetryAfter);
+    финальная правка дожидается окончания блокировки.
+
+    Заглушка может ещё отправляться (задача/future с Message): её ждём только к первой правке.
+    """
+
+    def __init__(self, message: Union[Message, Awaitable[Message]], min_interval: float = STREAM_EDIT_INTERVAL, min_delta: int = STREAM_MIN_DELTA):
+        self.message = message
+        self.min_interval = min_interval
+        self.min_delta = min_delta
+        self._shown = ""
+        self._last_edit = 0.0
+        self._blocked_until = 0.0
+        self.edits = 0
+
+    async def update(self, text: str) -> None:
+        now = time.monotonic()
+        if now < self._blocked_until or now - self._last_edit < self.min_interval:
+            return
+        if len(text) - len(self._shown) < self.min_delta:
+            return
+        await self._edit(text[:TELEGRAM_MESSAGE_LIMIT - len(CURSOR)] + CURSOR)
+
+    async def finish(self, text: str) -> None:
+        """Финальная правка; хвост длиннее лимита Telegram уходит отдельными сообщениями"""
+        wait = self._blocked_until - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        head, tail = text[:TELEGRAM_MESSAGE_LIMIT], text[TELEGRAM_MESSAGE_LIMIT:]
+        await self._edit(head, final=True)
+        message = await self._message()
+        while tail:
+            await message.answer(tail[:TELEGRAM_MESSAGE_LIMIT])
+            tail = tail[TELEGRAM_MESSAGE_LIMIT:]
+
+    async def _message(self) -> Message:
+        if not isinstance(self.message, Message):
+            self.message = await self.message
+        return self.message
+
+    async def _edit(self, text: str, final: bool = False) -> None:
+        if text == self._shown:
+            return
+        message = await self._message()
+        try:
+            await message.edit_text(text)
+            self._shown = text
+            self.edits += 1
+        except TelegramRetryAfter as e:
+            self._blocked_until = time.monotonic() + e.retry_after
+            logger.warning(f"⏳ Telegram RetryAfter {e.retry_after}s при правке ответа")
+            if final:
+                await asyncio.sleep(e.retry_after)
+                await self._edit(text, final=True)
+        except TelegramBadRequest as e:
+            # "message is not modified" и т.п. — на финальной правке отправляем текст новым сообщением
+            logger.debug(f"Правка сообщения отклонена: {e}")
+            if final:
+                await message.answer(text)
+                self._shown = text
+        finally:
+            self._last_edit = time.monotonic()
+
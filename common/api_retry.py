@@ -1,61 +1,207 @@
+import os
 import asyncio
+import inspect
 import logging
+import random
 import time
 from typing import Callable, Any, Optional
+from common.concurrency import get_governor, GovernorTimeout
+from common.circuit_breaker import get_breaker, get_breaker_stats
 
 logger = logging.getLogger("api_retry")
 
+# Общий бюджет времени на все попытки одного вызова (секунды)
+RETRY_DEADLINE = float(os.getenv("RETRY_DEADLINE", "60"))
+
+# Ошибки сети и таймауты разных клиентов (openai, httpx, aiogram) — по имени класса,
+# чтобы common не зависел от этих библиотек
+_RETRYABLE_ERROR_NAMES = {
+    "APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError",
+    "TimeoutException", "ConnectError", "ConnectTimeout", "ReadTimeout", "WriteTimeout", "PoolTimeout",
+    "ReadError", "RemoteProtocolError", "NetworkError",
+    "TelegramNetworkError", "TelegramServerError", "TelegramRetryAfter",
+}
+
+_stats = {
+    "calls": 0,
+    "attempts": 0,
+    "retries": 0,
+    "succeeded": 0,
+    "failed": 0,
+    "not_retryable": 0,
+    "deadline_exceeded": 0,
+    "short_circuited": 0,
+    "retry_wait_s": 0.0,
+}
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Повторять имеет смысл только 429, 5xx, таймауты и обрывы соединения"""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    return any(cls.__name__ in _RETRYABLE_ERROR_NAMES for cls in type(error).__mro__)
+
+
+def retry_after_of(error: BaseException) -> Optional[float]:
+    """Сколько просит подождать сервер (Telegram retry_after или заголовок Retry-After)"""
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        retry_after = headers.get("retry-after") if headers is not None else None
+    try:
+        return float(retry_after) if retry_after is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def record_breaker_outcome(breaker, error: Optional[BaseException] = None) -> None:
+    """
+    Итог вызова для предохранителя: успех и ответ сервера с кодом 4xx (endpoint жив) замыкают цепь,
+    429/5xx/таймауты считаются сбоем, прочее (отмена, ошибки нашего кода) — без вердикта
+    """
+    if error is None or (not is_retryable(error) and _status_code(error) is not None):
+        breaker.record_success()
+    elif is_retryable(error):
+        breaker.record_failure()
+    else:
+        breaker.release()
+
+
+async def _invoke(func: Callable, *args, **kwargs) -> Any:
+    """Async-функции выполняются в event loop, синхронные — в отдельном потоке"""
+    if inspect.iscoroutinefunction(func):
+        return await func(*args, **kwargs)
+    result = await asyncio.to_thread(func, *args, **kwargs)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
 async def call_with_retry(
     func: Callable,
     *args,
     max_attempts: int = 3,
     initial_delay: float = 1.0,
-    backoff_factor: float = 2.0,
+    backoff_factor: float = 3.0,
     max_delay: float = 60.0,
     description: str = "API call",
+    provider: Optional[str] = None,
+    deadline: float = RETRY_DEADLINE,
+    endpoint: Optional[str] = None,
     **kwargs
 ) -> Optional[Any]:
     """
-    Выполнить функцию с экспоненциальным ретраем
-    
+    Выполнить функцию с ретраями в пределах общего дедлайна
+
+    Повторяются только 429/5xx/таймауты/обрывы соединения; пауза — decorrelated jitter
+    (случайная между initial_delay и предыдущей паузой * backoff_factor), но не меньше Retry-After.
+    Если следующая попытка не укладывается в дедлайн, ретраи прекращаются сразу.
+
     Args:
-        func: Синхронная функция для выполнения
+        func: Async или синхронная функция для выполнения
         max_attempts: Максимальное количество попыток (по умолчанию: 3)
-        initial_delay: Начальная задержка в секундах (по умолчанию: 1.0)
-        backoff_factor: Множитель задержки (по умолчанию: 2.0)
-        max_delay: Максимальная задержка в секундах (по умолчанию: 60.0)
+        initial_delay: Минимальная пауза между попытками в секундах (по умолчанию: 1.0)
+        backoff_factor: Во сколько раз пауза может вырасти за попытку (по умолчанию: 3.0)
+        max_delay: Максимальная пауза в секундах (по умолчанию: 60.0)
         description: Описание для логов
+        provider: Имя провайдера для ограничения параллельных запросов (см. common.concurrency)
+        deadline: Общий бюджет времени на все попытки, секунды (по умолчанию: RETRY_DEADLINE)
+        endpoint: Имя предохранителя (см. common.circuit_breaker); по умолчанию — provider
     """
-    attempt = 1
+    _stats["calls"] += 1
+    deadline_at = time.monotonic() + deadline
+    breaker_name = endpoint or provider
+    breaker = get_breaker(breaker_name) if breaker_name else None
     delay = initial_delay
-    
-    while attempt <= max_attempts:
+
+    for attempt in range(1, max_attempts + 1):
+        if breaker is not None and not breaker.allow():
+            _stats["short_circuited"] += 1
+            logger.error(f"⛔ {description}: {breaker_name} недоступен (цепь разомкнута), без запроса")
+            return None
+
+        remaining = deadline_at - time.monotonic()
+        _stats["attempts"] += 1
         try:
             if attempt > 1:
-                logger.warning(f"🔄 Попытка #{attempt} {description} (задержка: {delay:.1f}s)")
-            
-            # Выполняем функцию в отдельном потоке
-            result = await asyncio.to_thread(func, *args, **kwargs)
-            
-            if attempt > 1:
-                logger.info(f"✅ Успешно на попытке #{attempt} {description}")
-            
-            return result
-            
+                logger.warning(f"🔄 Попытка #{attempt} {description} (осталось {remaining:.1f}s)")
+
+            # Слот провайдера занимаем только на время самого запроса, не на время ожидания ретрая
+            if provider:
+                async with get_governor(provider).slot():
+                    result = await asyncio.wait_for(_invoke(func, *args, **kwargs), timeout=remaining)
+            else:
+                result = await asyncio.wait_for(_invoke(func, *args, **kwargs), timeout=remaining)
+
+        except GovernorTimeout as e:
+            # Провайдер перегружен по нашей же политике — повтор только удлинит очередь
+            if breaker is not None:
+                record_breaker_outcome(breaker, e)
+            _stats["failed"] += 1
+            logger.error(f"⛔ {description}: {e}")
+            return None
+
+        except asyncio.CancelledError as e:
+            if breaker is not None:
+                record_breaker_outcome(breaker, e)
+            raise
+
         except Exception as e:
-            logger.error(f"❌ Ошибка на попытке #{attempt} {description}: {str(e)}")
-            
+            logger.error(f"❌ Ошибка на попытке #{attempt} {description}: {type(e).__name__}: {e}")
+            if breaker is not None:
+                record_breaker_outcome(breaker, e)
+
+            if not is_retryable(e):
+                # 400/401/ошибка в нашем коде — повтор даст то же самое
+                _stats["not_retryable"] += 1
+                _stats["failed"] += 1
+                return None
+
             if attempt == max_attempts:
                 logger.error(f"💔 Все попытки исчерпаны {description}")
+                _stats["failed"] += 1
                 return None
-            
-            # Экспоненциальная задержка с ограничением
-            actual_delay = min(delay, max_delay)
-            logger.info(f"⏳ Ожидание {actual_delay:.1f}s перед следующей попыткой...")
-            await asyncio.sleep(actual_delay)
-            
-            # Увеличиваем задержку для следующей попытки
-            delay *= backoff_factor
-            attempt += 1
-    
+
+            delay = min(max_delay, random.uniform(initial_delay, delay * backoff_factor))
+            server_delay = retry_after_of(e)
+            if server_delay is not None:
+                delay = max(delay, server_delay)
+
+            if time.monotonic() + delay >= deadline_at:
+                logger.error(f"⏱️ {description}: следующая попытка не укладывается в дедлайн {deadline:.0f}s")
+                _stats["deadline_exceeded"] += 1
+                _stats["failed"] += 1
+                return None
+
+            logger.info(f"⏳ Ожидание {delay:.1f}s перед следующей попыткой...")
+            _stats["retries"] += 1
+            _stats["retry_wait_s"] += delay
+            await asyncio.sleep(delay)
+            continue
+
+        if breaker is not None:
+            record_breaker_outcome(breaker)
+        if attempt > 1:
+            logger.info(f"✅ Успешно на попытке #{attempt} {description}")
+        _stats["succeeded"] += 1
+        return result
+
     return None
+
+
+def get_retry_stats() -> dict:
+    stats = dict(_stats)
+    stats["retry_wait_s"] = round(stats["retry_wait_s"], 2)
+    stats["breakers"] = get_breaker_stats()
+    return stats
@@ -0,0 +1,117 @@
+import os
+import time
+import logging
+from typing import Dict
+
+logger = logging.getLogger("circuit_breaker")
+
+# Сколько ошибок подряд размыкают цепь и через сколько секунд пробовать снова
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RECOVERY_TIMEOUT = float(os.getenv("BREAKER_RECOVERY_TIMEOUT", "30"))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+
+
+class CircuitOpenError(Exception):
+    """Цепь разомкнута — вызов отклонён без обращения к endpoint"""
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Предохранитель endpoint: после failure_threshold ошибок подряд (429/5xx/таймауты) цепь
+    размыкается и вызовы сразу отклоняются. Через recovery_timeout пропускается
+    half_open_probes пробных вызовов: успех замыкает цепь, ошибка снова размыкает.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        recovery_timeout: float = BREAKER_RECOVERY_TIMEOUT,
+        half_open_probes: int = BREAKER_HALF_OPEN_PROBES,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        # Метрики
+        self.trips = 0
+        self.rejected = 0
+
+    def available(self) -> bool:
+        """Можно ли сейчас отправить вызов (без резервирования пробы)"""
+        if self.state == OPEN:
+            return time.monotonic() - self._opened_at >= self.recovery_timeout
+        if self.state == HALF_OPEN:
+            return self._probes_in_flight < self.half_open_probes
+        return True
+
+    def allow(self) -> bool:
+        """Пропустить вызов; в полуоткрытом состоянии резервирует пробу"""
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self.state = HALF_OPEN
+            self._probes_in_flight = 0
+            logger.info(f"🔌 {self.name}: полуоткрыт, пробный вызов")
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return True
+        elif self.state == CLOSED:
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        if self.state != CLOSED:
+            logger.info(f"✅ {self.name}: цепь замкнута")
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self._probes_in_flight = 0
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.consecutive_failures >= self.failure_threshold):
+            self._trip()
+
+    def release(self) -> None:
+        """Вызов завершился без вердикта (отмена, нет своего слота) — вернуть пробу"""
+        if self.state == HALF_OPEN and self._probes_in_flight:
+            self._probes_in_flight -= 1
+
+    def _trip(self) -> None:
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._probes_in_flight = 0
+        self.trips += 1
+        logger.warning(f"⛔ {self.name}: цепь разомкнута на {self.recovery_timeout:.0f}s после {self.consecutive_failures} ошибок подряд")
+
+    def get_stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Предохранитель endpoint (создаётся при первом обращении)"""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
+
+
+def get_breaker_stats() -> dict:
+    return {name: breaker.get_stats() for name, breaker in _breakers.items()}
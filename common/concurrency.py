@@ -0,0 +1,90 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict
+
+logger = logging.getLogger("concurrency")
+
+# Значения по умолчанию; для отдельного провайдера: LLM_MAX_CONCURRENCY_OPENROUTER и т.п.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+LLM_MAX_QUEUE_WAIT = float(os.getenv("LLM_MAX_QUEUE_WAIT", "30"))
+
+
+class GovernorTimeout(Exception):
+    """Не дождались свободного слота у провайдера"""
+
+
+class ConcurrencyGovernor:
+    """Ограничение одновременных запросов к провайдеру с лимитом ожидания в очереди"""
+
+    def __init__(self, name: str, max_concurrency: int, max_queue_wait: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue_wait = max_queue_wait
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        # Метрики
+        self.acquired = 0
+        self.rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_queue_wait)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            logger.warning(f"⛔ {self.name}: нет свободного слота за {self.max_queue_wait}s (в работе {self.in_flight})")
+            raise GovernorTimeout(f"{self.name}: no free slot within {self.max_queue_wait}s")
+        finally:
+            self.waiting -= 1
+
+        wait = time.monotonic() - started
+        self.acquired += 1
+        self._wait_total += wait
+        self._wait_max = max(self._wait_max, wait)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def get_stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "acquired": self.acquired,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self._wait_total / self.acquired * 1000, 2) if self.acquired else 0.0,
+            "max_wait_ms": round(self._wait_max * 1000, 2),
+        }
+
+
+_governors: Dict[str, ConcurrencyGovernor] = {}
+
+
+def get_governor(provider: str) -> ConcurrencyGovernor:
+    """Governor провайдера (создаётся при первом обращении по настройкам окружения)"""
+    governor = _governors.get(provider)
+    if governor is None:
+        suffix = provider.upper()
+        governor = ConcurrencyGovernor(
+            provider,
+            max_concurrency=int(os.getenv(f"LLM_MAX_CONCURRENCY_{suffix}", LLM_MAX_CONCURRENCY)),
+            max_queue_wait=float(os.getenv(f"LLM_MAX_QUEUE_WAIT_{suffix}", LLM_MAX_QUEUE_WAIT)),
+        )
+        _governors[provider] = governor
+        logger.info(f"🚦 Governor {provider}: max_concurrency={governor.max_concurrency}, max_queue_wait={governor.max_queue_wait}s")
+    return governor
+
+
+def get_governor_stats() -> dict:
+    return {name: governor.get_stats() for name, governor in _governors.items()}
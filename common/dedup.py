@@ -0,0 +1,126 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+logger = logging.getLogger("dedup")
+
+
+class InMemoryDedupBackend:
+    """Хранилище ключей в памяти процесса: окно по времени + ограничение по размеру"""
+
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, float]" = OrderedDict()  # ключ -> время истечения
+
+    def _purge(self, now: float) -> None:
+        # Окно одинаковое для всех ключей, поэтому порядок вставки = порядок истечения
+        while self._entries:
+            key, expires_at = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            self._entries.popitem(last=False)
+
+    async def add_if_absent(self, key: Tuple, ttl: float) -> bool:
+        now = time.monotonic()
+        self._purge(now)
+        if key in self._entries:
+            return False
+        self._entries[key] = now + ttl
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return True
+
+    async def discard(self, key: Tuple) -> None:
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisDedupBackend:
+    """Общее хранилище для нескольких реплик (SET NX EX)"""
+
+    def __init__(self, redis_client: Any, prefix: str = "tg:dedup:"):
+        self.redis = redis_client
+        self.prefix = prefix
+
+    async def add_if_absent(self, key: Tuple, ttl: float) -> bool:
+        return bool(await self.redis.set(self._name(key), 1, nx=True, ex=max(1, int(ttl))))
+
+    async def discard(self, key: Tuple) -> None:
+        await self.redis.delete(self._name(key))
+
+    def _name(self, key: Tuple) -> str:
+        return self.prefix + ":".join(str(part) for part in key)
+
+
+class UpdateDeduplicator:
+    """Отбрасывает повторные доставки апдейтов Telegram по ключу (bot_id, update_id)"""
+
+    def __init__(self, backend: Any, window_seconds: float = 600.0):
+        self.backend = backend
+        self.window_seconds = window_seconds
+        self.checked = 0
+        self.duplicates = 0
+        self.errors = 0
+
+    async def is_duplicate(self, bot_id: Any, update_id: Optional[int]) -> bool:
+        if update_id is None:
+            return False
+        self.checked += 1
+        try:
+            is_new = await self.backend.add_if_absent((bot_id, update_id), self.window_seconds)
+        except Exception as e:
+            # Недоступность хранилища не должна останавливать приём апдейтов
+            self.errors += 1
+            logger.error(f"❌ Ошибка хранилища дедупликации: {e}")
+            return False
+        if not is_new:
+            self.duplicates += 1
+            logger.info(f"♻️ Повторный апдейт отброшен: bot={bot_id}, update_id={update_id}")
+        return not is_new
+
+    async def forget(self, bot_id: Any, update_id: Optional[int]) -> None:
+        """Снять отметку, если апдейт так и не был принят (Telegram доставит его снова)"""
+        if update_id is None:
+            return
+        try:
+            await self.backend.discard((bot_id, update_id))
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"❌ Ошибка хранилища дедупликации: {e}")
+
+    def get_stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "window_seconds": self.window_seconds,
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "errors": self.errors,
+        }
+
+
+def get_bot_id(bot_token: str) -> str:
+    """Числовой id бота из токена — чтобы не хранить сам токен в ключах"""
+    return bot_token.split(":", 1)[0]
+
+
+def create_deduplicator() -> UpdateDeduplicator:
+    """
+    Создать дедупликатор по настройкам окружения:
+        DEDUP_BACKEND        memory (по умолчанию) или redis
+        DEDUP_WINDOW_SECONDS окно дедупликации
+        DEDUP_MAX_ENTRIES    лимит ключей для backend=memory
+        REDIS_URL            адрес Redis для backend=redis
+    """
+    window = float(os.getenv("DEDUP_WINDOW_SECONDS", "600"))
+    backend_name = os.getenv("DEDUP_BACKEND", "memory")
+    if backend_name == "redis":
+        import redis.asyncio as aioredis
+        backend = RedisDedupBackend(aioredis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
+    else:
+        backend = InMemoryDedupBackend(max_entries=int(os.getenv("DEDUP_MAX_ENTRIES", "100000")))
+    logger.info(f"♻️ Дедупликация апдейтов: backend={backend_name}, окно={window}s")
+    return UpdateDeduplicator(backend, window_seconds=window)
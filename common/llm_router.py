@@ -0,0 +1,402 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Deque, List, Optional, Tuple
+from common.concurrency import get_governor, get_governor_stats, GovernorTimeout
+from common.circuit_breaker import CLOSED, CircuitOpenError, get_breaker
+from common.api_retry import record_breaker_outcome
+
+logger = logging.getLogger("llm_router")
+
+# Окно статистики на endpoint и порог "здоровья"
+LLM_ROUTER_WINDOW = int(os.getenv("LLM_ROUTER_WINDOW", "100"))
+LLM_ROUTER_MAX_ERROR_RATE = float(os.getenv("LLM_ROUTER_MAX_ERROR_RATE", "0.5"))
+# Задержка хеджирования = p95 основного endpoint, но в этих пределах (секунды)
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+LLM_HEDGE_MAX_DELAY = float(os.getenv("LLM_HEDGE_MAX_DELAY", "8"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Минимум замеров, после которого p95 считается осмысленным
+_MIN_SAMPLES = 5
+
+
+class EndpointStats:
+    """
+    Скользящая статистика endpoint: задержка до первых данных (первый чанк потока или
+    целый ответ) и доля ошибок по последним window вызовам.
+    """
+
+    def __init__(self, window: int = LLM_ROUTER_WINDOW):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.calls = 0
+        self.started = 0
+        self.errors = 0
+        self.censored = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._sorted: Optional[List[float]] = None
+
+    def record(self, latency: Optional[float], ok: bool) -> None:
+        self.calls += 1
+        self.outcomes.append(ok)
+        if ok and latency is not None:
+            self.latencies.append(latency)
+            self._sorted = None
+        if not ok:
+            self.errors += 1
+
+    def record_censored(self, elapsed: float) -> None:
+        """
+        Запрос отменён (проиграл гонку): настоящая задержка не меньше elapsed.
+        Без этого замера медленный endpoint, который всегда проигрывает, оставался бы без статистики.
+        """
+        self.latencies.append(elapsed)
+        self._sorted = None
+        self.censored += 1
+
+    def percentile(self, q: float, min_samples: int = _MIN_SAMPLES) -> Optional[float]:
+        if not self.latencies or len(self.latencies) < min_samples:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self.latencies)
+        return self._sorted[min(len(self._sorted) - 1, int(q * len(self._sorted)))]
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def healthy(self) -> bool:
+        return len(self.outcomes) < _MIN_SAMPLES or self.error_rate < LLM_ROUTER_MAX_ERROR_RATE
+
+    def get_stats(self) -> dict:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate, 3),
+            "p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000) if p95 is not None else None,
+            "censored": self.censored,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
+
+
+@dataclass
+class LLMEndpoint:
+    """Модель у конкретного провайдера; client — AsyncOpenAI-совместимый (chat.completions.create)"""
+    name: str
+    client: Any
+    model: str
+    provider: str
+    stats: EndpointStats = field(default_factory=EndpointStats)
+
+    @property
+    def breaker(self):
+        return get_breaker(f"llm:{self.name}")
+
+
+class LLMRouter:
+    """
+    Маршрутизация запросов к LLM по самому быстрому здоровому endpoint.
+
+    Если ответ (для потока — первый чанк) не пришёл за p95 основного endpoint, параллельно
+    уходит запасной запрос на следующий endpoint с замкнутой цепью; побеждает первый,
+    проигравший отменяется. Ошибка основного запроса сразу запускает запасной. Если запасного
+    endpoint нет, ждём основной: повтор на тот же endpoint удвоил бы платные вызовы.
+    """
+
+    def __init__(self, endpoints: List[LLMEndpoint], hedge: bool = LLM_HEDGE_ENABLED):
+        if not endpoints:
+            raise ValueError("LLMRouter: нужен хотя бы один endpoint")
+        self.endpoints = endpoints
+        self.hedge = hedge
+        self._calls = 0
+
+    def ranked(self) -> List[LLMEndpoint]:
+        """
+        Здоровые endpoint (доля ошибок ниже порога, цепь не разомкнута) по возрастанию медианы
+        имеющихся замеров. Endpoint без замеров идёт первым, но не больше _MIN_SAMPLES раз —
+        если замеры так и не появились, он уходит в конец, а не занимает первое место навсегда.
+        """
+        healthy = [e for e in self.endpoints if e.stats.healthy() and e.breaker.available()]
+        if not healthy:
+            # Здоровых нет: пробуем тех, у кого не разомкнута цепь; при всех разомкнутых запросы отклонятся сразу
+            healthy = [e for e in self.endpoints if e.breaker.available()] or list(self.endpoints)
+
+        def key(endpoint: LLMEndpoint) -> Tuple[float, float]:
+            p50 = endpoint.stats.percentile(0.5, min_samples=1)
+            if p50 is None:
+                p50 = 0.0 if endpoint.stats.started < _MIN_SAMPLES else float("inf")
+            return (p50, endpoint.stats.error_rate)
+        return sorted(healthy, key=key)
+
+    def hedge_delay(self, endpoint: LLMEndpoint) -> float:
+        # Пока замеров мало, берём максимум из имеющихся; без замеров — верхнюю границу
+        p95 = endpoint.stats.percentile(0.95, min_samples=1)
+        if p95 is None:
+            return LLM_HEDGE_MAX_DELAY
+        return min(LLM_HEDGE_MAX_DELAY, max(LLM_HEDGE_MIN_DELAY, p95))
+
+    async def complete(self, messages: list, **params) -> str:
+        """Ответ целиком (stream=False)"""
+        async def attempt(endpoint: LLMEndpoint):
+            resp = await endpoint.client.chat.completions.create(model=endpoint.model, messages=messages, **params)
+            return resp.choices[0].message.content.strip()
+
+        _, text, slot, _ = await self._race(attempt)
+        await slot.aclose()
+        return text
+
+    async def stream(self, messages: list, on_text: Optional[Callable[[str], Awaitable[None]]] = None, **params) -> str:
+        """
+        Потоковый ответ: гонка идёт до первого чанка, дальше читается только поток победителя.
+        on_text получает накопленный текст по мере генерации.
+        """
+        async def attempt(endpoint: LLMEndpoint):
+            stream = await endpoint.client.chat.completions.create(
+                model=endpoint.model, messages=messages, stream=True, **params
+            )
+            iterator = stream.__aiter__()
+            try:
+                first = await iterator.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except BaseException:
+                await _close_stream(stream)
+                raise
+            return stream, iterator, first
+
+        endpoint, (stream, iterator, first), slot, latency = await self._race(
+            attempt, cleanup=lambda result: _close_stream(result[0]), settle=False
+        )
+        text = ""
+        failed = False
+        # Слот провайдера держится до конца потока победителя
+        async with slot:
+            try:
+                chunk = first
+                while chunk is not None:
+                    if chunk.choices:
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            text += delta
+                            if on_text:
+                                await on_text(text)
+                    try:
+                        chunk = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        chunk = None
+                    except Exception:
+                        failed = True
+                        raise
+            except BaseException:
+                await _close_stream(stream)
+                raise
+            finally:
+                # Итог вызова записывается один раз, когда поток закончился; обрыв у провайдера — сбой endpoint
+                if failed:
+                    endpoint.stats.record(None, False)
+                    endpoint.breaker.record_failure()
+                else:
+                    endpoint.stats.record(latency, True)
+                    record_breaker_outcome(endpoint.breaker)
+        return text.strip()
+
+    async def _race(self, attempt, cleanup=None, settle: bool = True):
+        """
+        Основной запрос + хеджирующий; возвращает (endpoint, результат победителя, слот провайдера,
+        задержку победителя). Слот победителя освобождает вызывающий (aclose) — после того как
+        дочитает ответ. settle=False — успех победителя записывает вызывающий (поток ещё не дочитан).
+        """
+        ranked = self.ranked()
+        primary = ranked[0]
+
+        def pick_backup() -> Optional[LLMEndpoint]:
+            return next((e for e in ranked[1:] if e.breaker.state == CLOSED), None)
+
+        async def run(endpoint: LLMEndpoint, on_sent: Optional[Callable[[], None]] = None):
+            breaker = endpoint.breaker
+            if not breaker.allow():
+                raise CircuitOpenError(f"{endpoint.name}: цепь разомкнута")
+            if on_sent is not None:
+                on_sent()
+            slot = AsyncExitStack()
+            started = None
+            try:
+                await slot.enter_async_context(get_governor(endpoint.provider).slot())
+                started = time.monotonic()
+                endpoint.stats.started += 1
+                result = await attempt(endpoint)
+            except BaseException as e:
+                await slot.aclose()
+                record_breaker_outcome(breaker, e)
+                # Отмена (проиграл гонку) и нехватка своих же слотов — не ошибка endpoint
+                if isinstance(e, asyncio.CancelledError):
+                    if started is not None:
+                        endpoint.stats.record_censored(time.monotonic() - started)
+                elif not isinstance(e, GovernorTimeout):
+                    endpoint.stats.record(None, False)
+                raise
+            latency = time.monotonic() - started
+            if settle:
+                record_breaker_outcome(breaker)
+                endpoint.stats.record(latency, True)
+            return result, slot, latency
+
+        tasks = {asyncio.create_task(run(primary)): primary}
+        hedge_task = None
+        try:
+            hedge = self.hedge and pick_backup() is not None
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(primary) if hedge else None)
+            primary_failed = bool(done) and next(iter(done)).exception() is not None
+            backup = pick_backup() if not done or primary_failed else None
+            if backup is not None:
+                reason = "ошибка" if primary_failed else "медленно"
+
+                def on_hedge_sent() -> None:
+                    # Считаем только запасные запросы, которые действительно ушли к провайдеру
+                    primary.stats.hedges += 1
+                    logger.info(f"🪂 Запасной запрос: {primary.name} -> {backup.name} ({reason})")
+
+                hedge_task = asyncio.create_task(run(backup, on_hedge_sent))
+                tasks[hedge_task] = backup
+
+            error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    winner = tasks[task]
+                    if task is hedge_task:
+                        winner.stats.hedge_wins += 1
+                    await self._cancel(pending | (done - {task}), cleanup)
+                    self._maybe_log_stats()
+                    result, slot, latency = task.result()
+                    return winner, result, slot, latency
+            raise error
+        except asyncio.CancelledError:
+            await self._cancel(set(tasks), cleanup)
+            raise
+
+    @staticmethod
+    async def _cancel(tasks, cleanup=None) -> None:
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                result, slot, _ = await task
+            except BaseException:
+                continue
+            # Проигравший успел получить результат в момент отмены — освобождаем его (закрыть поток)
+            if cleanup is not None:
+                await cleanup(result)
+            await slot.aclose()
+
+    def get_stats(self) -> dict:
+        return {
+            endpoint.name: {**endpoint.stats.get_stats(), "breaker": endpoint.breaker.state}
+            for endpoint in self.endpoints
+        }
+
+    def _maybe_log_stats(self) -> None:
+        self._calls += 1
+        if self._calls % 100 == 0:
+            logger.info(f"📊 LLM endpoints: {self.get_stats()}, governors: {get_governor_stats()}")
+
+
+async def _close_stream(stream: Any) -> None:
+    close = getattr(stream, "close", None)
+    if close is None:
+        return
+    try:
+        result = close()
+        if asyncio.iscoroutine(result):
+            await result
+    except Exception:
+        pass
+
+
+def _fake_error() -> Exception:
+    error = RuntimeError("fake provider error")
+    error.status_code = 503
+    return error
+
+
+class FakeLLMClient:
+    """
+    Локальный провайдер для тестов и нагрузочных прогонов: задержка до ответа/первого чанка
+    latency ± jitter, доля ошибок error_rate, поток по словам с паузой chunk_delay;
+    stream_error_after — обрыв потока (ошибка 503) после стольких чанков.
+    """
+
+    def __init__(self, latency: float = 0.2, jitter: float = 0.0, error_rate: float = 0.0,
+                 text: str = "Тестовый ответ модели.", chunk_delay: float = 0.0,
+                 stream_error_after: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.text = text
+        self.chunk_delay = chunk_delay
+        self.stream_error_after = stream_error_after
+        self.calls = 0
+        self.cancelled = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, model: str, messages: list, stream: bool = False, **params):
+        self.calls += 1
+        try:
+            await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if random.random() < self.error_rate:
+            raise _fake_error()
+        if stream:
+            return self._stream()
+        message = SimpleNamespace(content=self.text)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    async def _stream(self):
+        words = self.text.split(" ")
+        for i, word in enumerate(words):
+            if i == self.stream_error_after:
+                raise _fake_error()
+            if i and self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            delta = SimpleNamespace(content=word if i == 0 else " " + word)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+def create_router_from_env(default_endpoints: List[dict]) -> LLMRouter:
+    """
+    Endpoint из LLM_ENDPOINTS (JSON-список) или default_endpoints. Поля:
+    name, model, provider, base_url, api_key_env — либо "fake": {latency, jitter, error_rate}.
+    """
+    raw = os.getenv("LLM_ENDPOINTS")
+    configs = json.loads(raw) if raw else default_endpoints
+    endpoints = []
+    for config in configs:
+        if "fake" in config:
+            client = FakeLLMClient(**config["fake"])
+        else:
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(base_url=config.get("base_url"), api_key=os.getenv(config.get("api_key_env", "OPENAI_API_KEY")))
+        endpoints.append(LLMEndpoint(
+            name=config.get("name", config["model"]),
+            client=client,
+            model=config["model"],
+            provider=config.get("provider", "openai"),
+        ))
+    logger.info(f"🧭 LLM endpoints: {[e.name for e in endpoints]}")
+    return LLMRouter(endpoints)
@@ -1,74 +1,211 @@
+import os
 import asyncio
 import time
-from typing import Dict, List
+import logging
+from typing import Any, Dict, List, Optional, Tuple
 from aiogram import BaseMiddleware
 from aiogram.types import Message
-from sqlalchemy.orm import Session
+from app.db.session import SessionLocal
 from app.services.translation_service import t
-import logging
+from app.services.user_context import get_cached_lang
 
 logger = logging.getLogger("rate_limiter")
 
+# Языковые кнопки и команды лимит не расходуют
+EXEMPT_TEXTS = {"English", "Русский", "Қазақша", "Кыргызча", "O'zbekcha", "Українська"}
+
+
+class InMemoryRateLimitBackend:
+    """
+    Скользящее окно со счётчиками (sliding window counter) в памяти процесса.
+
+    На ключ хранится только (номер окна, счётчик прошлого окна, счётчик текущего, последний запрос):
+    оценка = прошлое * доля перекрытия + текущее — O(1) по времени и памяти на пользователя.
+    Ключи разложены по шардам со своими блокировками: очистка обходит шард за шардом
+    и не задерживает запросы остальных пользователей.
+    """
+
+    def __init__(self, shards: int = 64, idle_seconds: float = 600.0, evict_interval: float = 60.0):
+        self.idle_seconds = idle_seconds
+        self.evict_interval = evict_interval
+        # ключ -> [номер окна, прошлое окно, текущее окно, время последнего запроса]
+        self._shards: List[Dict[Any, List[float]]] = [{} for _ in range(shards)]
+        self._locks = [asyncio.Lock() for _ in range(shards)]
+        self._evict_task: Optional[asyncio.Task] = None
+        self.evicted = 0
+
+    def _shard(self, key: Any) -> int:
+        return hash(key) % len(self._shards)
+
+    async def hit(self, key: Any, limit: int, window: float) -> bool:
+        """Учесть запрос, если он укладывается в лимит; False — лимит исчерпан"""
+        if self._evict_task is None:
+            self._evict_task = asyncio.create_task(self._evict_loop())
+        index = self._shard(key)
+        async with self._locks[index]:
+            now = time.time()
+            current = int(now // window)
+            entry = self._shards[index].get(key)
+            if entry is None:
+                entry = self._shards[index][key] = [current, 0, 0, now]
+            elif entry[0] != current:
+                # Новое окно: текущий счётчик становится прошлым (если окно соседнее)
+                entry[1] = entry[2] if entry[0] == current - 1 else 0
+                entry[2] = 0
+                entry[0] = current
+            entry[3] = now
+
+            elapsed = now / window - current
+            if entry[1] * (1.0 - elapsed) + entry[2] >= limit:
+                return False
+            entry[2] += 1
+            return True
+
+    async def _evict_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.evict_interval)
+            try:
+                await self.evict_idle()
+            except Exception as e:
+                logger.error(f"❌ Ошибка очистки rate limiter: {e}")
+
+    async def evict_idle(self) -> int:
+        """Удалить пользователей без запросов дольше idle_seconds"""
+        removed = 0
+        for shard, lock in zip(self._shards, self._locks):
+            async with lock:
+                threshold = time.time() - self.idle_seconds
+                idle = [key for key, entry in shard.items() if entry[3] < threshold]
+                for key in idle:
+                    del shard[key]
+                removed += len(idle)
+            await asyncio.sleep(0)
+        if removed:
+            self.evicted += removed
+            logger.debug(f"🧹 Rate limiter: удалено {removed} неактивных пользователей")
+        return removed
+
+    async def close(self) -> None:
+        if self._evict_task is not None:
+            self._evict_task.cancel()
+            self._evict_task = None
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+
+# Прошлое и текущее окно читаются и увеличиваются атомарно; ключи живут два окна — неактивные удаляет TTL
+_REDIS_HIT_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+if previous * tonumber(ARGV[1]) + current >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+
+class RedisRateLimitBackend:
+    """Общий лимит для нескольких реплик бота: те же счётчики окон в Redis (Lua-скрипт)"""
+
+    def __init__(self, redis_client: Any, prefix: str = "tg:ratelimit:"):
+        self.redis = redis_client
+        self.prefix = prefix
+
+    async def hit(self, key: Any, limit: int, window: float) -> bool:
+        now = time.time()
+        current = int(now // window)
+        name = self.prefix + ":".join(str(part) for part in (key if isinstance(key, tuple) else (key,)))
+        weight = 1.0 - (now / window - current)
+        allowed = await self.redis.eval(
+            _REDIS_HIT_SCRIPT, 2, f"{name}:{current}", f"{name}:{current - 1}",
+            weight, limit, max(1, int(window * 2)),
+        )
+        return bool(allowed)
+
+    async def close(self) -> None:
+        pass
+
+    def __len__(self) -> int:
+        return 0
+
+
 class RateLimiterMiddleware(BaseMiddleware):
-    """Ограничение 15 запросов в минуту на пользователя"""
-    
-    def __init__(self, max_requests: int = 15, window_seconds: int = 60):
+    """Ограничение max_requests запросов за window_seconds на пользователя бота компании"""
+
+    def __init__(self, max_requests: int = 15, window_seconds: int = 60, backend: Any = None):
         self.max_requests = max_requests
         self.window_seconds = window_seconds
-        self.requests: Dict[int, List[float]] = {}  # user_id -> [timestamps]
-        self.lock = asyncio.Lock()
+        self.backend = backend if backend is not None else InMemoryRateLimitBackend()
+        self.allowed = 0
+        self.throttled = 0
+        self.errors = 0
         super().__init__()
-    
+
     async def __call__(self, handler, event: Message, data: dict):
         # Пропускаем команды и языковые выборы
-        if event.text and (event.text.startswith("/") or event.text in ["English", "Русский", "Қазақша", "Кыргызча", "O'zbekcha", "Українська"]):
+        if event.from_user is None or (event.text and (event.text.startswith("/") or event.text in EXEMPT_TEXTS)):
             return await handler(event, data)
-        
+
         user_id = event.from_user.id
-        
-        async with self.lock:
-            now = time.time()
-            
-            # Инициализируем список для нового пользователя
-            if user_id not in self.requests:
-                self.requests[user_id] = []
-            
-            # Очищаем старые записи (старше window_seconds)
-            self.requests[user_id] = [
-                ts for ts in self.requests[user_id] 
-                if now - ts < self.window_seconds
-            ]
-            
-            # Проверяем лимит
-            if len(self.requests[user_id]) >= self.max_requests:
-                logger.warning(f"⛔ Rate limit exceeded: user={user_id}, requests={len(self.requests[user_id])}")
-                
-                # Получаем язык для отправки сообщения
-                db = data.get("db")
-                if not db:
-                    from generated_code.common.db import get_db
-                    db = next(get_db())
-                
-                lang = "ru"  # Фолбэк
-                try:
-                    pref = db.query(UserPreference).filter_by(telegram_user_id=user_id).first()
-                    if pref:
-                        lang = pref.language_code
-                except:
-                    pass
-                
+        key: Tuple = (data.get("company_id"), user_id)
+        try:
+            allowed = await self.backend.hit(key, self.max_requests, self.window_seconds)
+        except Exception as e:
+            # Недоступность хранилища не должна блокировать ответы клиентам
+            self.errors += 1
+            logger.error(f"❌ Ошибка хранилища rate limiter: {e}")
+            allowed = True
+
+        if not allowed:
+            self.throttled += 1
+            logger.warning(f"⛔ Rate limit exceeded: user={user_id}")
+            # Лимитер стоит до UserContextMiddleware: язык берётся только из кэша, лид не создаётся
+            lang = get_cached_lang(user_id) or "ru"
+            with SessionLocal() as db:
                 await event.answer(t("rate_limit_error", lang, db))
-                return  # Не вызываем handler
-        
-            # Добавляем текущий запрос
-            self.requests[user_id].append(now)
-            logger.debug(f"✅ Request allowed: user={user_id}, total={len(self.requests[user_id])}")
-        
+            return  # Не вызываем handler
+
+        self.allowed += 1
         return await handler(event, data)
-    
+
+    async def close(self) -> None:
+        await self.backend.close()
+
     def get_stats(self) -> dict:
         """Получить статистику rate limiter"""
         return {
-            "total_users": len(self.requests),
-            "users_with_limits": sum(1 for req in self.requests.values() if len(req) >= self.max_requests)
+            "backend": type(self.backend).__name__,
+            "total_users": len(self.backend),
+            "allowed": self.allowed,
+            "throttled": self.throttled,
+            "errors": self.errors,
+            "evicted": getattr(self.backend, "evicted", 0),
         }
+
+
+def create_rate_limiter() -> RateLimiterMiddleware:
+    """
+    Создать rate limiter по настройкам окружения:
+        RATE_LIMIT_MAX_REQUESTS   запросов на пользователя за окно (по умолчанию 15)
+        RATE_LIMIT_WINDOW_SECONDS длина окна (по умолчанию 60)
+        RATE_LIMIT_BACKEND        memory (по умолчанию) или redis — общий лимит для всех реплик
+        RATE_LIMIT_SHARDS         число шардов для backend=memory
+        RATE_LIMIT_IDLE_SECONDS   через сколько без запросов пользователь удаляется из памяти
+        REDIS_URL                 адрес Redis для backend=redis
+    """
+    max_requests = int(os.getenv("RATE_LIMIT_MAX_REQUESTS", "15"))
+    window = int(os.getenv("RATE_LIMIT_WINDOW_SECONDS", "60"))
+    backend_name = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    if backend_name == "redis":
+        import redis.asyncio as aioredis
+        backend = RedisRateLimitBackend(aioredis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
+    else:
+        backend = InMemoryRateLimitBackend(
+            shards=int(os.getenv("RATE_LIMIT_SHARDS", "64")),
+            idle_seconds=float(os.getenv("RATE_LIMIT_IDLE_SECONDS", str(window * 2))),
+        )
+    logger.info(f"🚦 Rate limiter: backend={backend_name}, {max_requests} запросов за {window}s")
+    return RateLimiterMiddleware(max_requests=max_requests, window_seconds=window, backend=backend)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк сериализации ответов API: jsonable_encoder + json.dumps
+против закэшированного TypeAdapter + pydantic-core.
+
+Запуск (БД не нужна, объекты ORM создаются в памяти):
+    python -m scripts.bench_serialization --rows 200 --repeat 200
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+from typing import List
+import pydantic_core
+from fastapi.encoders import jsonable_encoder
+from app.models.all_models import Company, CompanyPrompt, UserPreference
+from app.schemas import CompanyOut, CompanyPromptOut, UserPreferenceOut, to_schema
+
+
+def make_payloads(rows: int) -> dict:
+    now = datetime.utcnow()
+    return {
+        "company": (
+            [Company(id=i, name=f"Company {i}", subdomain=f"c{i}", settings={"answer_cache": True},
+                     tg_token=f"{i}:token", default_language="ru", created_at=now) for i in range(rows)],
+            CompanyOut,
+        ),
+        "prompt": (
+            [CompanyPrompt(id=i, company_id=1, prompt_type="system", content="Ты – консультант компании. " * 10,
+                           documents=[{"title": "faq", "id": i}], is_active=True, created_at=now) for i in range(rows)],
+            CompanyPromptOut,
+        ),
+        "preference": (
+            [UserPreference(id=i, telegram_user_id=100000 + i, language_code="ru",
+                            created_at=now, updated_at=now) for i in range(rows)],
+            UserPreferenceOut,
+        ),
+    }
+
+
+def bench(fn, repeat: int) -> float:
+    fn()  # прогрев (в т.ч. компиляция TypeAdapter)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response serialization micro-benchmark")
+    parser.add_argument("--rows", type=int, default=100, help="объектов в одном ответе")
+    parser.add_argument("--repeat", type=int, default=200, help="повторов на вариант")
+    args = parser.parse_args()
+
+    print(f"rows/response={args.rows}, repeat={args.repeat}")
+    print(f"{'payload':<12}{'jsonable_encoder':>20}{'TypeAdapter':>16}{'speedup':>10}")
+    for name, (objects, schema) in make_payloads(args.rows).items():
+        before = bench(lambda: json.dumps({"status": "success", "items": jsonable_encoder(objects)}).encode(), args.repeat)
+        after = bench(lambda: pydantic_core.to_json({"status": "success", "items": to_schema(objects, List[schema])}), args.repeat)
+        print(f"{name:<12}{before * 1e6:>17.0f} µs{after * 1e6:>13.0f} µs{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
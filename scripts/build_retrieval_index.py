@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Пересборка индексов знаний компаний (Document, CompanyPrompt.documents, Product) для бота.
+Неизменившиеся источники переиспользуются, новые нарезаются и векторизуются в пуле процессов.
+
+Пример:
+    python -m scripts.build_retrieval_index                  # все компании
+    python -m scripts.build_retrieval_index --company-id 3 -w 8
+"""
+import argparse
+import json
+import logging
+from app.db.session import SessionLocal
+from app.models.all_models import Company
+from app.services.retrieval import build_company_index, create_embedder
+from app.services.retrieval.ingest import RETRIEVAL_WORKERS
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Rebuild per-company retrieval indexes")
+    parser.add_argument("--company-id", type=int, action="append", dest="company_ids",
+                        help="ограничить компаниями (можно указать несколько раз)")
+    parser.add_argument("-w", "--workers", type=int, default=RETRIEVAL_WORKERS,
+                        help="процессов для нарезки и эмбеддингов")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    embedder = create_embedder()
+    db = SessionLocal()
+    try:
+        company_ids = args.company_ids or [row.id for row in db.query(Company.id)]
+        for company_id in company_ids:
+            report = build_company_index(db, company_id, embedder, workers=args.workers)
+            print(json.dumps(report, ensure_ascii=False))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Проверка маршрутизации LLM на фейковых провайдерах (сеть и ключи не нужны):
+быстрый endpoint должен стать основным, даже если медленный стоит первым в списке
+и проигрывает гонки хеджирования (замер задержки проигравшего — цензурированный).
+
+    python -m scripts.check_llm_router --slow 1.0 --fast 0.05 --calls 12
+"""
+import argparse
+import asyncio
+import time
+from common import llm_router
+from common.llm_router import FakeLLMClient, LLMEndpoint, LLMRouter
+
+
+async def run(slow_latency: float, fast_latency: float, calls: int) -> bool:
+    slow = LLMEndpoint("slow", FakeLLMClient(latency=slow_latency), "fake-model", "fake")
+    fast = LLMEndpoint("fast", FakeLLMClient(latency=fast_latency), "fake-model", "fake")
+    router = LLMRouter([slow, fast])
+
+    primaries = []
+    started = time.monotonic()
+    for _ in range(calls):
+        primaries.append(router.ranked()[0].name)
+        await router.complete([{"role": "user", "content": "ping"}])
+    elapsed = time.monotonic() - started
+
+    print(f"основные endpoint по вызовам: {primaries}")
+    print(f"время {elapsed:.2f}s, запросов slow={slow.client.calls}, fast={fast.client.calls}")
+    print(f"статистика: {router.get_stats()}")
+    # Медленный допускается основным только на разведочных вызовах в начале
+    ok = primaries[-(calls // 2):] == ["fast"] * (calls // 2)
+    print("✅ быстрый endpoint стал основным" if ok else "❌ быстрый endpoint так и не стал основным")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM router check on fake providers")
+    parser.add_argument("--slow", type=float, default=1.0, help="задержка медленного endpoint, s")
+    parser.add_argument("--fast", type=float, default=0.05, help="задержка быстрого endpoint, s")
+    parser.add_argument("--calls", type=int, default=12)
+    parser.add_argument("--hedge-max-delay", type=float, default=None,
+                        help="переопределить LLM_HEDGE_MAX_DELAY (проверка цензурированных замеров)")
+    args = parser.parse_args()
+    if args.hedge_max_delay is not None:
+        llm_router.LLM_HEDGE_MAX_DELAY = args.hedge_max_delay
+    ok = asyncio.run(run(args.slow, args.fast, args.calls))
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
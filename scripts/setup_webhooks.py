@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Массовая перерегистрация вебхуков Telegram для активных ботов компаний.
+
+Пример:
+    python -m scripts.setup_webhooks                     # все активные боты
+    python -m scripts.setup_webhooks --company-id 3 -c 5 # только компания 3
+"""
+import argparse
+import asyncio
+import json
+import logging
+from app.db.session import AsyncSessionLocal, async_engine
+from app.services.http_clients import get_http_client, close_http_clients
+from app.services.webhook_setup import load_webhook_targets, register_webhooks, WEBHOOK_SETUP_CONCURRENCY
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Re-register Telegram webhooks for active company bots")
+    parser.add_argument("--company-id", type=int, action="append", dest="company_ids",
+                        help="ограничить компаниями (можно указать несколько раз)")
+    parser.add_argument("-c", "--concurrency", type=int, default=WEBHOOK_SETUP_CONCURRENCY,
+                        help="сколько ботов регистрировать одновременно")
+    parser.add_argument("--drop-pending", action="store_true",
+                        help="сбросить накопившиеся апдейты (drop_pending_updates)")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    try:
+        async with AsyncSessionLocal() as db:
+            targets = await load_webhook_targets(db, args.company_ids)
+        print(f"🤖 Ботов к регистрации: {len(targets)}")
+
+        def on_result(result, done, total):
+            status = "OK  " if result.ok else "FAIL"
+            print(f"[{done}/{total}] {status} bot={result.bot_id} company={result.company_id} "
+                  f"{result.elapsed_ms}ms {result.description}")
+
+        report = await register_webhooks(
+            get_http_client("telegram"),
+            targets,
+            concurrency=args.concurrency,
+            drop_pending_updates=args.drop_pending,
+            on_result=on_result,
+        )
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    finally:
+        await close_http_clients()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s: %(message)s")
+    asyncio.run(main())
@@ -1,6 +1,13 @@
 import pytest
 import os
 import sys
+import tempfile
 
 sys.path.insert(0, '/root/bizdna-new')
 os.environ["PYTHONPATH"] = "/root/bizdna-new"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Тестам достаточно SQLite во временном файле; реальная БД из окружения не трогается
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'bizdna_tests.db')}")
+# Распознавание речи — встроенный fake backend, без запросов к OpenAI
+os.environ.setdefault("STT_BACKEND", "fake")
@@ -0,0 +1,23 @@
+from fastapi.testclient import TestClient
+from app.db.session import engine
+from app.main import app
+from app.models.all_models import Base, CompanyBot
+from app.services.bot_registry import get_bot_route, get_routes_stats, refresh_bot_route
+
+
+def test_inactive_route_is_counted_but_not_served():
+    before = get_routes_stats()
+    refresh_bot_route(CompanyBot(company_id=9301, telegram_bot_token="9301:active", webhook_secret="s", is_active=True))
+    refresh_bot_route(CompanyBot(company_id=9302, telegram_bot_token="9302:inactive", webhook_secret="s", is_active=False))
+
+    assert get_bot_route("9301:active").company_id == 9301
+    assert get_bot_route("9302:inactive") is None
+    assert get_routes_stats() == {"total": before["total"] + 2, "active": before["active"] + 1}
+
+
+def test_bot_routes_stats_endpoint():
+    Base.metadata.create_all(engine)
+    with TestClient(app) as client:
+        response = client.get("/api/stats/bot-routes")
+    assert response.status_code == 200
+    assert set(response.json()["routes"]) == {"total", "active"}
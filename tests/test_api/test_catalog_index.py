@@ -0,0 +1,49 @@
+import asyncio
+from app.db.session import engine, SessionLocal
+from app.models.all_models import Base, Product
+from app.services import catalog_index
+from app.services.catalog_index import get_catalog
+
+COMPANY_ID = 9101
+
+
+def setup_function():
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        db.query(Product).filter(Product.company_id == COMPANY_ID).delete()
+        db.commit()
+    catalog_index.invalidate_catalog(COMPANY_ID)
+
+
+def add_products(*names: str) -> None:
+    with SessionLocal() as db:
+        db.add_all(Product(company_id=COMPANY_ID, name=name, pricing={"price": 100}) for name in names)
+        db.commit()
+
+
+def test_appended_products_are_added_to_loaded_index():
+    add_products("Ноутбук Lenovo", "Мышь Logitech")
+
+    async def scenario():
+        catalog = await get_catalog(COMPANY_ID)
+        assert len(catalog) == 2
+        add_products("Ноутбук ASUS")
+        await catalog_index._on_products_changed({"company_id": COMPANY_ID, "appended": True})
+        # Индекс тот же объект — дочитан, а не перестроен
+        assert await get_catalog(COMPANY_ID) is catalog
+        return [item.name for item in catalog.search("ноутбук")]
+
+    assert sorted(asyncio.run(scenario())) == ["Ноутбук ASUS", "Ноутбук Lenovo"]
+
+
+def test_other_product_changes_reload_index():
+    add_products("Ноутбук Lenovo")
+
+    async def scenario():
+        catalog = await get_catalog(COMPANY_ID)
+        await catalog_index._on_products_changed({"company_id": COMPANY_ID})
+        return catalog, await get_catalog(COMPANY_ID)
+
+    before, after = asyncio.run(scenario())
+    assert before is not after
+    assert len(after) == 1
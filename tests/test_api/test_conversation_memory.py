@@ -0,0 +1,47 @@
+from app.services import conversation_memory
+from app.services.conversation_memory import build_messages, count_tokens
+
+
+def memory_with_turns(count: int) -> dict:
+    turns = []
+    for i in range(count):
+        for role, text in (("user", f"вопрос номер {i} про доставку"), ("assistant", f"ответ номер {i} про доставку")):
+            turns.append({"role": role, "content": text, "tokens": count_tokens(text)})
+    return {"summary": ["- спрашивал про гарантию"], "summary_tokens": 10, "turns": turns}
+
+
+def prompt_tokens(messages: list) -> int:
+    return sum(count_tokens(message["content"]) for message in messages)
+
+
+def test_context_is_trimmed_before_history(monkeypatch):
+    monkeypatch.setattr(conversation_memory, "MEMORY_PROMPT_MAX_TOKENS", 400)
+    monkeypatch.setattr(conversation_memory, "MEMORY_CONTEXT_MAX_TOKENS", 150)
+    knowledge = [f"Факт {i}: " + "доставка по городу бесплатно " * 5 for i in range(20)]
+    products = [f"Ноутбук {i} — 50000 руб." for i in range(10)]
+
+    messages, has_history = build_messages("Ты – консультант.", memory_with_turns(10), "сколько стоит доставка?",
+                                           [("Информация компании:", knowledge), ("Товары:", products)])
+
+    system = messages[0]["content"]
+    assert "Факт 0" in system and "Факт 19" not in system
+    assert has_history
+    assert prompt_tokens(messages) <= 400
+
+
+def test_over_budget_system_prompt_drops_context_and_history(monkeypatch):
+    monkeypatch.setattr(conversation_memory, "MEMORY_PROMPT_MAX_TOKENS", 50)
+    system = "Ты – консультант компании. " * 30
+    assert count_tokens(system) > 50
+
+    messages, has_history = build_messages(system, memory_with_turns(3), "а доставка?", [("Товары:", ["Ноутбук — 50000 руб."])])
+
+    # Остаток бюджета не уходит в минус: ни контекста, ни сводки, ни истории
+    assert messages == [{"role": "system", "content": system}, {"role": "user", "content": "а доставка?"}]
+    assert not has_history
+
+
+def test_empty_context_sections_are_not_rendered():
+    messages, _ = build_messages("Ты – консультант.", {"summary": [], "summary_tokens": 0, "turns": []}, "привет",
+                                 [("Информация компании:", []), ("Товары:", ["Мышь — 900 руб."])])
+    assert messages[0]["content"] == "Ты – консультант.\n\nТовары:\n- Мышь — 900 руб."
@@ -0,0 +1,59 @@
+import asyncio
+import httpx
+from app.services.http_clients import InstrumentedTransport
+
+
+async def serve_keepalive(reader, writer):
+    try:
+        while True:
+            await reader.readuntil(b"\r\n\r\n")
+            await asyncio.sleep(0.1)
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+            await writer.drain()
+    except Exception:
+        writer.close()
+
+
+def test_pool_stats_count_connections_and_requests():
+    async def scenario():
+        server = await asyncio.start_server(serve_keepalive, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        limits = httpx.Limits(max_connections=2, max_keepalive_connections=2)
+        transport = InstrumentedTransport(httpx.AsyncHTTPTransport(limits=limits), max_connections=2)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", transport=transport) as client:
+            requests = [asyncio.create_task(client.get("/")) for _ in range(3)]
+            await asyncio.sleep(0.05)
+            busy = transport.get_stats()
+            await asyncio.gather(*requests)
+            idle = transport.get_stats()
+        server.close()
+        return busy, idle
+
+    busy, idle = asyncio.run(scenario())
+    # Третий запрос ждёт соединение: в полёте 3, соединений занято 2
+    assert busy["requests_in_flight"] == 3
+    assert busy["connections"] == {"open": 2, "idle": 0, "in_use": 2, "available": 0}
+    assert idle["requests_in_flight"] == 0
+    assert idle["connections"]["idle"] == 2
+    assert idle["requests_total"] == 3
+
+
+def test_pool_timeout_is_counted_and_request_released():
+    async def handler(request):
+        raise httpx.PoolTimeout("pool")
+
+    transport = InstrumentedTransport(httpx.MockTransport(handler), max_connections=1)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=transport) as client:
+            try:
+                await client.get("http://example.invalid/")
+            except httpx.PoolTimeout:
+                pass
+
+    asyncio.run(scenario())
+    stats = transport.get_stats()
+    assert stats["pool_timeouts"] == 1
+    assert stats["requests_in_flight"] == 0
+    # У MockTransport нет пула httpcore — статистика соединений недоступна, но не падает
+    assert stats["connections"] is None
@@ -0,0 +1,128 @@
+import asyncio
+import threading
+from app.services.invalidation_bus import InvalidationBus, InMemoryInvalidationBackend
+
+
+class FailingBackend:
+    async def start(self, on_message, on_reconnect):
+        raise ConnectionError("нет соединения")
+
+    async def publish(self, message):
+        raise AssertionError("backend не запущен")
+
+    async def stop(self):
+        raise AssertionError("backend не запущен")
+
+
+def two_replicas():
+    backend = InMemoryInvalidationBackend()
+    return InvalidationBus(backend), InvalidationBus(backend)
+
+
+def test_other_replica_receives_publish_but_sender_does_not():
+    sender, receiver = two_replicas()
+    sent, received = [], []
+    sender.subscribe("company", sent.append)
+    receiver.subscribe("company", received.append)
+
+    async def scenario():
+        await sender.start()
+        await receiver.start()
+        await sender.publish("company", company_id=5)
+        await asyncio.sleep(0.01)
+        await sender.stop()
+        await receiver.stop()
+
+    asyncio.run(scenario())
+    assert received == [{"company_id": 5}]
+    assert sent == []
+    assert receiver.get_stats()["received"] == 1
+
+
+def test_publish_sync_from_thread_runs_handlers_on_bus_loop():
+    sender, receiver = two_replicas()
+    handled = []
+
+    async def handler(payload):
+        handled.append((payload, asyncio.get_running_loop(), threading.current_thread()))
+
+    receiver.subscribe("company_bot", handler)
+
+    async def scenario():
+        await sender.start()
+        await receiver.start()
+        # Как эндпоинт FastAPI в пуле потоков
+        await asyncio.to_thread(sender.publish_sync, "company_bot", company_id=7)
+        await asyncio.sleep(0.01)
+        loop = asyncio.get_running_loop()
+        await sender.stop()
+        await receiver.stop()
+        return loop
+
+    loop = asyncio.run(scenario())
+    assert [(payload, handler_loop) for payload, handler_loop, _ in handled] == [({"company_id": 7}, loop)]
+    assert handled[0][2] is threading.main_thread()
+
+
+def test_publish_sync_from_loop_keeps_task_until_done():
+    sender, receiver = two_replicas()
+    received = []
+
+    async def handler(payload):
+        await asyncio.sleep(0.01)
+        received.append(payload)
+
+    receiver.subscribe("prompts", handler)
+
+    async def scenario():
+        await sender.start()
+        await receiver.start()
+        sender.publish_sync("prompts", company_id=3)
+        await asyncio.sleep(0.05)
+        stats = receiver.get_stats()
+        await sender.stop()
+        await receiver.stop()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert received == [{"company_id": 3}]
+    assert stats["pending"] == 0
+
+
+def test_reconnect_flushes_every_subscribed_topic():
+    bus = InvalidationBus(InMemoryInvalidationBackend())
+    calls = []
+    bus.subscribe("company", lambda payload: calls.append(("company", payload)))
+    bus.subscribe("products", lambda payload: calls.append(("products", payload)))
+
+    async def scenario():
+        await bus.start()
+        bus._on_reconnect()
+        await asyncio.sleep(0.01)
+        await bus.stop()
+
+    asyncio.run(scenario())
+    assert sorted(calls) == [("company", None), ("products", None)]
+
+
+def test_failed_backend_start_does_not_break_publishing():
+    bus = InvalidationBus(FailingBackend())
+
+    async def scenario():
+        await bus.start()
+        await bus.publish("company", company_id=1)
+        await asyncio.to_thread(bus.publish_sync, "company", company_id=1)
+        await bus.stop()
+
+    asyncio.run(scenario())
+    stats = bus.get_stats()
+    assert stats["started"] is False
+    assert stats["errors"] == 1
+    assert stats["published"] == 2
+
+
+def test_publish_sync_without_started_bus_is_noop():
+    bus = InvalidationBus(InMemoryInvalidationBackend())
+    bus.subscribe("company", lambda payload: (_ for _ in ()).throw(AssertionError("обработчик не нужен")))
+    bus.publish_sync("company", company_id=1)
+    assert bus.get_stats()["published"] == 0
@@ -0,0 +1,105 @@
+import os
+import threading
+import numpy as np
+from app.db.session import engine, SessionLocal
+from app.models.all_models import Base, Product
+from app.services.retrieval import ingest
+from app.services.retrieval.chunking import chunk_text, extract_text
+from app.services.retrieval.embedders import HashingEmbedder
+from app.services.retrieval.ingest import build_company_index
+from app.services.retrieval.store import CompanyVectorStore, META_FILE, company_dir
+
+COMPANY_ID = 9201
+
+
+def test_chunk_text_respects_limit_and_overlap():
+    sentences = [f"Предложение номер {i} про доставку и оплату." for i in range(40)]
+    chunks = chunk_text(" ".join(sentences), max_chars=200, overlap=40)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    # Хвост предыдущего куска повторяется в начале следующего
+    for prev, nxt in zip(chunks, chunks[1:]):
+        assert nxt.startswith(prev[-40:].strip())
+    assert "Предложение номер 39" in chunks[-1]
+
+
+def test_chunk_text_keeps_short_paragraphs_and_cuts_long_sentences():
+    assert chunk_text("Первый абзац.\n\nВторой абзац.", max_chars=800) == ["Первый абзац. Второй абзац."]
+    assert chunk_text("  \n\n  ") == []
+
+    chunks = chunk_text("а" * 450, max_chars=200, overlap=0)
+    assert [len(chunk) for chunk in chunks] == [200, 200, 50]
+
+
+def test_extract_text_walks_nested_json():
+    value = {"title": "Прайс", "items": [{"name": "Ноутбук"}, None, 42], "empty": ""}
+    assert extract_text(value) == "Прайс\n\nНоутбук\n\n42"
+    assert extract_text(None) == ""
+
+
+def test_hashing_embedder_is_deterministic_and_normalized():
+    embedder = HashingEmbedder(dim=64)
+    vectors = embedder.embed(["Ноутбук Lenovo", "ноутбук lenovo", ""])
+
+    assert vectors.shape == (3, 64)
+    assert vectors.dtype == np.float32
+    assert np.allclose(vectors[0], vectors[1])
+    assert np.isclose(np.linalg.norm(vectors[0]), 1.0)
+    assert not vectors[2].any()
+    assert np.array_equal(HashingEmbedder(dim=64).embed(["Ноутбук Lenovo"])[0], vectors[0])
+
+
+def test_hashing_embedder_ranks_similar_text_higher():
+    embedder = HashingEmbedder()
+    query, close, far = embedder.embed(["доставка по Москве", "Доставка курьером по Москве", "гарантия на ноутбуки"])
+    assert float(query @ close) > float(query @ far)
+
+
+def test_concurrent_saves_leave_consistent_index(tmp_path):
+    path = str(tmp_path / "company")
+    embedder = HashingEmbedder(dim=16)
+    errors = []
+
+    def save(n: int) -> None:
+        try:
+            vectors = embedder.embed([f"текст {n}"])
+            sources = {f"document:{n}": {"fingerprint": str(n), "rows": [0, 1]}}
+            CompanyVectorStore.save(path, embedder.name, sources, [{"source": f"document:{n}", "text": f"текст {n}"}], vectors)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    # Временные файлы у каждой записи свои и после os.replace не остаются
+    assert not [name for name in os.listdir(path) if name.endswith(".tmp")]
+    store = CompanyVectorStore.load(path)
+    assert len(store.meta["chunks"]) == 1
+    assert os.path.exists(os.path.join(path, store.meta["vectors_file"]))
+    assert os.path.exists(os.path.join(path, META_FILE))
+
+
+def test_build_in_spawned_pool_then_reuse_unchanged_sources(tmp_path, monkeypatch):
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        db.query(Product).filter(Product.company_id == COMPANY_ID).delete()
+        db.add_all(Product(company_id=COMPANY_ID, name=f"Товар {i}", description=f"Описание товара {i}") for i in range(12))
+        db.commit()
+    # Несколько пачек, чтобы сборка пошла через пул процессов
+    monkeypatch.setattr(ingest, "RETRIEVAL_TASK_SOURCES", 5)
+    embedder = HashingEmbedder(dim=32)
+
+    with SessionLocal() as db:
+        first = build_company_index(db, COMPANY_ID, embedder, workers=2, base_dir=str(tmp_path))
+        second = build_company_index(db, COMPANY_ID, embedder, workers=2, base_dir=str(tmp_path))
+
+    assert first["sources"] == 12 and first["embedded"] == 12
+    assert second["reused"] == 12 and second["embedded"] == 0
+    store = CompanyVectorStore.load(company_dir(COMPANY_ID, str(tmp_path)))
+    query = embedder.embed(["Товар 7"])[0]
+    assert store.search(query, k=1, min_score=0.0)[0].text.startswith("Товар 7 ")
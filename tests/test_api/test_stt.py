@@ -0,0 +1,68 @@
+import asyncio
+import pytest
+from app.services.stt import (
+    FakeTranscriptionBackend,
+    TranscriptionBusyError,
+    TranscriptionPool,
+    TranscriptionTimeoutError,
+)
+
+
+def test_fake_backend_is_deterministic():
+    backend = FakeTranscriptionBackend()
+
+    result = asyncio.run(backend.transcribe(b"\x00" * 10, "voice.ogg", "kk"))
+    assert (result.text, result.language) == ("transcribed 10 bytes", "kk")
+    result = asyncio.run(FakeTranscriptionBackend(text="привет").transcribe(b"", "voice.ogg"))
+    assert (result.text, result.language) == ("привет", "unknown")
+    assert backend.calls == 1
+
+
+def test_pool_limits_concurrency():
+    backend = FakeTranscriptionBackend(delay=0.05)
+    pool = TranscriptionPool(backend, max_concurrency=2, max_queue=10, queue_timeout=1, timeout=1)
+    peak = 0
+
+    async def scenario():
+        nonlocal peak
+
+        async def watch():
+            nonlocal peak
+            while True:
+                peak = max(peak, pool.get_stats()["active"])
+                await asyncio.sleep(0.005)
+
+        watcher = asyncio.create_task(watch())
+        results = await asyncio.gather(*(pool.transcribe(b"\x00" * n) for n in range(1, 6)))
+        watcher.cancel()
+        return results
+
+    results = asyncio.run(scenario())
+    assert [result.text for result in results] == [f"transcribed {n} bytes" for n in range(1, 6)]
+    assert peak == 2
+    stats = pool.get_stats()
+    assert stats["completed"] == 5 and stats["active"] == 0 and stats["waiting"] == 0
+
+
+def test_pool_rejects_when_queue_is_full():
+    pool = TranscriptionPool(FakeTranscriptionBackend(delay=0.2), max_concurrency=1, max_queue=1, queue_timeout=1, timeout=1)
+
+    async def scenario():
+        first = asyncio.create_task(pool.transcribe(b"x"))
+        await asyncio.sleep(0.05)
+        # Слот занят первым запросом: второй ждёт в очереди, третьему места нет
+        rest = await asyncio.gather(pool.transcribe(b"x"), pool.transcribe(b"x"), return_exceptions=True)
+        return [await first] + rest
+
+    results = asyncio.run(scenario())
+    assert sum(isinstance(result, TranscriptionBusyError) for result in results) == 1
+    assert pool.rejected == 1 and pool.completed == 2
+
+
+def test_pool_times_out_slow_backend():
+    pool = TranscriptionPool(FakeTranscriptionBackend(delay=0.5), max_concurrency=1, timeout=0.05)
+
+    with pytest.raises(TranscriptionTimeoutError):
+        asyncio.run(pool.transcribe(b"x"))
+    assert pool.timed_out == 1
+    assert pool.get_stats()["active"] == 0
@@ -0,0 +1,55 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.db.session import engine
+from app.models.all_models import Base
+from app.main import app, transcription_pool
+from app.services.stt import STT_MAX_UPLOAD_BYTES
+
+
+@pytest.fixture(scope="module")
+def client():
+    Base.metadata.create_all(engine)
+    with TestClient(app) as client:
+        yield client
+
+
+def test_transcribe_with_fake_backend(client):
+    calls = transcription_pool.backend.calls
+    response = client.post(
+        "/api/stt/transcribe",
+        files={"audio_file": ("voice.ogg", b"\x00" * 2048, "audio/ogg")},
+        data={"language": "ru"},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"success": True, "text": "transcribed 2048 bytes", "language": "ru"}
+    assert transcription_pool.backend.calls == calls + 1
+
+
+def test_upload_over_limit_is_rejected(client):
+    response = client.post(
+        "/api/stt/transcribe",
+        files={"audio_file": ("voice.ogg", b"\x00" * (STT_MAX_UPLOAD_BYTES + 1), "audio/ogg")},
+    )
+    assert response.status_code == 413
+
+
+def test_missing_content_type_is_400(client):
+    response = client.post("/api/stt/transcribe", content=b"raw audio")
+    assert response.status_code == 400
+
+
+def test_multipart_without_boundary_is_400(client):
+    response = client.post(
+        "/api/stt/transcribe", content=b"raw audio", headers={"Content-Type": "multipart/form-data"}
+    )
+    assert response.status_code == 400
+
+
+def test_non_multipart_is_415(client):
+    response = client.post("/api/stt/transcribe", json={"audio_file": "..."})
+    assert response.status_code == 415
+
+
+def test_missing_audio_file_is_422(client):
+    response = client.post("/api/stt/transcribe", data={"language": "ru"}, files={"other": ("x.txt", b"x")})
+    assert response.status_code == 422
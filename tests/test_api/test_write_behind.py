@@ -0,0 +1,67 @@
+import asyncio
+from sqlalchemy import Column, Integer, String, select, func
+from sqlalchemy.orm import declarative_base
+from app.db.session import engine, SessionLocal
+from app.services.write_behind import WriteBehindBuffer
+
+Base = declarative_base()
+
+
+class WriteBehindRow(Base):
+    __tablename__ = "test_write_behind_rows"
+    id = Column(Integer, primary_key=True)
+    text = Column(String, nullable=False)
+
+
+def setup_function():
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+
+def _count() -> int:
+    with SessionLocal() as db:
+        return db.execute(select(func.count()).select_from(WriteBehindRow)).scalar()
+
+
+def test_stop_right_after_put_writes_all_rows():
+    async def scenario():
+        buffer = WriteBehindBuffer(batch_size=100, flush_interval=60)
+        for i in range(8):
+            await buffer.put(WriteBehindRow, {"text": f"row {i}"})
+        # Фоновая задача ещё ни разу не запускалась
+        await buffer.stop()
+        return buffer.get_stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["buffered"] == 0
+    assert stats["written"] == 8
+    assert _count() == 8
+
+
+def test_full_batch_is_flushed_without_stop():
+    async def scenario():
+        buffer = WriteBehindBuffer(batch_size=5, flush_interval=60)
+        for i in range(5):
+            await buffer.put(WriteBehindRow, {"text": f"row {i}"})
+        await asyncio.sleep(0.2)
+        written = buffer.written
+        await buffer.stop()
+        return written
+
+    assert asyncio.run(scenario()) == 5
+    assert _count() == 5
+
+
+def test_bad_row_does_not_drop_batch():
+    async def scenario():
+        buffer = WriteBehindBuffer(batch_size=100, flush_interval=60)
+        await buffer.put(WriteBehindRow, {"text": "ok"})
+        await buffer.put(WriteBehindRow, {"text": None})
+        await buffer.put(WriteBehindRow, {"text": "ok too"})
+        await buffer.stop()
+        return buffer.get_stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["written"] == 2
+    assert stats["failed"] == 1
+    assert _count() == 2
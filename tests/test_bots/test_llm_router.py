@@ -0,0 +1,110 @@
+import asyncio
+import time
+import uuid
+import pytest
+from common import llm_router
+from common.circuit_breaker import CircuitOpenError
+from common.llm_router import FakeLLMClient, LLMEndpoint, LLMRouter
+
+
+@pytest.fixture(autouse=True)
+def short_hedge_delay(monkeypatch):
+    # Без замеров задержка хеджирования — верхняя граница; в тестах она короткая
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_MIN_DELAY", 0.01)
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_MAX_DELAY", 0.1)
+
+
+def endpoint(name: str, **fake) -> LLMEndpoint:
+    # Предохранители глобальные по имени — у каждого теста свои endpoint
+    return LLMEndpoint(f"{name}-{uuid.uuid4().hex[:8]}", FakeLLMClient(**fake), "fake-model", "fake")
+
+
+def complete(router: LLMRouter) -> str:
+    return asyncio.run(router.complete([{"role": "user", "content": "ping"}]))
+
+
+def test_hedge_wins_over_slow_primary():
+    slow = endpoint("slow", latency=2.0, text="медленно")
+    fast = endpoint("fast", latency=0.01, text="быстро")
+    router = LLMRouter([slow, fast])
+
+    started = time.monotonic()
+    assert complete(router) == "быстро"
+    assert time.monotonic() - started < 1.0
+    assert slow.stats.hedges == 1
+    assert fast.stats.hedge_wins == 1
+    # Проигравший отменён, но его задержка учтена как цензурированный замер
+    assert slow.client.cancelled == 1
+    assert slow.stats.censored == 1
+    assert slow.stats.errors == 0
+
+
+def test_single_endpoint_is_not_hedged():
+    only = endpoint("only", latency=0.3)
+    router = LLMRouter([only])
+
+    assert complete(router) == "Тестовый ответ модели."
+    assert only.client.calls == 1
+    assert only.stats.hedges == 0
+
+
+def test_failed_primary_fails_over_to_backup():
+    broken = endpoint("broken", latency=0.01, error_rate=1.0)
+    backup = endpoint("backup", latency=0.01, text="запасной")
+    router = LLMRouter([broken, backup])
+
+    assert complete(router) == "запасной"
+    assert broken.stats.errors == 1
+    assert broken.stats.hedges == 1
+    assert broken.breaker.consecutive_failures == 1
+
+
+def test_no_hedge_to_backup_with_open_breaker():
+    slow = endpoint("slow", latency=0.3, text="основной")
+    backup = endpoint("backup", latency=0.01)
+    backup.breaker._trip()
+    router = LLMRouter([slow, backup])
+
+    assert complete(router) == "основной"
+    assert backup.client.calls == 0
+    assert slow.stats.hedges == 0
+
+
+def test_all_breakers_open_rejects_without_calls():
+    first = endpoint("first", latency=0.01)
+    second = endpoint("second", latency=0.01)
+    first.breaker._trip()
+    second.breaker._trip()
+    router = LLMRouter([first, second])
+
+    with pytest.raises(CircuitOpenError):
+        complete(router)
+    assert first.client.calls == 0
+    assert second.client.calls == 0
+
+
+def test_stream_failure_is_recorded_once_and_trips_breaker():
+    flaky = endpoint("flaky", latency=0.01, text="раз два три четыре", stream_error_after=2)
+    router = LLMRouter([flaky])
+    seen = []
+
+    async def on_text(text: str) -> None:
+        seen.append(text)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(router.stream([{"role": "user", "content": "ping"}], on_text=on_text))
+    assert seen == ["раз", "раз два"]
+    assert flaky.stats.calls == 1
+    assert flaky.stats.errors == 1
+    assert flaky.breaker.consecutive_failures == 1
+
+
+def test_stream_success_records_first_chunk_latency():
+    ok = endpoint("ok", latency=0.05, text="раз два")
+    router = LLMRouter([ok])
+
+    text = asyncio.run(router.stream([{"role": "user", "content": "ping"}]))
+    assert text == "раз два"
+    assert ok.stats.calls == 1
+    assert ok.stats.errors == 0
+    assert ok.stats.percentile(0.5, min_samples=1) >= 0.05